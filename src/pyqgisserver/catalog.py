@@ -0,0 +1,399 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Catalog of the projects stored in the projects directory
+
+    Project metadata (title, crs, extent, layers) are extracted from
+    the project files without Qgis and stored in a sqlite database:
+    the catalog is served by the front-end without involving workers.
+
+    The index is updated incrementally from file change events, and
+    the projects directory is fully scanned at regular interval for
+    file systems that do not notify changes.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import traceback
+import xml.etree.ElementTree as ET
+import zipfile
+
+from contextlib import closing
+from pathlib import Path
+from typing import (
+    IO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .config import confservice
+from .qgscache.watcher import InotifyWatcher
+
+LOGGER = logging.getLogger('SRVLOG')
+
+PROJECT_SFX = ('.qgs', '.qgz')
+
+# Delay for aggregating change events before updating the index
+UPDATE_DELAY = 1.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    title TEXT,
+    crs TEXT,
+    extent TEXT,
+    layers TEXT
+)
+"""
+
+
+def _text(elem: Optional[ET.Element]) -> Optional[str]:
+    return elem.text if elem is not None and elem.text else None
+
+
+def _extent(elem: Optional[ET.Element]) -> Optional[List[float]]:
+    if elem is None:
+        return None
+    try:
+        return [float(_text(elem.find(t)) or '') for t in ('xmin', 'ymin', 'xmax', 'ymax')]
+    except ValueError:
+        return None
+
+
+def _parse_project(fp: IO[bytes]) -> Dict:
+    """ Parse project xml
+
+        Layers elements are released once parsed in
+        order to keep the memory low with large projects.
+    """
+    metadata: Dict = dict(title=None, crs=None, extent=None, layers=[])
+    service_title = None
+    stack: List[str] = []
+    for event, elem in ET.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            if not stack:
+                service_title = elem.get('projectname')
+            stack.append(elem.tag)
+            continue
+        stack.pop()
+        if elem.tag == 'maplayer' and stack[-1:] == ['projectlayers']:
+            metadata['layers'].append(dict(
+                id=_text(elem.find('id')),
+                name=_text(elem.find('layername')),
+                type=elem.get('type'),
+                crs=_text(elem.find('srs/spatialrefsys/authid')),
+            ))
+            elem.clear()
+        elif elem.tag == 'title' and len(stack) == 1:
+            metadata['title'] = _text(elem)
+        elif elem.tag == 'projectCrs' and len(stack) == 1:
+            metadata['crs'] = _text(elem.find('spatialrefsys/authid'))
+        elif elem.tag == 'mapcanvas' and len(stack) == 1 and metadata['extent'] is None:
+            metadata['extent'] = _extent(elem.find('extent'))
+        elif elem.tag == 'WMSExtent' and stack[-1:] == ['properties']:
+            # Advertised extent takes precedence
+            values = [_text(v) for v in elem.findall('value')]
+            try:
+                metadata['extent'] = [float(v or '') for v in values]
+            except ValueError:
+                pass
+        elif elem.tag == 'WMSServiceTitle' and stack[-1:] == ['properties']:
+            service_title = _text(elem) or service_title
+        elif len(stack) == 1:
+            # Release top level elements
+            elem.clear()
+    metadata['title'] = metadata['title'] or service_title or None
+    return metadata
+
+
+def read_project_metadata(path: Path) -> Dict:
+    """ Read metadata from project file
+    """
+    if path.suffix == '.qgz':
+        with zipfile.ZipFile(path) as archive:
+            name = next((n for n in archive.namelist() if n.endswith('.qgs')), None)
+            if name is None:
+                raise ValueError(f"No project in archive {path}")
+            with archive.open(name) as fp:
+                return _parse_project(fp)
+    with path.open('rb') as fp:
+        return _parse_project(fp)
+
+
+class CatalogIndex:
+    """ Sqlite index of project metadata
+    """
+
+    def __init__(self, database: Path, rootdir: Path):
+        self._database = str(database)
+        self._rootdir = Path(rootdir)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._database, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def project_name(self, path: Path) -> str:
+        """ Return the project name as used in the MAP parameter
+        """
+        return str(path.relative_to(self._rootdir).with_suffix(''))
+
+    def scan(self) -> Iterable[Path]:
+        """ Return the project files in the projects directory
+        """
+        for dirpath, dirnames, filenames in os.walk(self._rootdir):
+            # Skip hidden directories
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if name.endswith(PROJECT_SFX):
+                    yield Path(dirpath, name)
+
+    def _update(self, conn: sqlite3.Connection, path: Path) -> bool:
+        """ Update the index entry for the project file
+
+            Return True if the entry has changed.
+        """
+        name = self.project_name(path)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            if conn.execute("DELETE FROM projects WHERE path = ?", (str(path),)).rowcount == 0:
+                return False
+            # Index a project with the same name
+            for sibling in (path.with_suffix(sfx) for sfx in PROJECT_SFX):
+                if sibling != path and sibling.exists():
+                    self._update(conn, sibling)
+            return True
+
+        row = conn.execute("SELECT path, mtime, size FROM projects WHERE name = ?", (name,)).fetchone()
+        if row and row['path'] == str(path) and row['mtime'] == st.st_mtime and row['size'] == st.st_size:
+            return False
+        if row and row['path'] != str(path) and Path(row['path']).exists() \
+                and PROJECT_SFX.index(Path(row['path']).suffix) < PROJECT_SFX.index(path.suffix):
+            # Same precedence as the file protocol handler
+            return False
+
+        try:
+            metadata = read_project_metadata(path)
+        except (ET.ParseError, ValueError, zipfile.BadZipFile, OSError) as err:
+            LOGGER.error("Catalog: cannot read project %s: %s", path, err)
+            return False
+
+        conn.execute(
+            "INSERT OR REPLACE INTO projects (name, path, mtime, size, title, crs, extent, layers)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                name,
+                str(path),
+                st.st_mtime,
+                st.st_size,
+                metadata['title'],
+                metadata['crs'],
+                json.dumps(metadata['extent']),
+                json.dumps(metadata['layers']),
+            ),
+        )
+        return True
+
+    def update(self, paths: Optional[Iterable[Path]] = None) -> int:
+        """ Update the index
+
+            If paths is None, the projects directory is fully scanned
+            and entries of removed projects are deleted.
+
+            Return the number of changed entries.
+        """
+        changed = 0
+        with closing(self._connect()) as conn:
+            if paths is None:
+                paths = list(self.scan())
+                found = {str(p) for p in paths}
+                for row in conn.execute("SELECT path FROM projects").fetchall():
+                    if row['path'] not in found:
+                        conn.execute("DELETE FROM projects WHERE path = ?", (row['path'],))
+                        changed += 1
+            for path in paths:
+                changed += self._update(conn, path)
+                # Do not lock the database for too long
+                conn.commit()
+        return changed
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict:
+        return dict(
+            name=row['name'],
+            title=row['title'],
+            crs=row['crs'],
+            extent=json.loads(row['extent']),
+            layers=json.loads(row['layers']),
+            last_modified=row['mtime'],
+        )
+
+    def count(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT count(*) FROM projects").fetchone()[0]
+
+    def projects(self, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """ Return the catalog entries ordered by name
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM projects ORDER BY name LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def project(self, name: str) -> Optional[Dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM projects WHERE name = ?", (name,)).fetchone()
+        return self._to_dict(row) if row else None
+
+
+def catalog_database() -> Path:
+    database = confservice.get('catalog', 'database')
+    return Path(database or os.path.join(tempfile.gettempdir(), 'qgssrv-catalog.sqlite'))
+
+
+class Indexer:
+    """ Maintain the catalog index
+    """
+
+    def __init__(self, index: CatalogIndex, rootdir: Path, refresh_interval: int):
+        self._index = index
+        self._rootdir = Path(rootdir)
+        self._refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Future] = None
+        self._watcher: Optional[InotifyWatcher] = None
+        self._changed: Set[Path] = set()
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        LOGGER.info("Starting catalog indexer for %s", self._rootdir)
+        try:
+            self._watcher = InotifyWatcher()
+        except OSError as err:
+            LOGGER.warning("Catalog: changes are not watched: %s", err)
+        else:
+            asyncio.get_running_loop().add_reader(self._watcher.fileno(), self._read_events)
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watcher:
+            asyncio.get_running_loop().remove_reader(self._watcher.fileno())
+            self._watcher.close()
+            self._watcher = None
+
+    def _watch(self, files: Iterable[Path], directories: Iterable[str]):
+        """ Watch the project files
+        """
+        for directory in directories:
+            self._watcher.watch_directory(directory)
+        for path in files:
+            if path.exists() and not self._watcher.is_watched(str(path)):
+                self._watcher.watch(str(path), path)
+
+    def _read_events(self):
+        changed = {Path(key) for key in self._watcher.read_events()}
+        for directory, stem in self._watcher.pop_created():
+            candidate = Path(directory, stem)
+            if candidate.is_dir():
+                # Scan new directory
+                changed.add(candidate)
+            else:
+                changed.update(candidate.with_suffix(sfx) for sfx in PROJECT_SFX)
+        if changed:
+            self._changed.update(changed)
+            self._wakeup.set()
+
+    def _update(self, changed: Optional[Set[Path]]) -> Tuple[int, List[Path], List[str]]:
+        """ Update the index
+
+            Return the number of changed entries, the project
+            files and the directories to watch.
+        """
+        if changed is None:
+            roots = [self._rootdir]
+            paths = None
+        else:
+            roots = [p for p in changed if p.is_dir()]
+            paths = [p for p in changed if p not in roots]
+
+        directories = []
+        for root in roots:
+            for dirpath, dirnames, _ in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                directories.append(dirpath)
+
+        if paths is not None:
+            for directory in directories:
+                paths.extend(
+                    Path(directory, n) for n in os.listdir(directory) if n.endswith(PROJECT_SFX)
+                )
+            files = paths
+        else:
+            files = list(self._index.scan())
+
+        count = self._index.update(paths)
+        return count, files, directories
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_scan = 0.
+        while True:
+            try:
+                if loop.time() - last_scan >= self._refresh_interval:
+                    self._changed.clear()
+                    last_scan = loop.time()
+                    changed = None
+                else:
+                    changed, self._changed = self._changed, set()
+                count, files, directories = await loop.run_in_executor(None, self._update, changed)
+                if self._watcher:
+                    self._watch(files, directories)
+                if count:
+                    LOGGER.info("Catalog: updated %s projects", count)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                LOGGER.error("Catalog: index update failed\n%s", traceback.format_exc())
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._refresh_interval)
+                # Aggregate events
+                await asyncio.sleep(UPDATE_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+def start_catalog_indexer() -> Indexer:
+    cnf = confservice['catalog']
+    rootdir = confservice.get('projects.cache', 'rootdir')
+    indexer = Indexer(
+        CatalogIndex(catalog_database(), rootdir),
+        rootdir,
+        cnf.getint('refresh_interval'),
+    )
+    indexer.start()
+    return indexer
+
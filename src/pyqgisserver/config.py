@@ -26,6 +26,7 @@ import os
 from typing_extensions import (
     TYPE_CHECKING,
     Callable,
+    Dict,
     Iterator,
     Literal,
     Tuple,
@@ -73,6 +74,8 @@ def load_configuration():
     CONFIG.set('server', 'interfaces', getenv('QGSRV_SERVER_INTERFACES', '0.0.0.0'))
     CONFIG.set('server', 'workers', getenv('QGSRV_SERVER_WORKERS', '2'))
     CONFIG.set('server', 'timeout', getenv('QGSRV_SERVER_TIMEOUT', '20'))
+    CONFIG.set('server', 'timeout_grace_period', getenv('QGSRV_SERVER_TIMEOUT_GRACE_PERIOD', '5'))
+    CONFIG.set('server', 'request_deadline', getenv('QGSRV_SERVER_REQUEST_DEADLINE', ''))
     CONFIG.set('server', 'enable_filters', getenv('QGSRV_SERVER_ENABLE_FILTERS', 'no'))
     CONFIG.set('server', 'http_proxy', getenv('QGSRV_SERVER_HTTP_PROXY', 'no'))
     CONFIG.set('server', 'proxy_url', getenv('QGSRV_SERVER_PROXY_URL', ''))
@@ -85,6 +88,25 @@ def load_configuration():
     CONFIG.set('server', 'allow_headers', getenv('QGSRV_SERVER_ALLOW_HEADERS', 'X-Qgis-,X-Lizmap-'))
     CONFIG.set('server', 'memory_high_water_mark',
                getenv('QGSRV_SERVER_MEMORY_HIGH_WATER_MARK', '0.9'))
+    CONFIG.set('server', 'prefork', getenv('QGSRV_SERVER_PREFORK', 'no'))
+    CONFIG.set('server', 'spare_workers', getenv('QGSRV_SERVER_SPARE_WORKERS', '0'))
+    CONFIG.set('server', 'isolated_requests', getenv('QGSRV_SERVER_ISOLATED_REQUESTS', ''))
+    CONFIG.set('server', 'max_requests', getenv('QGSRV_SERVER_MAX_REQUESTS', '0'))
+    CONFIG.set('server', 'max_rss_growth', getenv('QGSRV_SERVER_MAX_RSS_GROWTH', '0'))
+    CONFIG.set('server', 'max_age', getenv('QGSRV_SERVER_MAX_AGE', '0'))
+    CONFIG.set('server', 'restart_batch_size', getenv('QGSRV_SERVER_RESTART_BATCH_SIZE', '1'))
+    CONFIG.set('server', 'restart_warmup', getenv('QGSRV_SERVER_RESTART_WARMUP', 'no'))
+    CONFIG.set('server', 'restart_timeout', getenv('QGSRV_SERVER_RESTART_TIMEOUT', '120'))
+    CONFIG.set('server', 'autoscale', getenv('QGSRV_SERVER_AUTOSCALE', 'no'))
+    CONFIG.set('server', 'min_workers', getenv('QGSRV_SERVER_MIN_WORKERS', '1'))
+    CONFIG.set('server', 'max_workers', getenv('QGSRV_SERVER_MAX_WORKERS', '8'))
+    CONFIG.set('server', 'autoscale_interval', getenv('QGSRV_SERVER_AUTOSCALE_INTERVAL', '5'))
+    CONFIG.set('server', 'autoscale_cooldown', getenv('QGSRV_SERVER_AUTOSCALE_COOLDOWN', '60'))
+    CONFIG.set('server', 'autoscale_up_threshold', getenv('QGSRV_SERVER_AUTOSCALE_UP_THRESHOLD', '0.8'))
+    CONFIG.set('server', 'autoscale_down_threshold', getenv('QGSRV_SERVER_AUTOSCALE_DOWN_THRESHOLD', '0.3'))
+    CONFIG.set('server', 'autoscale_max_wait', getenv('QGSRV_SERVER_AUTOSCALE_MAX_WAIT', '0.5'))
+    CONFIG.set('server', 'autoscale_min_memory', getenv('QGSRV_SERVER_AUTOSCALE_MIN_MEMORY', '0.1'))
+    CONFIG.set('server', 'autoscale_max_cpu', getenv('QGSRV_SERVER_AUTOSCALE_MAX_CPU', '0.9'))
     CONFIG.set('server', 'getfeaturelimit', getenv('QGSRV_SERVER_GETFEATURELIMIT', '-1'))
     CONFIG.set('server', 'pluginpath',
                getenv2('QGSRV_SERVER_PLUGINPATH', 'QGIS_PLUGINPATH', ''))
@@ -126,9 +148,25 @@ def load_configuration():
     #
     CONFIG.add_section('projects.cache')
     CONFIG.set('projects.cache', 'size', getenv('QGSRV_CACHE_SIZE', '10'))
+    CONFIG.set('projects.cache', 'max_weight', getenv('QGSRV_CACHE_MAX_WEIGHT', '0'))
+    CONFIG.set('projects.cache', 'eviction_policy', getenv('QGSRV_CACHE_EVICTION_POLICY', 'lru'))
+    CONFIG.set('projects.cache', 'trace_file', getenv('QGSRV_CACHE_TRACE_FILE', ''))
+    CONFIG.set('projects.cache', 'idle_ttl', getenv('QGSRV_CACHE_IDLE_TTL', '0'))
+    CONFIG.set('projects.cache', 'watch_mode', getenv('QGSRV_CACHE_WATCH_MODE', 'auto'))
+    CONFIG.set('projects.cache', 'refresh_budget', getenv('QGSRV_CACHE_REFRESH_BUDGET', '100'))
+    CONFIG.set('projects.cache', 'max_staleness', getenv('QGSRV_CACHE_MAX_STALENESS', '60'))
+    CONFIG.set('projects.cache', 'negative_ttl', getenv('QGSRV_CACHE_NEGATIVE_TTL', '10'))
+    CONFIG.set('projects.cache', 'negative_size', getenv('QGSRV_CACHE_NEGATIVE_SIZE', '1000'))
     CONFIG.set('projects.cache', 'rootdir', getenv('QGSRV_CACHE_ROOTDIR', ''))
     CONFIG.set('projects.cache', 'strict_check', getenv('QGSRV_CACHE_STRICT_CHECK', 'yes'))
     CONFIG.set('projects.cache', 'insecure', getenv('QGSRV_CACHE_INSECURE', 'no'))
+    CONFIG.set('projects.cache', 'postgres_pool_size', getenv('QGSRV_CACHE_POSTGRES_POOL_SIZE', '2'))
+    CONFIG.set('projects.cache', 'postgres_connect_timeout', getenv('QGSRV_CACHE_POSTGRES_CONNECT_TIMEOUT', '5'))
+    CONFIG.set('projects.cache', 'postgres_statement_timeout',
+               getenv('QGSRV_CACHE_POSTGRES_STATEMENT_TIMEOUT', '5000'))
+    CONFIG.set('projects.cache', 'postgres_notify_dsn', getenv('QGSRV_CACHE_POSTGRES_NOTIFY_DSN', ''))
+    CONFIG.set('projects.cache', 'postgres_notify_channel',
+               getenv('QGSRV_CACHE_POSTGRES_NOTIFY_CHANNEL', 'qgis_projects'))
     CONFIG.set('projects.cache', 'preload_config', getenv('QGSRV_CACHE_PRELOAD_CONFIG', ''))
     # Use same variable name as Qgis server options
     CONFIG.set('projects.cache', 'trust_layer_metadata',
@@ -141,6 +179,14 @@ def load_configuration():
     CONFIG.set('projects.cache', 'allow_storage_schemes', getenv('QGSRV_CACHE_ALLOW_STORAGE_SCHEMES', '*'))
     CONFIG.set('projects.cache', 'check_interval', getenv('QGSRV_CACHE_CHECK_INTERVAL', '0'))
     CONFIG.set('projects.cache', 'observers', getenv('QGSRV_CACHE_OBSERVERS', ''))
+    CONFIG.set('projects.cache', 'broadcast_updates', getenv('QGSRV_CACHE_BROADCAST_UPDATES', 'yes'))
+    CONFIG.set('projects.cache', 'hotset_file', getenv('QGSRV_CACHE_HOTSET_FILE', ''))
+    CONFIG.set('projects.cache', 'hotset_size', getenv('QGSRV_CACHE_HOTSET_SIZE', '10'))
+    CONFIG.set('projects.cache', 'hotset_interval', getenv('QGSRV_CACHE_HOTSET_INTERVAL', '300'))
+    CONFIG.set('projects.cache', 'mirror_dir', getenv('QGSRV_CACHE_MIRROR_DIR', ''))
+    CONFIG.set('projects.cache', 'mirror_max_size', getenv('QGSRV_CACHE_MIRROR_MAX_SIZE', '2048'))
+    CONFIG.set('projects.cache', 'content_check', getenv('QGSRV_CACHE_CONTENT_CHECK', 'no'))
+    CONFIG.set('projects.cache', 'lazy_layers', getenv('QGSRV_CACHE_LAZY_LAYERS', 'no'))
     CONFIG.set('projects.cache', 'advanced_report', getenv('QGSRV_CACHE_ADVANCED_REPORT', 'no'))
 
     # Map read/create options
@@ -191,6 +237,15 @@ def load_configuration():
     CONFIG.set('management', 'ssl_cert', getenv('QGSRV_MANAGEMENT_SSL_CERT', ''))
     CONFIG.set('management', 'port', getenv('QGSRV_MANAGEMENT_PORT', '19876'))
 
+    #
+    # Project catalog
+    #
+    CONFIG.add_section('catalog')
+    CONFIG.set('catalog', 'enabled', getenv('QGSRV_CATALOG_ENABLED', 'no'))
+    CONFIG.set('catalog', 'endpoint', getenv('QGSRV_CATALOG_ENDPOINT', '/projects'))
+    CONFIG.set('catalog', 'database', getenv('QGSRV_CATALOG_DATABASE', ''))
+    CONFIG.set('catalog', 'refresh_interval', getenv('QGSRV_CATALOG_REFRESH_INTERVAL', '300'))
+
     #
     # Metadata
     #
@@ -212,12 +267,23 @@ def read_config_file(cfgfile):
     LOGGER.info('Configuration file <%s> loaded', cfgfile)
 
 
-def config_to_dict():
+def config_to_dict(raw: bool = False) -> Dict[str, Dict[str, str]]:
     """ Convert actual configuration to dictionary
+
+        :param raw: Return sections with values not interpolated,
+            suitable for `read_config_dict`
     """
+    if raw:
+        return {s: dict(CONFIG.items(s, raw=True)) for s in CONFIG.sections()}
     return {s: dict(p.items()) for s, p in CONFIG.items()}
 
 
+def read_config_dict(config: Dict[str, Dict[str, str]]):
+    """ Read configuration from dictionary
+    """
+    CONFIG.read_dict(config)
+
+
 def validate_config_path(confname, confid, optional=False):
     """ Validate directory path
     """
@@ -262,6 +328,23 @@ def qgis_api_endpoints(enabled_only: bool = True) -> Iterator[Tuple[str, str]]:
     return items
 
 
+def request_deadline() -> float:
+    """ Return the deadline for cancelling requests in workers
+    """
+    cfg = CONFIG['server']
+    timeout = cfg.getint('timeout')
+    if not cfg.get('request_deadline').strip():
+        return 0.8 * timeout
+    deadline = cfg.getfloat('request_deadline')
+    if deadline >= timeout > 0:
+        LOGGER.warning(
+            "Request deadline (%ss) is not lower than the timeout (%ss): "
+            "timeout errors from workers will not be returned to clients",
+            deadline, timeout,
+        )
+    return deadline
+
+
 #
 # Published services
 #
@@ -3,6 +3,7 @@ from .basehandler import (  # noqa F401
     ErrorHandler,
     NotFoundHandler,
 )
+from .cataloghandler import CatalogHandler  # noqa F401
 from .landingpage import LandingPage  # noqa F401
 from .oapihandler import OAPIHandler  # noqa F401
 from .owshandler import OwsHandler  # noqa F401
@@ -0,0 +1,88 @@
+#
+# Copyright 2025 3liz
+# Author: David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Serve the project catalog from the catalog index
+"""
+import logging
+
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+from ..catalog import CatalogIndex
+from .basehandler import BaseHandler, HTTPError
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Max number of projects returned
+MAX_LIMIT = 1000
+
+
+class CatalogHandler(BaseHandler):
+
+    def initialize(self, index: CatalogIndex, endpoint: str):
+        super().initialize()
+        self._index = index
+        self._endpoint = endpoint.rstrip('/')
+
+    def _link(self, path: str, rel: str, title: str, **params) -> Dict[str, str]:
+        req = self.request
+        href = f"{req.protocol}://{req.host}{path}"
+        if params:
+            href = f"{href}?{urlencode(params)}"
+        return {'href': href, 'rel': rel, 'title': title, 'type': 'application/json'}
+
+    def _project(self, project: Dict) -> Dict:
+        name = project['name']
+        project.update(links=[
+            self._link(f"{self._endpoint}/{name}", 'self', 'Project metadata'),
+            self._link(
+                "/ows/",
+                'service',
+                'WMS capabilities',
+                MAP=name,
+                SERVICE='WMS',
+                REQUEST='GetCapabilities',
+            ),
+        ])
+        return project
+
+    def get(self, name: Optional[str] = None):
+        """ Return the list of projects or the project metadata
+        """
+        name = (name or '').strip('/')
+        if name:
+            project = self._index.project(name)
+            if project is None:
+                raise HTTPError(404, reason=f"Project '{name}' not found")
+            self.write_json(self._project(project))
+            return
+
+        try:
+            limit = min(int(self.get_argument('limit', '100')), MAX_LIMIT)
+            offset = int(self.get_argument('offset', '0'))
+        except ValueError:
+            raise HTTPError(400, reason="Invalid limit or offset")
+        if limit < 0 or offset < 0:
+            raise HTTPError(400, reason="Invalid limit or offset")
+
+        projects = [self._project(p) for p in self._index.projects(limit, offset)]
+        matched = self._index.count()
+
+        links = [self._link(self._endpoint, 'self', 'Projects', limit=limit, offset=offset)]
+        if offset + limit < matched:
+            links.append(self._link(self._endpoint, 'next', 'Next page', limit=limit, offset=offset + limit))
+        if offset > 0:
+            prev_offset = max(offset - limit, 0)
+            links.append(self._link(self._endpoint, 'prev', 'Previous page', limit=limit, offset=prev_offset))
+
+        self.write_json(dict(
+            projects=projects,
+            numberMatched=matched,
+            numberReturned=len(projects),
+            links=links,
+        ))
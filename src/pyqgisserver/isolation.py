@@ -0,0 +1,215 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Run heavy requests in isolated subprocesses
+
+    Requests matching the isolation rules are handled in a short-lived
+    child forked from the worker: the memory allocated for processing
+    the request is released with the child and the worker state
+    (i.e the project cache) survives a crash of the child.
+
+    Rules are defined as a comma separated list of `SERVICE:REQUEST[>SIZE]`
+    items, where SIZE is compared to the estimated size of the
+    request: i.e the number of pixels (WIDTH x HEIGHT) or the number
+    of features (COUNT or MAXFEATURES). Requests for which the size
+    cannot be estimated always match.
+"""
+import logging
+import os
+import select
+import signal
+import struct
+import traceback
+
+from typing import (
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from .zeromq.worker import RequestHandler
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Frame header: data length and status code
+_FRAME = struct.Struct('!IH')
+
+# End of response marker
+_END = 0xFFFFFFFF
+
+# Delay for checking cancellation
+_POLL_DELAY = 0.5
+
+
+class IsolationRule(NamedTuple):
+    service: str
+    request: str
+    min_size: int = 0
+
+
+def parse_rules(rules: str) -> List[IsolationRule]:
+    """ Parse isolation rules
+    """
+    def _parse(item: str) -> IsolationRule:
+        item, _, size = item.partition('>')
+        service, sep, request = item.partition(':')
+        if not sep or not service.strip() or not request.strip():
+            raise ValueError(f"Invalid isolation rule: '{item}'")
+        return IsolationRule(
+            service.strip().upper(),
+            request.strip().upper(),
+            int(size) if size.strip() else 0,
+        )
+
+    return [_parse(item) for item in rules.split(',') if item.strip()]
+
+
+def estimate_size(parameter: Callable[[str], str]) -> Optional[int]:
+    """ Estimate the size of the request from its parameters
+
+        :param parameter: Return the value of the request parameter
+            or an empty string.
+    """
+    width, height = parameter('WIDTH'), parameter('HEIGHT')
+    if width.isdigit() and height.isdigit():
+        return int(width) * int(height)
+    for name in ('COUNT', 'MAXFEATURES'):
+        value = parameter(name)
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def match_rules(rules: Sequence[IsolationRule], parameter: Callable[[str], str]) -> bool:
+    """ Return True if the request match one of the rules
+    """
+    service = parameter('SERVICE').upper()
+    request = parameter('REQUEST').upper()
+    for rule in rules:
+        if rule.service == service and rule.request == request:
+            if rule.min_size <= 0:
+                return True
+            size = estimate_size(parameter)
+            if size is None or size > rule.min_size:
+                return True
+    return False
+
+
+def _read_exact(fd: int, size: int, cancelled: Callable[[], bool]) -> Optional[bytes]:
+    """ Read `size` bytes from the pipe
+
+        Return None if cancelled while waiting for data,
+        less data if the child exited.
+    """
+    chunks = []
+    while size > 0:
+        ready, _, _ = select.select([fd], [], [], _POLL_DELAY)
+        if cancelled():
+            return None
+        if not ready:
+            continue
+        chunk = os.read(fd, size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _run_child(handler: RequestHandler, target: Callable[[], None], fd: int):
+    """ Run the target in the child process
+
+        Replies are sent as frames to the parent instead
+        of the handler socket.
+    """
+    status = 0
+    try:
+        with os.fdopen(fd, 'wb', buffering=0) as pipe:
+
+            def _write(data: bytes):
+                pipe.write(_FRAME.pack(len(data), handler.status_code))
+                pipe.write(data)
+
+            handler._write = _write  # type: ignore [method-assign]
+            try:
+                target()
+            except Exception:
+                LOGGER.error("Isolated request error:\n%s", traceback.format_exc())
+                status = 1
+            else:
+                pipe.write(_FRAME.pack(_END, handler.status_code))
+    except BaseException:
+        status = 1
+    finally:
+        # Do not run any cleanup inherited from the parent
+        os._exit(status)
+
+
+def run_isolated(handler: RequestHandler, target: Callable[[], None], cancelled: Callable[[], bool]) -> bool:
+    """ Run target in a forked child and relay the response
+        through the handler socket
+
+        The child is killed if the request is cancelled: the pipe
+        is polled so that a stalled child cannot block the worker.
+
+        Threads are not inherited by the child, the caller must make
+        sure that no pending jobs are left in thread pools.
+
+        Return True if the response has been completed.
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        _run_child(handler, target, wfd)
+
+    os.close(wfd)
+    LOGGER.debug("Running isolated request %s in process %s", handler.msgid, pid)
+
+    completed = False
+    try:
+        while True:
+            header = _read_exact(rfd, _FRAME.size, cancelled)
+            if header is None:
+                break
+            if len(header) < _FRAME.size:
+                # Child exited
+                break
+            size, status_code = _FRAME.unpack(header)
+            if size == _END:
+                completed = True
+                break
+            data = _read_exact(rfd, size, cancelled)
+            if data is None or len(data) < size:
+                break
+            # Relay the frame as is
+            handler._write(data)
+            handler.header_written = True
+            handler.status_code = status_code
+    finally:
+        os.close(rfd)
+        if not completed:
+            if cancelled():
+                LOGGER.error("Killing isolated request process %s", pid)
+            # Make sure that a stalled child does not block the worker
+            os.kill(pid, signal.SIGKILL)
+        _, exitstatus = os.waitpid(pid, 0)
+
+    if not completed and not cancelled():
+        LOGGER.error("Isolated request process %s failed (status %s)", pid, exitstatus)
+        if not handler.header_written:
+            handler.status_code = 500
+            handler.headers = {}
+            handler.send(b"Internal server error")
+        elif handler.status_code == 206:
+            # Terminate the chunked response
+            handler.send(b'', False)
+
+    return completed
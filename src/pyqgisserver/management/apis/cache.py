@@ -40,8 +40,9 @@ class CacheCollection(RequestHandler):
 
         cache = get_cacheservice()
         project, _ = cache.lookup(key, refresh=False)
+        details = cache.peek(key)
 
-        self.write(get_project_summary(key, project))
+        self.write(get_project_summary(key, project, weight=details.weight if details else 0))
 
 
 def register(serverIface):
@@ -80,7 +80,15 @@ class _ReportHandler(_PoolHandler):
         for w in reports:
             for entry in w['cache']:
                 entry.update(link=_get_cache_link(entry['key'], req))
-        self.write_json({'workers': reports, 'num_workers': self._poolserver.num_workers})
+        self.write_json({
+            'workers': reports,
+            'num_workers': self._poolserver.num_workers,
+            'num_cancelled': sum(w.get('cancelled', 0) for w in reports),
+            'num_killed': self._poolserver.num_kills,
+            'respawn': self._poolserver.respawn_stats(),
+            'autoscale': self._poolserver.autoscale_report(),
+            'restart': self._poolserver.restart_report(),
+        })
 
 
 class _RootHandler(BaseHandler):
@@ -115,6 +123,43 @@ class _RootHandler(BaseHandler):
 
 class _CacheHandler(QgisHandler):
 
+    def initialize(self, poolserver: Optional[WorkerPoolServer] = None, **kwargs):  # type: ignore [override]
+        super().initialize(**kwargs)
+        self._poolserver = poolserver
+
+    async def post(self, key: Optional[str] = None):
+        """ Preload project in all workers
+        """
+        await self._run_command(b'PRELOAD', key)
+
+    async def delete(self, key: Optional[str] = None):  # type: ignore [override]
+        """ Evict project from all workers
+        """
+        await self._run_command(b'EVICT', key)
+
+    async def _run_command(self, command: bytes, key: Optional[str]):
+        """ Broadcast cache command and return the results
+            of each worker
+        """
+        if not key:
+            key = self.get_argument('MAP', default=None)
+
+        if not key:
+            self.send_error(400, reason="Missing project specification")
+            return
+
+        if not self._poolserver:
+            self.send_error(503, reason="No worker pool")
+            return
+
+        results = await self._poolserver.cache_command(command, key)
+        self.write_json({
+            'key': key,
+            'command': command.decode().lower(),
+            'num_workers': self._poolserver.num_workers,
+            'workers': results,
+        })
+
     async def get(self, key: Optional[str] = None):
         """ Return project cache info
         """
@@ -163,8 +208,8 @@ def configure_handlers(
         (r"/status/?.*", StatusHandler),
         (r"/pool/(restart)", _RestartHandler, {'poolserver': poolserver}),
         (r"/pool/?", _ReportHandler, {'poolserver': poolserver}),
-        (r"/cache/content/(?P<key>.+)", _CacheHandler, kwargs),
-        (r"/cache/?", _CacheHandler, kwargs),
+        (r"/cache/content/(?P<key>.+)", _CacheHandler, dict(poolserver=poolserver, **kwargs)),
+        (r"/cache/?", _CacheHandler, dict(poolserver=poolserver, **kwargs)),
         # Forward to Qgis api handlers
         (r"/.+", QgisHandler, kwargs),
     ]
@@ -10,20 +10,23 @@
 """
 
 import logging
+import os
+import time
 import traceback
 import urllib.parse
 
-from collections import OrderedDict
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
 from typing import (
     Callable,
     Dict,
-    Generator,
+    List,
     NamedTuple,
     Optional,
     Sequence,
+    Set,
     Tuple,
 )
 from urllib.parse import parse_qs, urljoin, urlparse, urlunparse
@@ -42,11 +45,16 @@ from qgis.server import QgsServerProjectUtils
 from pyqgisservercontrib.core import componentmanager
 
 from ..config import confservice
+from ..utils import stats
+from ..utils.gdsf import gdsfcache
 from ..utils.lru import lrucache
 
 # Import default handlers for auto-registration
+from . import lazylayers
 from .handlers import ProtocolHandler
+from .hotset import top_keys
 from .types import UpdateState
+from .watcher import InotifyWatcher
 
 LOGGER = logging.getLogger('SRVLOG')
 
@@ -65,13 +73,51 @@ class UnreadableResourceError(Exception):
     pass
 
 
+class _Resolved(NamedTuple):
+    url: Optional[urllib.parse.ParseResult]
+    store: Optional[ProtocolHandler]
+    # Resolution error
+    error: Optional[PathNotAllowedError] = None
+
+
+class _NegativeEntry(NamedTuple):
+    error: type
+    args: tuple
+    expires: float
+    # Watched (directory, stem) of the missing file
+    path: Optional[Tuple[str, str]]
+
+
 class CacheDetails(NamedTuple):
     project: QgsProject
     timestamp: datetime
+    # Estimated memory cost in bytes
+    weight: int = 0
+    # Loading time in seconds
+    load_time: float = 0.
+    # Fingerprint of the content when loaded
+    fingerprint: Optional[str] = None
 
 
 CACHE_MANAGER_CONTRACTID = '@3liz.org/cache-manager;1'
 
+# Max number of memoized key resolutions
+RESOLVED_CACHE_SIZE = 1000
+
+# Errors kept in the negative cache
+NEGATIVE_ERRORS = (FileNotFoundError, PathNotAllowedError, UnreadableResourceError)
+
+# Fallback weight per layer when the memory
+# cost of a project cannot be measured
+DEFAULT_LAYER_WEIGHT = 1024 * 1024
+
+# Project variable for declaring the project weight in MB
+WEIGHT_PROJECT_VARIABLE = 'qgsrv_cache_weight'
+
+
+def _rss() -> int:
+    return stats.stats().get('mem_usage', 0)
+
 
 def _merge_qs(query1: str, query2: str) -> str:
     """ Merge query1 with query2 but coerce values
@@ -151,9 +197,72 @@ class QgsCacheManager:
         cnf = confservice['projects.cache']
 
         size = cnf.getint('size')
+        max_weight = cnf.getint('max_weight') * 1024 * 1024
 
         self._create_project = QgsProject
-        self._lru_cache = lrucache(size)
+
+        eviction_policy = cnf.get('eviction_policy')
+        if eviction_policy == 'gdsf':
+            self._lru_cache = gdsfcache(
+                size,
+                max_weight=max_weight,
+                weigher=self._lru_weight,
+                coster=lambda d: d.load_time,
+            )
+        elif eviction_policy == 'lru':
+            self._lru_cache = lrucache(size, max_weight=max_weight, weigher=self._lru_weight)
+        else:
+            raise ValueError(f"Invalid cache eviction policy '{eviction_policy}'")
+
+        # Expire entries not accessed since idle_ttl seconds
+        self._idle_ttl = cnf.getint('idle_ttl')
+        self._last_access: Dict[str, float] = {}
+
+        # Incremental refresh
+        self._max_staleness = cnf.getint('max_staleness')
+        self._validation_queue: deque = deque()
+        self._pending: Dict[str, float] = {}
+        self._prefetched: Dict[str, datetime] = {}
+        # Entries for which changes are notified
+        self._notified: Set[str] = set()
+        self._notifications = False
+
+        # Memoized key resolutions: the configuration does not change
+        # during the lifetime of the worker, keys are resolved again
+        # when the entry is evicted
+        self._resolved: lrucache[str, _Resolved] = lrucache(RESOLVED_CACHE_SIZE)
+        self._storage_handler: Optional[QgisStorageHandler] = None
+
+        # Canonical project keys: raw key -> canonical key
+        self._canonical: lrucache[str, str] = lrucache(RESOLVED_CACHE_SIZE)
+        # File identities: (device, inode) -> canonical key
+        self._inodes: lrucache[Tuple[int, int], str] = lrucache(RESOLVED_CACHE_SIZE)
+
+        # Negative cache
+        self._negative_ttl = cnf.getint('negative_ttl')
+        self._negative_cache: lrucache[str, _NegativeEntry] = lrucache(max(cnf.getint('negative_size'), 1))
+
+        # Watch project files for changes
+        watch_mode = cnf.get('watch_mode')
+        if watch_mode not in ('auto', 'poll'):
+            raise ValueError(f"Invalid cache watch mode '{watch_mode}'")
+        self._watch_enabled = watch_mode == 'auto'
+        self._watcher: Optional[InotifyWatcher] = None
+        self._watcher_pid = 0
+
+        # Record access trace
+        trace_file = cnf.get('trace_file')
+        self._trace = open(trace_file, 'a', buffering=1) if trace_file else None
+
+        # Hot set: access counts reported to the cache observer
+        self._count_accesses = bool(cnf.get('hotset_file'))
+        self._access_counts: Counter = Counter()
+
+        # Projects loaded in idle cycles: (key, cache type)
+        self._warmup_queue: deque = deque()
+        # Static entries not loaded yet
+        self._scheduled_static: Set[str] = set()
+
         self._static_cache = OrderedDict()
         self._strict_check = cnf.getboolean('strict_check')
         self._trust_layer_metadata = cnf.getboolean('trust_layer_metadata')
@@ -165,6 +274,16 @@ class QgsCacheManager:
 
         self._read_only_layers = cnf.getboolean('force_readonly_layers')
 
+        # Check the content of projects with a changed modification
+        # time, requires protocol handler support
+        self._content_check = cnf.getboolean('content_check')
+
+        # Resolve layers on demand
+        self._lazy_layers = cnf.getboolean('lazy_layers')
+        if self._lazy_layers and not lazylayers.is_supported():
+            LOGGER.warning("Lazy layers resolution is not supported by this Qgis version")
+            self._lazy_layers = False
+
         allowed_schemes = cnf.get('allow_storage_schemes')
         if allowed_schemes != '*':
             allowed_schemes = [s.strip() for s in allowed_schemes.split(',')]
@@ -190,6 +309,15 @@ class QgsCacheManager:
             "<<<<<",
         )
 
+    def enable_notifications(self):
+        """ Trust change notifications of protocol handlers
+
+            Entries for which changes are notified are not checked
+            anymore: this must be enabled only if notifications are
+            forwarded to the worker.
+        """
+        self._notifications = True
+
     def add_observer(self, observer: Callable[[str, datetime, int], None]):
         """ Add observer for cache invalidation
         """
@@ -227,6 +355,54 @@ class QgsCacheManager:
         elif cachetype == CacheType.STATIC:
             return self._static_cache.items()
 
+    def weight(self) -> int:
+        """ Return the estimated memory cost of the LRU cache
+        """
+        return self._lru_cache.weight()
+
+    def _lru_weight(self, details: CacheDetails) -> int:
+        """ Return the weight of LRU entry
+
+            Projects shared with the static cache
+            do not count in the LRU cache weight.
+        """
+        if any(details.project is d.project for d in self._static_cache.values()):
+            return 0
+        return details.weight
+
+    def estimate_weight(self, project: QgsProject, rss_delta: int) -> int:
+        """ Estimate the memory cost of a project
+
+            Use the declared weight if any, otherwise the resident
+            memory growth measured while loading the project or an
+            estimate from the number of layers.
+        """
+        declared = project.customVariables().get(WEIGHT_PROJECT_VARIABLE)
+        if declared:
+            try:
+                return int(float(declared) * 1024 * 1024)
+            except ValueError:
+                LOGGER.error("Invalid project weight '%s' for %s", declared, project.fileName())
+        if rss_delta > 0:
+            return rss_delta
+        return project.count() * DEFAULT_LAYER_WEIGHT
+
+    def update_weight(self, project: QgsProject, rss_delta: int):
+        """ Add the memory cost of layers resolved on demand
+            to the weight of the project entries
+
+            The declared weight of the project is kept.
+        """
+        if rss_delta <= 0 or project.customVariables().get(WEIGHT_PROJECT_VARIABLE):
+            return
+        for key, details in list(self._static_cache.items()):
+            if details.project is project:
+                self._static_cache[key] = details._replace(weight=details.weight + rss_delta)
+        for key, details in list(self._lru_cache.items()):
+            if details.project is project:
+                # Reinsert the entry for updating the cache weight
+                self._lru_cache[key] = details._replace(weight=details.weight + rss_delta)
+
     def resolve_alias(self, key: str) -> urllib.parse.ParseResult:
         """ Resolve scheme from configuration variables
         """
@@ -288,27 +464,343 @@ class QgsCacheManager:
             store = componentmanager.get_service('@3liz.org/cache/protocol-handler;1?scheme=%s' % scheme)
         except componentmanager.FactoryNotFoundError:
             # Fallback to Qgis storage handler
-            store = QgisStorageHandler()
+            if self._storage_handler is None:
+                self._storage_handler = QgisStorageHandler()
+            store = self._storage_handler
 
         return store
 
-    def refresh(self) -> Generator[Tuple[str, UpdateState], None, None]:
-        """ Refresh all entries
+    def resolve(self, key: str) -> Tuple[urllib.parse.ParseResult, ProtocolHandler]:
+        """ Return the resolved url and the protocol handler for the key
+
+            Resolutions depend only on the configuration and are memoized
+            for the lifetime of the worker.
+        """
+        resolved = self._resolved.peek(key)
+        if resolved is None:
+            try:
+                url = self.resolve_alias(key)
+                resolved = _Resolved(url, self.get_protocol_handler(key, url.scheme))
+            except PathNotAllowedError as err:
+                resolved = _Resolved(None, None, err)
+            self._resolved[key] = resolved
+        if resolved.error is not None:
+            raise PathNotAllowedError(*resolved.error.args)
+        return resolved.url, resolved.store
+
+    def _file_identity(self, path: str, canonical: str) -> str:
+        """ Return the canonical key of the first path seen
+            for the same file (i.e symbolic or hard links)
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return canonical
+        identity = (st.st_dev, st.st_ino)
+        known = self._inodes.peek(identity)
+        if known and known != canonical:
+            try:
+                # Inodes may be reused by new files
+                url, _ = self.resolve(known)
+                if os.path.samestat(os.stat(url.path), st):
+                    return known
+            except Exception:
+                pass
+        self._inodes[identity] = canonical
+        return canonical
+
+    def canonical_key(self, key: str) -> str:
+        """ Return the canonical key of the project
+
+            Different keys may reference the same project (i.e
+            `a/b`, `/a/b.qgs`, `file:a/b.qgz` or a `projects.schemes`
+            alias): cache entries are stored under the resolved url
+            of the project, as returned by the optional `canonical_url`
+            method of the protocol handler, and project files
+            are identified by their device and inode.
+
+            The key is returned unchanged if the project does not exists.
+        """
+        canonical = self._canonical.peek(key)
+        if canonical is not None:
+            return canonical
+
+        url, store = self.resolve(key)
+        canonical_url = getattr(store, 'canonical_url', None)
+        if canonical_url:
+            url = canonical_url(url)
+            if url is None:
+                # Do not memoize missing projects
+                return key
+        resolved = urlunparse(url)
+        if resolved not in self._resolved:
+            self._resolved[resolved] = _Resolved(url, store)
+        canonical = resolved
+        if url.scheme == 'file':
+            canonical = self._file_identity(url.path, resolved)
+
+        self._canonical[resolved] = canonical
+        self._canonical[key] = canonical
+        if canonical != key:
+            LOGGER.debug("Project key '%s' resolved to '%s'", key, canonical)
+        return canonical
+
+    def forget_key(self, canonical: str):
+        """ Forget the keys resolved to the canonical key
+
+            Keys will be resolved again at next lookup.
+        """
+        for key in [k for k, c in self._canonical.items() if c == canonical]:
+            del self._canonical[key]
 
-            keys are returned from most recently user to the last recently,
-            then we have to update in reverse for preserving order
+    def key_aliases(self, canonical: str) -> List[str]:
+        """ Return the keys resolved to the canonical key
         """
-        # Update static cache;
-        for key, _ in self.items(CacheType.STATIC):
-            self.update_static_entry(key)
+        return [k for k, c in self._canonical.items() if c == canonical and k != canonical]
 
-        # Update both caches
-        keys = reversed([k for k, _ in self.items(CacheType.LRU)])
-        return ((key, self.update_entry(key)) for key in keys)
+    def start_validation(self):
+        """ Start a new validation pass over all entries
+        """
+        keys = [k for k, _ in self.items(CacheType.STATIC)]
+        keys.extend(reversed([k for k, _ in self.items(CacheType.LRU)]))
+        self._validation_queue = deque(dict.fromkeys(keys))
+        self.prefetch_modified_times(self._validation_queue)
+
+    def prefetch_modified_times(self, keys: Sequence[str]):
+        """ Fetch the modified times of the entries in batch
+
+            Modified times are fetched with one call per protocol
+            handler supporting the optional `get_modified_times` method.
+        """
+        self._prefetched = {}
+        batches: Dict[int, Tuple[ProtocolHandler, List[Tuple[str, urllib.parse.ParseResult]]]] = {}
+        for key in keys:
+            try:
+                url, store = self.resolve(key)
+            except PathNotAllowedError:
+                continue
+            if hasattr(store, 'get_modified_times') and not self.is_clean(key):
+                batches.setdefault(id(store), (store, []))[1].append((key, url))
+
+        for store, items in batches.values():
+            try:
+                modified_times = store.get_modified_times([url for _, url in items])
+            except Exception as err:
+                LOGGER.warning("Failed to fetch modified times: %s", err)
+                continue
+            self._prefetched.update((key, modified_times[url]) for key, url in items if url in modified_times)
+
+    def is_stale(self, key: str) -> bool:
+        """ Check if the entry has changed in the storage
+        """
+        details = self.peek(key)
+        if details is None or self.is_clean(key):
+            return False
+        try:
+            modified_time = self._prefetched.pop(key, None)
+            if modified_time is None:
+                url, store = self.resolve(key)
+                modified_time = store.get_modified_time(url)
+            return modified_time > details.timestamp
+        except Exception as err:
+            # Let the reload handle the error
+            LOGGER.warning("Failed to check project '%s': %s", key, err)
+            return True
+
+    def validate(self, budget: float) -> int:
+        """ Validate entries of the current validation pass
+            until the time budget (in seconds) is exhausted
+
+            At least one entry is validated. Changed entries
+            are scheduled for reloading.
+
+            Return the number of validated entries.
+        """
+        deadline = time.time() + budget
+        count = 0
+        while self._validation_queue:
+            key = self._validation_queue.popleft()
+            if key not in self._pending and self.is_stale(key):
+                LOGGER.debug("Project '%s' scheduled for reloading", key)
+                self._pending[key] = time.time()
+            count += 1
+            if time.time() >= deadline:
+                break
+        return count
+
+    def is_pending(self, key: str) -> bool:
+        return key in self._pending
+
+    def reload_pending(self, budget: float) -> List[Tuple[str, Optional[UpdateState], CacheDetails]]:
+        """ Reload changed entries
+
+            Entries pending for more than `max_staleness` seconds are
+            always reloaded, other entries are reloaded until the
+            time budget (in seconds) is exhausted.
+
+            Return the reloaded entries with their details before reloading,
+            the update state is None for entries removed because the reload
+            failed.
+        """
+        if not self._pending:
+            return []
+
+        now = time.time()
+        deadline = now + budget
+        updated = []
+        for key, detected in sorted(self._pending.items(), key=lambda t: t[1]):
+            overdue = now - detected >= self._max_staleness
+            if not overdue and time.time() >= deadline:
+                continue
+            del self._pending[key]
+            details = self.peek(key)
+            if details is None:
+                # Evicted meanwhile
+                continue
+            try:
+                # Update both entries at once
+                static, lru = key in self._static_cache, key in self._lru_cache
+                static_update, lru_update = self._update_entries(key, static=static, lru=lru)
+                updated.append((key, lru_update if lru else static_update, details))
+            except Exception as err:
+                LOGGER.error("Failed to reload project '%s', removing from cache: %s", key, err)
+                self._static_cache.pop(key, None)
+                if key in self._lru_cache:
+                    del self._lru_cache[key]
+                updated.append((key, None, details))
+        return updated
+
+    def get_watcher(self) -> Optional[InotifyWatcher]:
+        """ Return the file watcher for the current process
+        """
+        if not self._watch_enabled:
+            return None
+        if self._watcher_pid != os.getpid():
+            # Watches are not shared with forked processes: entries
+            # will be watched again at their next update
+            self._watcher_pid = os.getpid()
+            try:
+                self._watcher = InotifyWatcher()
+            except OSError as err:
+                LOGGER.warning("Cannot watch project files (%s), using polling", err)
+                self._watch_enabled = False
+                self._watcher = None
+        return self._watcher
+
+    def _read_events(self, watcher: InotifyWatcher):
+        """ Read watcher events
+        """
+        for dirty in watcher.read_events():
+            LOGGER.debug("Project '%s' changed", dirty)
+        created = watcher.pop_created()
+        if created and len(self._negative_cache):
+            for key in [k for k, e in self._negative_cache.items() if e.path in created]:
+                LOGGER.debug("Project '%s' created", key)
+                del self._negative_cache[key]
+
+    def is_clean(self, key: str) -> bool:
+        """ Return True if the entry is watched and did not change
+            since the last update
+        """
+        if key in self._notified:
+            return True
+        watcher = self.get_watcher()
+        if not watcher:
+            return False
+        self._read_events(watcher)
+        return watcher.is_watched(key)
+
+    def check_negative(self, key: str):
+        """ Raise the error cached for the key if any
+        """
+        if self._negative_ttl <= 0:
+            return
+        watcher = self.get_watcher()
+        if watcher:
+            self._read_events(watcher)
+        entry = self._negative_cache.peek(key)
+        if entry:
+            if entry.expires > time.time():
+                raise entry.error(*entry.args)
+            del self._negative_cache[key]
+
+    def add_negative(self, key: str, error: Exception):
+        """ Cache the error for the key
+        """
+        if self._negative_ttl <= 0:
+            return
+        path = None
+        if isinstance(error, (FileNotFoundError, UnreadableResourceError)):
+            # Invalidate when the file is created
+            watcher = self.get_watcher()
+            try:
+                url, _ = self.resolve(key)
+                if watcher and (url.scheme or self._default_scheme) == 'file':
+                    missing = Path(os.path.realpath(url.path))
+                    if watcher.watch_directory(str(missing.parent)):
+                        path = (str(missing.parent), missing.stem)
+            except Exception:
+                pass
+        self._negative_cache[key] = _NegativeEntry(
+            type(error),
+            error.args,
+            time.time() + self._negative_ttl,
+            path,
+        )
+
+    def invalidate_key(self, key: str, modified_time: datetime) -> bool:
+        """ Mark the entry as stale if it is older than the modified time
+
+            The entry is scheduled for reloading without checking the storage.
+            Return True if the entry is stale.
+        """
+        key = self.canonical_key(key)
+        details = self.peek(key)
+        if details is None or details.timestamp.replace(microsecond=0) >= modified_time:
+            return False
+        LOGGER.debug("Project '%s' updated, scheduled for reloading", key)
+        self._notified.discard(key)
+        self._pending.setdefault(key, time.time())
+        return True
+
+    def invalidate_notified(self, payload: Dict):
+        """ Handle project change notification
+
+            Matching entries are scheduled for reloading and matching
+            negative entries are removed. Protocol handlers for which
+            changes are notified implement the `match_notification` method.
+        """
+        def _match(key: str) -> bool:
+            try:
+                url, store = self.resolve(key)
+            except PathNotAllowedError:
+                return False
+            match = getattr(store, 'match_notification', None)
+            return match is not None and match(url, payload)
+
+        # Forget about evicted entries
+        self._notified = {k for k in self._notified if self.peek(k)}
+
+        for key in [k for k in self._notified if _match(k)]:
+            LOGGER.debug("Project '%s' changed, scheduled for reloading", key)
+            self._notified.discard(key)
+            self._pending.setdefault(key, time.time())
+
+        for key in [k for k, _ in self._negative_cache.items() if _match(k)]:
+            del self._negative_cache[key]
+
+    def invalidate_negative(self, key: Optional[str] = None):
+        """ Remove the key or all keys from the negative cache
+        """
+        if key is None:
+            self._negative_cache.clear()
+        elif key in self._negative_cache:
+            del self._negative_cache[key]
 
     def peek(self, key: str, cachetype: Optional[CacheType] = None) -> CacheDetails:
         """ Return cache details
         """
+        key = self._canonical.peek(key) or key
         if cachetype == CacheType.LRU:
             return self._lru_cache.peek(key)
         elif cachetype == CacheType.STATIC:
@@ -335,9 +827,13 @@ class QgsCacheManager:
             last_modified = last_modified.toPyDateTime()
         else:
             # Get modified
-            url = self.resolve_alias(key)
-            store = self.get_protocol_handler(key, url.scheme)
-            last_modified = store.get_modified_time(url)
+            self.check_negative(key)
+            try:
+                url, store = self.resolve(key)
+                last_modified = store.get_modified_time(url)
+            except NEGATIVE_ERRORS as err:
+                self.add_negative(key, err)
+                raise
 
         return last_modified.replace(microsecond=0)
 
@@ -345,54 +841,132 @@ class QgsCacheManager:
         self,
         key: str,
         details: Optional[CacheDetails],
+        clean: bool = False,
     ) -> Tuple[CacheDetails, UpdateState]:
         """ Return updated project details
+
+            :param clean: True if the entry did not change since
+                the last update
         """
-        url = self.resolve_alias(key)
-        store = self.get_protocol_handler(key, url.scheme)
+        if details is not None and clean:
+            # No need to check the storage
+            return details, UpdateState.UNCHANGED
+
+        url, store = self.resolve(key)
 
+        # The fingerprint is computed before reading the project
+        fingerprint = details.fingerprint if details is not None else None
+        if self._content_check and hasattr(store, 'get_fingerprint'):
+            if details is None:
+                fingerprint = store.get_fingerprint(url)
+            else:
+                modified_time = store.get_modified_time(url)
+                if modified_time > details.timestamp:
+                    fingerprint = store.get_fingerprint(url)
+                    if fingerprint == details.fingerprint:
+                        # Keep the actual project
+                        LOGGER.info("Project '%s' modified at %s but content did not change", key, modified_time)
+                        self._track_changes(key, url, store, details.project)
+                        return details._replace(timestamp=modified_time), UpdateState.UNCHANGED
+
+        rss = _rss()
+        start = time.time()
         if details is not None:
-            project, timestamp = store.get_project(url, **details._asdict())
-            update = UpdateState.UPDATED if timestamp != details.timestamp else UpdateState.UNCHANGED
+            project, timestamp = store.get_project(url, project=details.project, timestamp=details.timestamp)
+            if timestamp != details.timestamp:
+                update = UpdateState.UPDATED
+                LOGGER.info("Project '%s' modified at %s", key, timestamp)
+            else:
+                update = UpdateState.UNCHANGED
         else:
             project, timestamp = store.get_project(url)
             update = UpdateState.INSERTED
 
-        return CacheDetails(project, timestamp), update
+        if details is not None and project is details.project:
+            weight = details.weight
+            load_time = details.load_time
+        else:
+            load_time = time.time() - start
+            weight = self.estimate_weight(project, _rss() - rss)
+            LOGGER.debug("Loaded project '%s' in %.3fs, estimated weight: %s bytes", key, load_time, weight)
+
+        self._track_changes(key, url, store, project)
+
+        return CacheDetails(project, timestamp, weight, load_time, fingerprint), update
+
+    def _track_changes(self, key: str, url: urllib.parse.ParseResult, store: ProtocolHandler, project: QgsProject):
+        """ Track changes of the loaded project
+        """
+        # Changes are notified
+        if self._notifications and getattr(store, 'notified', False):
+            self._notified.add(key)
+
+        # Watch local project files
+        if (url.scheme or self._default_scheme) == 'file' and self._watch_enabled:
+            watcher = self.get_watcher()
+            if watcher:
+                watcher.watch(key, Path(project.fileName()))
+
+    def _update_entries(self, key: str, static: bool, lru: bool) -> Tuple[UpdateState, UpdateState]:
+        """ Update the static and/or the LRU entries of the project
+
+            Cleanliness is tracked per key: both entries are updated from
+            a single check since updating one entry marks the key as clean.
+            Entries sharing the same project are updated once.
+
+            Return the static and the LRU update states.
+        """
+        self._pending.pop(key, None)
+        clean = self.is_clean(key)
+
+        updates: Dict[int, Tuple[CacheDetails, UpdateState]] = {}
+
+        def _update(details: Optional[CacheDetails]) -> Tuple[CacheDetails, UpdateState]:
+            if details is None:
+                return self._get_project_details(key, None)
+            if id(details.project) not in updates:
+                updates[id(details.project)] = self._get_project_details(key, details, clean)
+            return updates[id(details.project)]
+
+        static_update = lru_update = UpdateState.UNCHANGED
+
+        static_details = self._static_cache.get(key)
+        if static:
+            static_details, static_update = _update(static_details)
+            self._static_cache[key] = static_details
+
+        if lru:
+            details = self._lru_cache.peek(key)
+            if not details and static_details:
+                # LRU is updated with the static content
+                details, lru_update = static_details, UpdateState.INSERTED
+            else:
+                details, lru_update = _update(details)
+
+            self._lru_cache[key] = details
+
+            # Notify
+            if lru_update:
+                LOGGER.info("Updated project '%s' in cache", key)
+                self.notify_observers(key, details.timestamp, lru_update)
+
+        return static_update, lru_update
 
     def update_static_entry(self, key: str) -> UpdateState:
         """ Update static cache
+
+            The LRU entry of the project is updated as well.
         """
-        details, update = self._get_project_details(key, self._static_cache.get(key))
-        self._static_cache[key] = details
-        return update
+        key = self.canonical_key(key)
+        return self._update_entries(key, static=True, lru=key in self._lru_cache)[0]
 
     def update_entry(self, key: str) -> UpdateState:
         """ Update LRU entry
-        """
-        # Get details for the project
-        details = self._lru_cache.peek(key)
-
-        # Lookup in static cache
-        if not details and key in self._static_cache:
-            details = self._static_cache[key]
-            details, update = self._get_project_details(key, details)
-            if update == UpdateState.UPDATED:
-                # Update the static cache
-                self._static_cache[key] = details
-            # LRU is updated with new content
-            update = UpdateState.INSERTED
-        else:
-            details, update = self._get_project_details(key, details)
-
-        self._lru_cache[key] = details
 
-        # Notify
-        if update:
-            LOGGER.info("Updated project '%s' in cache", key)
-            self.notify_observers(key, details.timestamp, update)
-
-        return update
+            The static entry of the project is updated as well.
+        """
+        key = self.canonical_key(key)
+        return self._update_entries(key, static=key in self._static_cache, lru=True)[1]
 
     def lookup(self, key: str, refresh: bool = True) -> Tuple[QgsProject, UpdateState]:
         """ Lookup entry from key
@@ -400,20 +974,209 @@ class QgsCacheManager:
             If refresh is False, return actual cache
             content without refreshing/updating the entry.
         """
+        if key not in self._canonical:
+            # Fail early for missing projects
+            self.check_negative(key)
+        key = self.canonical_key(key)
+
+        if key in self._scheduled_static:
+            # Requested before being preloaded
+            self._scheduled_static.discard(key)
+            try:
+                self.update_static_entry(key)
+            except NEGATIVE_ERRORS as err:
+                self.add_negative(key, err)
+                self.forget_key(key)
+                raise
+
+        details = None
+        if not refresh and key in self._pending:
+            # Enforce the max staleness
+            if time.time() - self._pending[key] >= self._max_staleness:
+                del self._pending[key]
+                refresh = True
+
         if not refresh:
-            # Lookup LRU
-            details = self.peek(key, CacheType.LRU)
-            if details:
-                return details.project, UpdateState.UNCHANGED
-            # Update from static cache
-            details = self.peek(key, CacheType.STATIC)
-            if details:
-                self._lru_cache[key] = details
-                return details.project, UpdateState.UPDATED
-
-        # Not found in cache, update the actual entry
-        update = self.update_entry(key)
-        return self._lru_cache[key].project, update
+            # Lookup LRU, this will update the access order and frequency
+            if key in self._lru_cache:
+                details = self._lru_cache[key]
+                update = UpdateState.UNCHANGED
+            else:
+                # Update from static cache
+                details = self.peek(key, CacheType.STATIC)
+                if details:
+                    self._lru_cache[key] = details
+                    update = UpdateState.UPDATED
+
+        if not details:
+            # Not found in cache, update the actual entry
+            self.check_negative(key)
+            try:
+                update = self.update_entry(key)
+            except NEGATIVE_ERRORS as err:
+                self.add_negative(key, err)
+                self.forget_key(key)
+                raise
+            details = self._lru_cache[key]
+
+        self._last_access[key] = time.time()
+        if self._count_accesses:
+            self._access_counts[key] += 1
+        if self._trace:
+            self.record_access(key, details)
+        return details.project, update
+
+    def evict(self, key: str) -> Optional[CacheDetails]:
+        """ Remove the entry from both caches
+
+            Return the removed details or None if the
+            entry was not cached.
+        """
+        key = self.canonical_key(key)
+        details = self._static_cache.pop(key, None)
+        if key in self._lru_cache:
+            details = self._lru_cache.peek(key)
+            del self._lru_cache[key]
+        self._pending.pop(key, None)
+        self._notified.discard(key)
+        self._last_access.pop(key, None)
+        # Links may have been changed
+        self.forget_key(key)
+        return details
+
+    def expire_entries(self) -> List[Tuple[str, CacheDetails]]:
+        """ Remove LRU entries not accessed since `idle_ttl` seconds
+
+            Return the list of removed entries.
+        """
+        if self._idle_ttl <= 0:
+            return []
+
+        now = time.time()
+        deadline = now - self._idle_ttl
+        expired = [
+            (key, details) for key, details in self._lru_cache.items()
+            if self._last_access.setdefault(key, now) < deadline
+        ]
+        for key, _ in expired:
+            del self._lru_cache[key]
+
+        # Forget about evicted entries
+        for key in [k for k in self._last_access if k not in self._lru_cache]:
+            del self._last_access[key]
+
+        return expired
+
+    def pop_access_counts(self) -> Dict[str, int]:
+        """ Return the access counts since the last call
+        """
+        counts, self._access_counts = self._access_counts, Counter()
+        return dict(counts)
+
+    def schedule_warmup(self, keys: Sequence[str]):
+        """ Schedule loading of projects in the LRU cache
+        """
+        self._warmup_queue.extend((key, CacheType.LRU) for key in keys)
+
+    def schedule_static(self, keys: Sequence[str]):
+        """ Schedule loading of projects in the static cache
+
+            Scheduled projects are loaded before projects
+            scheduled in the LRU cache.
+        """
+        scheduled = []
+        for key in keys:
+            try:
+                key = self.canonical_key(key)
+            except PathNotAllowedError:
+                LOGGER.error("Preload: '%s' path not allowed", key)
+                continue
+            if key not in self._scheduled_static and key not in self._static_cache:
+                self._scheduled_static.add(key)
+                scheduled.append((key, CacheType.STATIC))
+        self._warmup_queue.extendleft(reversed(scheduled))
+
+    def num_scheduled(self) -> int:
+        """ Return the number of projects waiting to be loaded
+        """
+        return len(self._warmup_queue)
+
+    def _load_scheduled(self, key: str, cachetype: CacheType) -> Optional[UpdateState]:
+        """ Load a scheduled project
+
+            Return None if the project is already loaded.
+        """
+        if cachetype == CacheType.STATIC:
+            if key not in self._scheduled_static:
+                # Already loaded on request
+                return None
+            self._scheduled_static.discard(key)
+            return self.update_static_entry(key)
+
+        key = self.canonical_key(key)
+        if key in self._lru_cache or key in self._static_cache:
+            return None
+        self.check_negative(key)
+        return self.update_entry(key)
+
+    def warmup(self, budget: float) -> List[Tuple[str, UpdateState]]:
+        """ Load scheduled projects
+
+            At least one project is loaded, then projects are loaded
+            until the time budget is exhausted.
+        """
+        loaded = []
+        deadline = time.time() + budget
+        while self._warmup_queue:
+            key, cachetype = self._warmup_queue.popleft()
+            try:
+                update = self._load_scheduled(key, cachetype)
+                if update is None:
+                    continue
+                loaded.append((key, update))
+            except NEGATIVE_ERRORS as err:
+                LOGGER.warning("Warm-up: ignoring '%s': %s", key, err)
+                self.add_negative(key, err)
+                continue
+            except Exception as err:
+                LOGGER.error("Warm-up: failed to load '%s': %s", key, err)
+            if time.time() >= deadline:
+                break
+        return loaded
+
+    def record_access(self, key: str, details: CacheDetails):
+        """ Record access in trace file
+        """
+        try:
+            self._trace.write(f"{time.time():.3f}\t{key}\t{details.load_time:.3f}\t{details.weight}\n")
+        except OSError as err:
+            LOGGER.error("Failed to write cache trace: %s", err)
+
+    def resolve_layers(self, project: QgsProject, parameter: Callable[[str], str]):
+        """ Resolve the layers needed for the request
+
+            Does nothing if layers are not resolved on demand.
+        """
+        if not self._lazy_layers:
+            return
+
+        layers = lazylayers.requested_layers(project, parameter)
+        if layers is None:
+            layers = project.mapLayers().values()
+
+        rss = _rss()
+        failed = lazylayers.load_layers(
+            project,
+            layers,
+            trust_layer_metadata=self._trust_layer_metadata,
+            read_only=self._read_only_layers,
+        )
+        self.update_weight(project, _rss() - rss)
+        if failed and self._strict_check:
+            badlayerh = BadLayerHandler()
+            badlayerh.badLayerNames = set(failed)
+            if not badlayerh.validateLayers(project):
+                raise StrictCheckingError
 
     def prepare_project(self, project: QgsProject):
         """ Set project configuration
@@ -444,12 +1207,18 @@ class QgsCacheManager:
             readflags |= Qgis.ProjectReadFlag.DontLoadLayouts
         if self._read_only_layers:
             readflags |= Qgis.ProjectReadFlag.ForceReadOnlyLayers
+        if self._lazy_layers:
+            readflags |= Qgis.ProjectReadFlag.DontResolveLayers
 
         badlayerh = BadLayerHandler()
         project.setBadLayerHandler(badlayerh)
         if not project.read(uri, readflags):
             raise RuntimeError(f"Failed to read Qgis project {uri}")
 
+        if self._strict_check and self._lazy_layers:
+            # Layers are not loaded, check the data sources
+            badlayerh.checkLayerSources(project)
+
         if self._strict_check and not badlayerh.validateLayers(project):
             raise StrictCheckingError
 
@@ -471,6 +1240,11 @@ class BadLayerHandler(QgsProjectBadLayerHandler):
         nameElements = (lyr.firstChildElement("layername") for lyr in layers if lyr)
         self.badLayerNames = {elem.text() for elem in nameElements if elem}
 
+    def checkLayerSources(self, project: QgsProject):
+        """ Check data sources of layers that have not been loaded
+        """
+        self.badLayerNames.update(lazylayers.missing_sources(project))
+
     def validateLayers(self, project: QgsProject) -> bool:
         """ Check layers
 
@@ -488,46 +1262,95 @@ def get_cacheservice() -> QgsCacheManager:
     return componentmanager.get_service(CACHE_MANAGER_CONTRACTID)
 
 
-def preload_projects_file(path: Path, cacheservice: QgsCacheManager) -> int:
-    """ Preload projects from configuration file in static cache
+def read_preload_config(path: Path) -> List[str]:
+    """ Read the projects from the preload configuration file
+
+        Projects prefixed with `!` are returned first.
     """
     conf_file = Path(path)
     if not conf_file.exists():
         LOGGER.error("%s file do not exists, ignoring preload config", path)
-        return 0
+        return []
 
-    loaded_so_far = 0
+    priority, others = [], []
 
     # Read the projects, strip comments
     with conf_file.open() as fp:
         for p in filter(None, (line.strip('\n ').partition('#')[0] for line in fp.readlines())):
             p = p.strip(' ')
-            try:
-                cacheservice.update_static_entry(p)
-            except StrictCheckingError:
-                LOGGER.error("Preload: '%s' as invalid layers - strict mode on", p)
-            except PathNotAllowedError:
-                LOGGER.error("Preload: '%s' path not allowed", p)
-            except FileNotFoundError:
-                LOGGER.error("Preload: '%s' not found", p)
+            if p.startswith('!'):
+                priority.append(p[1:].strip(' '))
             else:
-                loaded_so_far += 1
-                LOGGER.info("Preload: '%s' loaded", p)
+                others.append(p)
+
+    return priority + others
+
+
+def preload_projects_file(path: Path, cacheservice: QgsCacheManager) -> int:
+    """ Preload projects from configuration file in static cache
+    """
+    loaded_so_far = 0
+
+    for p in read_preload_config(path):
+        try:
+            cacheservice.update_static_entry(p)
+        except StrictCheckingError:
+            LOGGER.error("Preload: '%s' as invalid layers - strict mode on", p)
+        except PathNotAllowedError:
+            LOGGER.error("Preload: '%s' path not allowed", p)
+        except FileNotFoundError:
+            LOGGER.error("Preload: '%s' not found", p)
+        else:
+            loaded_so_far += 1
+            LOGGER.info("Preload: '%s' loaded", p)
 
     return loaded_so_far
 
 
+def schedule_projects_file(path: Path, cacheservice: QgsCacheManager) -> int:
+    """ Schedule loading of projects from configuration
+        file in static cache
+    """
+    projects = read_preload_config(path)
+    if projects:
+        LOGGER.info("Scheduling preload of %s projects", len(projects))
+        cacheservice.schedule_static(projects)
+    return len(projects)
+
+
+def preload_hotset(path: Path, cacheservice: QgsCacheManager, size: int) -> int:
+    """ Schedule loading of the most accessed projects
+        from the hot set file
+    """
+    keys = top_keys(path, size)
+    if keys:
+        LOGGER.info("Scheduling warm-up of %s projects from hot set", len(keys))
+        cacheservice.schedule_warmup(keys)
+    return len(keys)
+
+
 def preload_projects():
     """ Preload projects in cache
     """
-    confpath = confservice['projects.cache'].get('preload_config', fallback=None)
-    if not confpath:
-        return
+    cnf = confservice['projects.cache']
+
+    confpath = cnf.get('preload_config', fallback=None)
+    if confpath:
+        if confservice.getboolean('server', 'prefork'):
+            # Projects are loaded before forking workers
+            preload_projects_file(confpath, get_cacheservice())
+        else:
+            # Projects are loaded in idle cycles
+            schedule_projects_file(confpath, get_cacheservice())
 
-    preload_projects_file(confpath, get_cacheservice())
+    hotset = cnf.get('hotset_file', fallback=None)
+    if hotset:
+        # Do not warm up more projects than the LRU cache can hold
+        size = min(cnf.getint('hotset_size'), cnf.getint('size'))
+        preload_hotset(hotset, get_cacheservice(), size)
 
 
-def get_project_summary(key: str, project: QgsProject) -> Dict:
+def get_project_summary(key: str, project: QgsProject, weight: int = 0) -> Dict:
     """ Return json summary for cached project
     """
     def layer_summary(layer_id: str, layer: QgsMapLayer) -> Dict:
@@ -549,4 +1372,5 @@ def get_project_summary(key: str, project: QgsProject) -> Dict:
         layers=layers,
         crs=project.crs().userFriendlyIdentifier(),
         last_modified=project.lastModified().toString(Qt.ISODate),
+        weight=weight,
     )
@@ -8,8 +8,11 @@
 
 """ File protocol handler
 """
+import hashlib
 import logging
+import os
 import urllib.parse
+import zipfile
 
 from datetime import datetime
 from pathlib import Path
@@ -19,6 +22,8 @@ from qgis.core import QgsProject
 
 from pyqgisservercontrib.core import componentmanager
 
+from ..mirror import LocalMirror, relative_paths_from
+
 LOGGER = logging.getLogger('SRVLOG')
 
 ALLOWED_SFX = ('.qgs', '.qgz')
@@ -26,13 +31,45 @@ ALLOWED_SFX = ('.qgs', '.qgz')
 __all__ = []  # type: ignore [var-annotated]
 
 
+def fingerprint(path: Path) -> str:
+    """ Return a fingerprint of the project file content
+
+        For project archives, the fingerprint is computed from the
+        crc of the archived files, which does not require to
+        decompress the archive.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if path.suffix == '.qgz':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                    digest.update(f"{info.filename}:{info.CRC}:{info.file_size}\n".encode())
+            return digest.hexdigest()
+        except zipfile.BadZipFile:
+            # Let Qgis report the error
+            pass
+    with path.open('rb') as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 @componentmanager.register_factory('@3liz.org/cache/protocol-handler;1?scheme=file')
 class FileProtocolHandler:
     """ Handle file protocol
     """
 
     def __init__(self):
-        pass
+        cnf = componentmanager.get_service('@3liz.org/config-service;1')
+        mirror_dir = cnf.get('projects.cache', 'mirror_dir', fallback='')
+        if mirror_dir:
+            LOGGER.info("File protocol handler: mirroring projects in %s", mirror_dir)
+            self._mirror = LocalMirror(
+                mirror_dir,
+                cnf.getint('projects.cache', 'mirror_max_size', fallback=0) * 1024 * 1024,
+            )
+        else:
+            self._mirror = None
 
     def _check_file(self, path: Path) -> Optional[Path]:
         """
@@ -52,6 +89,32 @@ class FileProtocolHandler:
 
         return path if exists else None
 
+    def canonical_url(self, url: urllib.parse.ParseResult) -> Optional[urllib.parse.ParseResult]:
+        """ Return the canonical url of the project file
+
+            Return None if the file does not exists
+        """
+        path = self._check_file(Path(url.path))
+        if not path:
+            return None
+        return url._replace(scheme='file', path=os.path.normpath(path), params='', query='', fragment='')
+
+    def _read_mirrored(self, path: Path) -> QgsProject:
+        """ Read the project from its local copy
+        """
+        cachmngr = componentmanager.get_service('@3liz.org/cache-manager;1')
+        try:
+            local = self._mirror.stage(path)
+        except OSError as err:
+            LOGGER.error("File protocol handler: failed to mirror %s: %s", path, err)
+            return cachmngr.read_project(str(path))
+
+        with relative_paths_from(path.parent):
+            project = cachmngr.read_project(str(local))
+        # Refer to the original file
+        project.setFileName(str(path))
+        return project
+
     def get_modified_time(self, url: urllib.parse.ParseResult) -> datetime:
         """ Return the modified date time of the project referenced by its url
         """
@@ -60,6 +123,14 @@ class FileProtocolHandler:
             raise FileNotFoundError(url.path)
         return datetime.fromtimestamp(path.stat().st_mtime)
 
+    def get_fingerprint(self, url: urllib.parse.ParseResult) -> str:
+        """ Return the fingerprint of the content of the project file
+        """
+        path = self._check_file(Path(url.path))
+        if not path:
+            raise FileNotFoundError(url.path)
+        return fingerprint(path)
+
     def get_project(
         self,
         url: Optional[urllib.parse.ParseResult],
@@ -81,8 +152,11 @@ class FileProtocolHandler:
 
         modified_time = datetime.fromtimestamp(path.stat().st_mtime)
         if timestamp is None or timestamp < modified_time:
-            cachmngr = componentmanager.get_service('@3liz.org/cache-manager;1')
-            project = cachmngr.read_project(str(path))
+            if self._mirror:
+                project = self._read_mirrored(path)
+            else:
+                cachmngr = componentmanager.get_service('@3liz.org/cache-manager;1')
+                project = cachmngr.read_project(str(path))
             timestamp = modified_time
 
         return project, timestamp
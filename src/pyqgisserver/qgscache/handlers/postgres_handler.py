@@ -30,14 +30,28 @@
 
 """
 import logging
+import os
 import urllib.parse
 
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Tuple, cast
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 from urllib.parse import parse_qs
 
 import psycopg2
 
+from psycopg2 import sql
+from psycopg2.extensions import connection as Connection
+
 from qgis.core import QgsProject
 
 from pyqgisservercontrib.core import componentmanager
@@ -49,6 +63,8 @@ __all__ = []  # type: ignore [var-annotated]
 # List of allowed params in secure mode
 ALLOWED_SECURE_PARAMS = ('service', 'project', 'dbname', 'schema')
 
+_METADATA_QUERY = "select name, metadata from {}.qgis_projects where name = any(%s)"
+
 #
 # Connect to database and check modification time
 # Qgis is silent when failing to read a project from database and really
@@ -59,8 +75,15 @@ ALLOWED_SECURE_PARAMS = ('service', 'project', 'dbname', 'schema')
 #
 
 
-def _check_unsafe_url(insecure: bool, url: urllib.parse.ParseResult) -> Tuple[str, datetime]:
-    """ Check unsafe url
+class _ProjectLocation(NamedTuple):
+    params: Tuple[Tuple[str, str], ...]
+    schema: str
+    name: str
+    urlstr: str
+
+
+def _parse_url(insecure: bool, url: urllib.parse.ParseResult) -> _ProjectLocation:
+    """ Parse project url
     """
     if insecure:
         LOGGER.warning("Setting postgres connexion parameters in insecure mode %s", url.geturl())
@@ -98,26 +121,149 @@ def _check_unsafe_url(insecure: bool, url: urllib.parse.ParseResult) -> Tuple[st
     qparams = '&'.join(f'{k}={v}' for k, v in params.items())
     urlstr = f"postgresql://{netloc}/?{qparams}"
 
+    return _ProjectLocation(
+        tuple(sorted((k, str(v)) for k, v in connexion_params.items() if v is not None)),
+        schema,
+        prjname,
+        urlstr,
+    )
+
+
+class ConnectionPool:
+    """ Pool of database connections keyed on connection parameters
+
+        Connections are not shared between processes: connections
+        inherited from the parent process are left untouched since
+        closing them would close the connection of the parent.
+    """
+
+    def __init__(self, size: int, connect_timeout: int, statement_timeout: int):
+        """
+            :param size: max number of idle connections kept per connection parameters
+            :param connect_timeout: connection timeout in seconds
+            :param statement_timeout: statement timeout in milliseconds
+        """
+        self._size = size
+        self._connect_timeout = connect_timeout
+        self._statement_timeout = statement_timeout
+        self._idle: Dict[Tuple, List[Connection]] = defaultdict(list)
+        self._inherited: List[Connection] = []
+        self._pid = os.getpid()
+
+    def _connect(self, params: Tuple[Tuple[str, str], ...]) -> Connection:
+        kwargs = dict(params)
+        if self._connect_timeout > 0:
+            kwargs.setdefault('connect_timeout', str(self._connect_timeout))
+        if self._statement_timeout > 0:
+            options = f"-c statement_timeout={self._statement_timeout}"
+            kwargs['options'] = f"{kwargs['options']} {options}" if 'options' in kwargs else options
+        LOGGER.debug("**** Postgresql connection params %s", kwargs)
+        conn = psycopg2.connect(**kwargs)
+        conn.autocommit = True
+        return conn
+
+    def num_idle(self) -> int:
+        return sum(len(conns) for conns in self._idle.values())
+
+    @contextmanager
+    def connection(self, params: Tuple[Tuple[str, str], ...]) -> Iterator[Connection]:
+        """ Return a connection for the parameters
+
+            Broken connections are discarded.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            for conns in self._idle.values():
+                self._inherited.extend(conns)
+            self._idle.clear()
+
+        idle = self._idle[params]
+        conn = idle.pop() if idle else self._connect(params)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            conn.close()
+            raise
+        except BaseException:
+            if conn.closed:
+                raise
+            self._release(params, conn)
+            raise
+        else:
+            self._release(params, conn)
+
+    def _release(self, params: Tuple[Tuple[str, str], ...], conn: Connection):
+        idle = self._idle[params]
+        if conn.closed or len(idle) >= self._size:
+            conn.close()
+        else:
+            idle.append(conn)
+
+    def execute(self, params: Tuple[Tuple[str, str], ...], query: sql.Composable, args: Sequence = ()) -> List[Tuple]:
+        """ Execute the query and return all rows
+
+            The query is retried once on a new connection if a pooled
+            connection is broken (i.e the server has been restarted).
+        """
+        retry = bool(self._idle.get(params))
+        while True:
+            try:
+                with self.connection(params) as conn, conn.cursor() as cursor:
+                    cursor.execute(query, args)
+                    return cursor.fetchall()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as err:
+                if not retry:
+                    raise
+                LOGGER.warning("Postgres handler: retrying with a new connection (%s)", err)
+                retry = bool(self._idle.get(params))
+
+    def close(self):
+        """ Close idle connections
+        """
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+
+def _get_modified_times(
+    pool: ConnectionPool,
+    params: Tuple[Tuple[str, str], ...],
+    schema: str,
+    names: Sequence[str],
+) -> Dict[str, datetime]:
+    """ Return the modified times of the projects stored in the schema
+    """
+    query = sql.SQL(_METADATA_QUERY).format(sql.Identifier(schema))
     try:
-        LOGGER.debug("**** Postgresql connection params %s", connexion_params)
-        conn = psycopg2.connect(**connexion_params)  # type: ignore [arg-type]
-        cursor = conn.cursor()
-        cursor.execute(f"select metadata from {schema}.qgis_projects where name='{prjname}'")
-        if cursor.rowcount <= 0:
-            raise FileNotFoundError(url.geturl())
-        metadata = cast(Tuple, cursor.fetchone())[0]
-        LOGGER.debug("**** Postgres metadata for '%s': %s", prjname, metadata)
-        conn.close()
+        rows = pool.execute(params, query, (list(names),))
     except psycopg2.OperationalError as e:
         LOGGER.error("Postgres handler Connection error: %s", e)
-        raise FileNotFoundError(urlstr)
+        raise FileNotFoundError(schema)
     except psycopg2.Error as e:
         LOGGER.error("Postgres handler Connection error: %s", e)
-        raise RuntimeError("Connection failed: %s", urlstr)
+        raise RuntimeError(f"Query failed: {e}")
+
+    return {name: datetime.fromisoformat(metadata['last_modified_time']) for name, metadata in rows}
+
 
-    modified_time = datetime.fromisoformat(metadata['last_modified_time'])
+def _check_unsafe_url(
+    pool: ConnectionPool,
+    insecure: bool,
+    url: urllib.parse.ParseResult,
+) -> Tuple[str, datetime]:
+    """ Check unsafe url
+    """
+    location = _parse_url(insecure, url)
+    try:
+        modified_times = _get_modified_times(pool, location.params, location.schema, (location.name,))
+    except FileNotFoundError:
+        raise FileNotFoundError(location.urlstr)
+    if location.name not in modified_times:
+        raise FileNotFoundError(url.geturl())
 
-    return urlstr, modified_time
+    LOGGER.debug("**** Postgres modified time for '%s': %s", location.name, modified_times[location.name])
+    return location.urlstr, modified_times[location.name]
 
 
 @componentmanager.register_factory('@3liz.org/cache/protocol-handler;1?scheme=postgres')
@@ -128,13 +274,57 @@ class PostgresProtocolHandler:
     def __init__(self):
         cnf = componentmanager.get_service('@3liz.org/config-service;1')
         self._insecure = cnf.getboolean('projects.cache', 'insecure', fallback=False)
+        self._pool = ConnectionPool(
+            cnf.getint('projects.cache', 'postgres_pool_size', fallback=2),
+            cnf.getint('projects.cache', 'postgres_connect_timeout', fallback=5),
+            cnf.getint('projects.cache', 'postgres_statement_timeout', fallback=5000),
+        )
+        self._notified = bool(cnf.get('projects.cache', 'postgres_notify_dsn', fallback=''))
+
+    @property
+    def notified(self) -> bool:
+        """ Return True if project changes are notified
+        """
+        return self._notified
+
+    def match_notification(self, url: urllib.parse.ParseResult, payload: Dict) -> bool:
+        """ Return True if the change notification applies to the project
+
+            Notifications without project name apply to all projects.
+        """
+        if payload.get('scheme') != 'postgres':
+            return False
+        if not payload.get('name'):
+            return True
+        location = _parse_url(self._insecure, url)
+        return location.name == payload['name'] and location.schema == payload.get('schema')
 
     def get_modified_time(self, url: urllib.parse.ParseResult) -> datetime:
         """ Return the modified date time of the project referenced by its url
         """
-        _, modified_time = _check_unsafe_url(self._insecure, url)
+        _, modified_time = _check_unsafe_url(self._pool, self._insecure, url)
         return modified_time
 
+    def get_modified_times(
+        self,
+        urls: Sequence[urllib.parse.ParseResult],
+    ) -> Dict[urllib.parse.ParseResult, datetime]:
+        """ Return the modified date times of the projects referenced by their urls
+
+            Projects stored in the same schema are fetched with one query,
+            missing projects are not returned.
+        """
+        batches: Dict[Tuple, List[Tuple[urllib.parse.ParseResult, str]]] = defaultdict(list)
+        for url in urls:
+            location = _parse_url(self._insecure, url)
+            batches[(location.params, location.schema)].append((url, location.name))
+
+        result = {}
+        for (params, schema), items in batches.items():
+            modified_times = _get_modified_times(self._pool, params, schema, [name for _, name in items])
+            result.update((url, modified_times[name]) for url, name in items if name in modified_times)
+        return result
+
     def get_project(self, url: Optional[urllib.parse.ParseResult],
                     project: Optional[QgsProject] = None,
                     timestamp: Optional[datetime] = None) -> Tuple[QgsProject, datetime]:
@@ -145,7 +335,7 @@ class PostgresProtocolHandler:
             Supports the postgres:///projectname syntax
         """
         if url:
-            urlstr, modified_time = _check_unsafe_url(self._insecure, url)
+            urlstr, modified_time = _check_unsafe_url(self._pool, self._insecure, url)
         elif project:
             urlstr = project.fileName()
             modified_time = project.lastModified().toPyDateTime()
@@ -0,0 +1,116 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Snapshot of the most accessed projects
+
+    Workers report project accesses to the cache observer which
+    periodically saves the access frequencies in a small json file.
+    Frequencies decay at each snapshot so that projects that are no
+    longer accessed leave the hot set.
+
+    At startup, the most accessed projects are loaded by workers
+    in idle cycles.
+"""
+import json
+import logging
+import os
+
+from pathlib import Path
+from typing import (
+    Dict,
+    List,
+    Mapping,
+)
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Maximum number of entries in the snapshot file
+MAX_ENTRIES = 100
+
+# Decay factor applied to frequencies at each snapshot
+DECAY = 0.5
+
+# Frequencies below this value are dropped
+MIN_FREQUENCY = 0.01
+
+
+def read_hotset(path: Path) -> Dict[str, float]:
+    """ Read access frequencies from the snapshot file
+
+        Return an empty dict if the file does not exist
+        or is invalid.
+    """
+    try:
+        with Path(path).open() as fp:
+            data = json.load(fp)
+        return {str(k): float(v) for k, v in data['projects'].items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as err:
+        LOGGER.error("Invalid hot set file %s: %s", path, err)
+        return {}
+
+
+def write_hotset(path: Path, frequencies: Mapping[str, float], max_entries: int = MAX_ENTRIES):
+    """ Save the most accessed projects in the snapshot file
+
+        The file is replaced atomically.
+    """
+    path = Path(path)
+    entries = sorted(frequencies.items(), key=lambda item: item[1], reverse=True)[:max_entries]
+    tmpfile = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmpfile.open('w') as fp:
+        json.dump({'projects': dict(entries)}, fp, indent=2)
+    tmpfile.replace(path)
+
+
+def top_keys(path: Path, size: int) -> List[str]:
+    """ Return the keys of the most accessed projects
+    """
+    frequencies = read_hotset(path)
+    return sorted(frequencies, key=frequencies.get, reverse=True)[:max(size, 0)]
+
+
+class HotSet:
+    """ Aggregate project access frequencies
+    """
+
+    def __init__(self, path: Path, max_entries: int = MAX_ENTRIES):
+        self._path = Path(path)
+        self._max_entries = max_entries
+        # Start from the previous snapshot
+        self._frequencies = read_hotset(self._path)
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._frequencies)
+
+    def frequency(self, key: str) -> float:
+        return self._frequencies.get(key, 0.)
+
+    def update(self, counts: Mapping[str, int]):
+        """ Add access counts
+        """
+        for key, count in counts.items():
+            self._frequencies[key] = self._frequencies.get(key, 0.) + count
+        self._dirty = self._dirty or bool(counts)
+
+    def save(self):
+        """ Save the snapshot and apply decay
+        """
+        if not self._dirty:
+            return
+        try:
+            write_hotset(self._path, self._frequencies, self._max_entries)
+        except OSError as err:
+            LOGGER.error("Failed to save hot set file %s: %s", self._path, err)
+            return
+        self._frequencies = {
+            k: v * DECAY for k, v in self._frequencies.items() if v * DECAY >= MIN_FREQUENCY
+        }
+        self._dirty = False
@@ -0,0 +1,204 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Resolve project layers on demand
+
+    Projects may be read without resolving layers data sources: only
+    the project structure is loaded and layers are resolved when
+    first requested.
+
+    For requests that reference layers (i.e GetMap with the LAYERS
+    parameter), only the requested layers and the layers they depend
+    on (joins, relations and declared dependencies) are resolved. All
+    layers are resolved for other requests or when the root layer is
+    requested.
+"""
+import logging
+import os
+
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+
+from qgis.core import (
+    Qgis,
+    QgsDataProvider,
+    QgsMapLayer,
+    QgsProject,
+    QgsProviderRegistry,
+    QgsReadWriteContext,
+    QgsVectorLayer,
+)
+from qgis.server import QgsServerProjectUtils
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Parameters holding layer names
+LAYER_PARAMETERS = ('LAYERS', 'LAYER', 'QUERY_LAYERS', 'TYPENAME', 'TYPENAMES')
+
+# Requests needing only the layers given in parameters
+LAYER_REQUESTS = (
+    'GETMAP',
+    'GETFEATUREINFO',
+    'GETLEGENDGRAPHIC',
+    'GETSTYLES',
+    'GETFEATURE',
+    'DESCRIBEFEATURETYPE',
+    'GETTILE',
+)
+
+# Set on layers for which resolution has been attempted
+RESOLVED_PROPERTY = 'qgsrv/resolved'
+
+
+def is_supported() -> bool:
+    """ Return True if Qgis supports reading projects
+        without resolving layers
+    """
+    return hasattr(Qgis.ProjectReadFlag, 'DontResolveLayers')
+
+
+def _short_name(layer: QgsMapLayer) -> str:
+    if hasattr(layer, 'serverProperties'):
+        return layer.serverProperties().shortName()
+    return layer.shortName()
+
+
+def _context(project: QgsProject) -> QgsReadWriteContext:
+    context = QgsReadWriteContext()
+    context.setPathResolver(project.pathResolver())
+    return context
+
+
+def _absolute_source(layer: QgsMapLayer, context: QgsReadWriteContext) -> str:
+    return QgsProviderRegistry.instance().relativeToAbsoluteUri(layer.providerType(), layer.source(), context)
+
+
+def missing_sources(project: QgsProject) -> Set[str]:
+    """ Return the names of the layers with a missing file data source
+
+        This is a cheap check that does not load layers.
+    """
+    context = _context(project)
+    registry = QgsProviderRegistry.instance()
+    missing = set()
+    for layer in project.mapLayers().values():
+        path = registry.decodeUri(layer.providerType(), _absolute_source(layer, context)).get('path')
+        if path and not os.path.exists(path):
+            missing.add(layer.name())
+    return missing
+
+
+def _dependencies(project: QgsProject, layers: Dict[str, QgsMapLayer]) -> Dict[str, QgsMapLayer]:
+    """ Add the layers the given layers depend on
+    """
+    relations = project.relationManager().relations().values()
+    todo = list(layers.values())
+    while todo:
+        layer = todo.pop()
+        ids = {dep.layerId() for dep in layer.dependencies()}
+        if isinstance(layer, QgsVectorLayer):
+            ids.update(join.joinLayerId() for join in layer.vectorJoins())
+        for rel in relations:
+            if layer.id() in (rel.referencingLayerId(), rel.referencedLayerId()):
+                ids.update((rel.referencingLayerId(), rel.referencedLayerId()))
+        for layer_id in ids:
+            if layer_id not in layers:
+                dep = project.mapLayer(layer_id)
+                if dep:
+                    layers[layer_id] = dep
+                    todo.append(dep)
+    return layers
+
+
+def _root_names(project: QgsProject) -> Set[str]:
+    """ Return the names of the root layer
+    """
+    return set(filter(None, (QgsServerProjectUtils.wmsRootName(project), project.title())))
+
+
+def requested_layers(project: QgsProject, parameter: Callable[[str], str]) -> Optional[List[QgsMapLayer]]:
+    """ Return the layers needed for the request
+
+        Return None if all layers are needed. Unknown layer
+        names are ignored and reported by Qgis.
+    """
+    if (parameter('REQUEST') or '').upper() not in LAYER_REQUESTS:
+        return None
+
+    names = set()
+    for param in LAYER_PARAMETERS:
+        names.update(filter(None, (n.strip() for n in (parameter(param) or '').split(','))))
+    if not names or names & _root_names(project):
+        return None
+
+    index: Dict[str, List[QgsMapLayer]] = {}
+    for layer in project.mapLayers().values():
+        for name in (layer.id(), layer.name(), _short_name(layer)):
+            if name:
+                index.setdefault(name, []).append(layer)
+    for group in project.layerTreeRoot().findGroups(True):
+        layers = [node.layer() for node in group.findLayers() if node.layer()]
+        for name in (group.name(), group.customProperty('wmsShortName')):
+            if name:
+                index.setdefault(name, []).extend(layers)
+
+    found: Dict[str, QgsMapLayer] = {}
+    for name in names:
+        # Feature type names may be qualified
+        matches = index.get(name) or index.get(name.partition(':')[2])
+        if not matches:
+            LOGGER.debug("Ignoring unknown layer '%s'", name)
+            continue
+        found.update((layer.id(), layer) for layer in matches)
+
+    return list(_dependencies(project, found).values())
+
+
+def load_layers(
+    project: QgsProject,
+    layers: Iterable[QgsMapLayer],
+    trust_layer_metadata: bool = False,
+    read_only: bool = False,
+) -> List[str]:
+    """ Resolve layers data sources
+
+        Resolution is attempted once per layer. Return the
+        names of the layers that failed to load.
+    """
+    context = None
+    failed = []
+    for layer in layers:
+        if layer.isValid():
+            continue
+        if layer.customProperty(RESOLVED_PROPERTY):
+            failed.append(layer.name())
+            continue
+        context = context or _context(project)
+        flags = QgsDataProvider.ReadFlags()
+        if trust_layer_metadata:
+            flags |= QgsDataProvider.FlagTrustDataSource
+        layer.setDataSource(
+            _absolute_source(layer, context),
+            layer.name(),
+            layer.providerType(),
+            QgsDataProvider.ProviderOptions(),
+            flags,
+        )
+        layer.setCustomProperty(RESOLVED_PROPERTY, True)
+        if not layer.isValid():
+            LOGGER.error("Failed to load layer '%s'", layer.name())
+            failed.append(layer.name())
+        elif read_only and isinstance(layer, QgsVectorLayer):
+            layer.setReadOnly(True)
+    return failed
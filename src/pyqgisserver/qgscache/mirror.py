@@ -0,0 +1,175 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Local mirror of project files
+
+    Reading large projects from network storage is slow and each worker
+    repeats the read: project files are copied to a local directory and
+    projects are read from the local copy.
+
+    Each version of a project, identified by its path, modification
+    time and size, is copied in its own directory along with its
+    auxiliary storage file. The least recently used copies are removed
+    when the mirror exceeds its maximum size.
+
+    Relative paths of project layers are resolved against the directory
+    of the original project file.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Generator,
+    List,
+    Tuple,
+)
+
+from qgis.core import QgsPathResolver
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Auxiliary storage file suffix
+AUXILIARY_SFX = '.qgd'
+
+
+def _dir_size(path: Path) -> int:
+    size = 0
+    for entry in path.iterdir():
+        try:
+            size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+    return size
+
+
+class LocalMirror:
+    """ Local copies of project files
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        """
+            :param directory: The mirror directory
+            :param max_size: The maximum size of the mirror in bytes,
+                a value of zero disables the size limit.
+        """
+        self._directory = Path(directory)
+        self._max_size = max_size
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    def _prefix(self, path: Path) -> str:
+        return hashlib.sha1(os.fsencode(path)).hexdigest()[:16]
+
+    def stage(self, path: Path) -> Path:
+        """ Return the local copy of the project file
+
+            The file is copied if there is no copy for the
+            current version of the file.
+        """
+        st = path.stat()
+        prefix = self._prefix(path)
+        version = self._directory / f"{prefix}-{st.st_mtime_ns}-{st.st_size}"
+        local = version / path.name
+        if local.exists():
+            # Mark as recently used
+            os.utime(version)
+            return local
+
+        LOGGER.debug("Mirror: copying %s to %s", path, version)
+        start = time.time()
+        tmpdir = self._directory / f".{version.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        tmpdir.mkdir()
+        try:
+            shutil.copy2(path, tmpdir / path.name)
+            auxiliary = path.with_suffix(AUXILIARY_SFX)
+            if auxiliary.exists():
+                shutil.copy2(auxiliary, tmpdir / auxiliary.name)
+            try:
+                tmpdir.rename(version)
+            except OSError:
+                # Copied concurrently by another worker
+                if not local.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        LOGGER.info("Mirror: copied %s in %.3f s", path, time.time() - start)
+
+        # Remove previous versions
+        for entry in self._directory.glob(f"{prefix}-*"):
+            if entry != version:
+                shutil.rmtree(entry, ignore_errors=True)
+
+        self.evict(keep=version)
+        return local
+
+    def entries(self) -> List[Tuple[Path, float, int]]:
+        """ Return the (directory, last use, size) of the
+            mirrored projects
+        """
+        entries = []
+        for entry in self._directory.iterdir():
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            try:
+                entries.append((entry, entry.stat().st_mtime, _dir_size(entry)))
+            except FileNotFoundError:
+                # Removed concurrently
+                continue
+        return entries
+
+    def evict(self, keep: Path) -> int:
+        """ Remove the least recently used copies until
+            the mirror size is below the maximum size
+
+            Return the number of removed copies.
+        """
+        if self._max_size <= 0:
+            return 0
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        for entry, _, size in entries:
+            if total <= self._max_size:
+                break
+            if entry == keep:
+                continue
+            LOGGER.debug("Mirror: removing %s", entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+@contextmanager
+def relative_paths_from(directory: Path) -> Generator[None, None, None]:
+    """ Resolve relative paths against the given directory
+
+        Used while reading a project from its local copy.
+    """
+    base = str(directory)
+
+    def _preprocess(path: str) -> str:
+        if path.startswith(('./', '../')):
+            return f"{base}/{path}"
+        return path
+
+    ident = QgsPathResolver.setPathPreprocessor(_preprocess)
+    try:
+        yield
+    finally:
+        QgsPathResolver.removePathPreprocessor(ident)
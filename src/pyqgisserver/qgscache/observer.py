@@ -11,8 +11,13 @@
     The observer aggregate update notifications from
     all workers, it prevents triggering the same update
     multiple times.
+
+    The observer also forwards project change notifications from
+    storages to workers and saves the hot set of most accessed
+    projects.
 """
 import asyncio
+import json
 import logging
 import os
 import traceback
@@ -20,7 +25,9 @@ import traceback
 from datetime import datetime
 from typing import (
     Any,
+    Callable,
     ClassVar,
+    Dict,
     Iterable,
     List,
     NamedTuple,
@@ -33,6 +40,7 @@ import zmq.asyncio
 
 from ..config import confservice
 from ..zeromq.utils import _get_ipc
+from .hotset import HotSet
 from .types import UpdateState
 
 LOGGER = logging.getLogger('SRVLOG')
@@ -43,6 +51,10 @@ class _CacheUpdate(NamedTuple):
     status: UpdateState
 
 
+class _AccessCounts(NamedTuple):
+    counts: Dict[str, int]
+
+
 class Client:
 
     def __init__(self):
@@ -71,6 +83,11 @@ class Client:
         """
         self._send((key, modified_time, state))
 
+    def send_access_counts(self, counts: Dict[str, int]):
+        """ Report project accesses for the hot set
+        """
+        self._send(_AccessCounts(counts))
+
 
 class Server:
 
@@ -88,15 +105,17 @@ class Server:
         cls._declared_observers = list(name for name in names if name)
 
         # XXX: Managment use cache observer for listing cached objects
-        if cls._declared_observers or confservice.getboolean('management', 'enabled'):
+        if cls._declared_observers or confservice.getboolean('management', 'enabled') \
+                or confservice.getboolean('projects.cache', 'broadcast_updates') \
+                or confservice.get('projects.cache', 'hotset_file'):
             cls._enabled = True
 
         confservice.set('projects.cache', 'has_observers', 'yes' if cls._enabled else 'no')
 
-    def __init__(self):
+    def __init__(self, broadcast: Optional[Callable[[bytes, bytes], None]] = None):
         """ Run Observer
 
-            :param timeout: timeout delay in seconds
+            :param broadcast: Callable for broadcasting notifications to workers
         """
         address = _get_ipc('cache_observer')
 
@@ -104,6 +123,10 @@ class Server:
         self._stopped = True
         self._task = None
         self._last_updates = {}
+        self._broadcast = broadcast
+        self._listener = None
+        self._hotset = None
+        self._hotset_task = None
 
         if self._declared_observers:
             self._load_observers()
@@ -114,6 +137,10 @@ class Server:
             self._sock = ctx.socket(zmq.PULL)
             self._sock.setsockopt(zmq.RCVTIMEO, 1000)
             self._sock.bind(address)
+
+            hotset_file = confservice.get('projects.cache', 'hotset_file')
+            if hotset_file:
+                self._hotset = HotSet(hotset_file)
         else:
             self._sock = None
 
@@ -137,6 +164,44 @@ class Server:
     def run(self):
         if self._enabled:
             self._task = asyncio.ensure_future(self._run_async())
+            if self._hotset is not None:
+                self._hotset_task = asyncio.ensure_future(self._save_hotset())
+
+        notify_dsn = confservice.get('projects.cache', 'postgres_notify_dsn')
+        if notify_dsn and self._broadcast:
+            from .pglisten import Listener
+            self._listener = Listener(
+                notify_dsn,
+                confservice.get('projects.cache', 'postgres_notify_channel'),
+                self.invalidate,
+            )
+            self._listener.start()
+
+    def broadcast_update(self, key: str, modified_time: datetime):
+        """ Forward a project update detected by a worker
+            to all workers
+        """
+        if self._broadcast and confservice.getboolean('projects.cache', 'broadcast_updates'):
+            LOGGER.debug("*** CACHE OBSERVER: Broadcasting update for key %s", key)
+            payload = dict(key=key, modified_time=modified_time.isoformat())
+            self._broadcast(b'INVALIDATE', json.dumps(payload).encode())
+
+    def invalidate(self, payload: Dict):
+        """ Forward a project change notification from
+            postgres storage to workers
+        """
+        payload.update(scheme='postgres')
+        LOGGER.debug("*** CACHE OBSERVER: Forwarding change notification %s", payload)
+        if self._broadcast:
+            self._broadcast(b'INVALIDATE', json.dumps(payload).encode())
+
+    async def _save_hotset(self):
+        """ Save the hot set periodically
+        """
+        interval = confservice.getint('projects.cache', 'hotset_interval')
+        while True:
+            await asyncio.sleep(interval)
+            self._hotset.save()
 
     async def _run_async(self):
         """ Run supervisor
@@ -145,7 +210,13 @@ class Server:
 
         while not self._stopped:
             try:
-                pid, (key, modified_time, state) = await self._sock.recv_pyobj()
+                pid, data = await self._sock.recv_pyobj()
+                if isinstance(data, _AccessCounts):
+                    if self._hotset is not None:
+                        self._hotset.update(data.counts)
+                    continue
+
+                key, modified_time, state = data
                 LOGGER.debug("*** CACHE OBSERVER: Received update %s for key %s from pid %s", state, key, pid)
 
                 # Check if an entry exists already
@@ -161,6 +232,9 @@ class Server:
 
                 if do_notify:
                     self.notify_observers(key, modified_time, state)
+                    # Other workers may hold a previous version
+                    if entry or state == UpdateState.UPDATED:
+                        self.broadcast_update(key, modified_time)
 
             except zmq.ZMQError as err:
                 if err.errno != zmq.EAGAIN:
@@ -174,6 +248,15 @@ class Server:
     def stop(self):
         """ Stop the Observer
         """
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+        if self._hotset_task:
+            self._hotset_task.cancel()
+            self._hotset_task = None
+            self._hotset.save()
+
         if self._stopped:
             return
 
@@ -204,7 +287,7 @@ def declare_cache_observers():
     Server.declare_observers()
 
 
-def start_cache_observer() -> Server:
-    server = Server()
+def start_cache_observer(broadcast: Optional[Callable[[bytes, bytes], None]] = None) -> Server:
+    server = Server(broadcast)
     server.run()
     return server
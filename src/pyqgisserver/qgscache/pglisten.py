@@ -0,0 +1,205 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Listen to project changes in postgres
+
+    A trigger installed on the `qgis_projects` table sends a notification
+    on the configured channel each time a project is inserted, updated
+    or deleted. Notifications are forwarded to workers so that workers
+    do not need to query the project metadata for checking changes.
+
+    Install the trigger with:
+
+        python -m pyqgisserver.qgscache.pglisten DSN --schema SCHEMA --channel CHANNEL
+"""
+import asyncio
+import json
+import logging
+import sys
+import traceback
+
+from typing import (
+    Callable,
+    Dict,
+    Optional,
+)
+
+import psycopg2
+
+from psycopg2 import sql
+
+LOGGER = logging.getLogger('SRVLOG')
+
+# Delay before reconnecting after a connection failure
+RECONNECT_DELAY = 5
+
+# Check the connection when no notifications have been received
+# for that delay
+KEEPALIVE_DELAY = 60
+
+TRIGGER_NAME = 'qgsrv_notify_project_change'
+
+_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {schema}.{function}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify({channel}, json_build_object(
+            'schema', TG_TABLE_SCHEMA, 'name', OLD.name, 'op', TG_OP)::text);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.name <> OLD.name) THEN
+        PERFORM pg_notify({channel}, json_build_object(
+            'schema', TG_TABLE_SCHEMA, 'name', NEW.name, 'op', TG_OP)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS {trigger} ON {schema}.qgis_projects;
+CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {schema}.qgis_projects
+    FOR EACH ROW EXECUTE PROCEDURE {schema}.{function}();
+"""
+
+_DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS {trigger} ON {schema}.qgis_projects;
+DROP FUNCTION IF EXISTS {schema}.{function}();
+"""
+
+
+def _format(query: str, schema: str, channel: str = '') -> sql.Composed:
+    return sql.SQL(query).format(
+        schema=sql.Identifier(schema),
+        function=sql.Identifier(TRIGGER_NAME),
+        trigger=sql.Identifier(TRIGGER_NAME),
+        channel=sql.Literal(channel),
+    )
+
+
+def install_trigger(dsn: str, schema: str, channel: str):
+    """ Install the notification trigger on the `qgis_projects` table
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(_format(_TRIGGER_SQL, schema, channel))
+    finally:
+        conn.close()
+
+
+def uninstall_trigger(dsn: str, schema: str):
+    """ Remove the notification trigger from the `qgis_projects` table
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(_format(_DROP_TRIGGER_SQL, schema))
+    finally:
+        conn.close()
+
+
+class Listener:
+    """ Listen to project change notifications
+
+        The callback is called with the notification payload, a payload
+        without project name is sent after a reconnection since
+        changes may have been missed.
+    """
+
+    def __init__(self, dsn: str, channel: str, callback: Callable[[Dict], None]):
+        self._dsn = dsn
+        self._channel = channel
+        self._callback = callback
+        self._task: Optional[asyncio.Future] = None
+        self._stopped = True
+
+    def start(self):
+        LOGGER.info("Listening to postgres project changes on channel '%s'", self._channel)
+        self._stopped = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        self._stopped = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def _dispatch(self, payload: Dict):
+        try:
+            self._callback(payload)
+        except Exception:
+            LOGGER.critical("Uncaught error in project change callback:\n%s", traceback.format_exc())
+
+    async def _listen(self, conn: psycopg2.extensions.connection):
+        """ Wait for notifications
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(conn.fileno(), ready.set)
+        try:
+            while not self._stopped:
+                try:
+                    await asyncio.wait_for(ready.wait(), KEEPALIVE_DELAY)
+                except asyncio.TimeoutError:
+                    # Check that the connection is still alive
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                ready.clear()
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    LOGGER.debug("Received project change notification: %s", notify.payload)
+                    try:
+                        payload = json.loads(notify.payload)
+                    except ValueError:
+                        LOGGER.error("Invalid project change notification: %s", notify.payload)
+                        continue
+                    self._dispatch(payload)
+        finally:
+            loop.remove_reader(conn.fileno())
+
+    async def _run(self):
+        connected_once = False
+        while not self._stopped:
+            try:
+                conn = psycopg2.connect(self._dsn)
+            except psycopg2.Error as err:
+                LOGGER.error("Project change listener: connection failed: %s", err)
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self._channel)))
+                if connected_once:
+                    # Changes may have been missed
+                    self._dispatch({})
+                connected_once = True
+                await self._listen(conn)
+            except psycopg2.Error as err:
+                LOGGER.error("Project change listener: %s", err)
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Install project change notification trigger')
+    parser.add_argument('dsn', metavar='DSN', help="Postgres connection string")
+    parser.add_argument('--schema', default='public', help="Schema of the qgis_projects table")
+    parser.add_argument('--channel', default='qgis_projects', help="Notification channel")
+    parser.add_argument('--uninstall', action='store_true', default=False, help="Remove the trigger")
+
+    args = parser.parse_args()
+
+    if args.uninstall:
+        uninstall_trigger(args.dsn, args.schema)
+    else:
+        install_trigger(args.dsn, args.schema, args.channel)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
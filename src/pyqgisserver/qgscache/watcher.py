@@ -0,0 +1,233 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Watch project files for changes with inotify
+
+    Directories of the cached project files are watched, events
+    on files with the same stem as the project file mark the
+    corresponding cache keys as dirty.
+
+    Network file systems do not report remote changes with inotify,
+    projects on such file systems are not watched and fall back to
+    polling.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+from pathlib import Path
+from typing import (
+    Dict,
+    Set,
+    Tuple,
+)
+
+LOGGER = logging.getLogger('SRVLOG')
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+# struct inotify_event header
+_EVENT = struct.Struct('iIII')
+
+# File systems for which changes are not notified
+NETWORK_FS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ceph', 'glusterfs', '9p', 'afs', 'lustre', 'gpfs')
+
+
+def is_network_fs(path: str) -> bool:
+    """ Return True if the path is on a network or fuse file system
+    """
+    mountpoint, fstype = '', ''
+    try:
+        with open('/proc/mounts') as fp:
+            for line in fp:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mnt = fields[1].replace('\\040', ' ')
+                if (path == mnt or path.startswith(mnt.rstrip('/') + '/')) and len(mnt) > len(mountpoint):
+                    mountpoint, fstype = mnt, fields[2]
+    except OSError:
+        # Cannot tell, assume the worst
+        return True
+    return fstype in NETWORK_FS or fstype.startswith('fuse')
+
+
+class InotifyWatcher:
+    """ Inotify watcher for project files
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError("Inotify is not supported")
+
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._fd = fd
+
+        self._dirs: Dict[str, int] = {}
+        self._wds: Dict[int, str] = {}
+        self._network: Dict[str, bool] = {}
+        # Watched files (directory, stem) -> keys
+        self._files: Dict[Tuple[str, str], Set[str]] = {}
+        self._keys: Dict[str, Tuple[str, str]] = {}
+        # Created files (directory, stem)
+        self._created: Set[Tuple[str, str]] = set()
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def is_watched(self, key: str) -> bool:
+        return key in self._keys
+
+    def watch_directory(self, directory: str) -> bool:
+        """ Watch a directory
+
+            Return False if the directory cannot be watched
+        """
+        if directory in self._dirs:
+            return True
+        network = self._network.get(directory)
+        if network is None:
+            network = self._network[directory] = is_network_fs(directory)
+            if network:
+                LOGGER.info("Watcher: %s is on a network file system, using polling", directory)
+        if network:
+            return False
+        wd = self._add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            LOGGER.warning("Watcher: cannot watch %s: %s", directory, os.strerror(errno))
+            return False
+        self._dirs[directory] = wd
+        self._wds[wd] = directory
+        LOGGER.debug("Watcher: watching %s", directory)
+        return True
+
+    def watch(self, key: str, path: Path) -> bool:
+        """ Watch the file for the given key
+
+            Return False if the file cannot be watched
+        """
+        self.unwatch(key)
+        path = Path(os.path.realpath(path))
+        directory = str(path.parent)
+        if not self.watch_directory(directory):
+            return False
+        entry = (directory, path.stem)
+        self._files.setdefault(entry, set()).add(key)
+        self._keys[key] = entry
+        return True
+
+    def unwatch(self, key: str):
+        """ Stop watching the file for the given key
+
+            Note that the directory watch is kept.
+        """
+        entry = self._keys.pop(key, None)
+        if entry:
+            keys = self._files[entry]
+            keys.discard(key)
+            if not keys:
+                del self._files[entry]
+
+    def _remove_directory(self, wd: int) -> Set[str]:
+        """ Forget about a directory and return the
+            keys of the files in it
+        """
+        directory = self._wds.pop(wd, None)
+        if directory is None:
+            return set()
+        del self._dirs[directory]
+        keys = {k for k, (d, _) in self._keys.items() if d == directory}
+        for key in keys:
+            self.unwatch(key)
+        return keys
+
+    def read_events(self) -> Set[str]:
+        """ Read pending events and return the keys of changed files
+
+            Changed keys are no longer watched and must be
+            watched again once updated.
+        """
+        dirty: Set[str] = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _EVENT.size <= len(buf):
+                wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+                name = buf[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b'\0')
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    LOGGER.warning("Watcher: event queue overflow")
+                    dirty.update(self._keys)
+                    for key in list(self._keys):
+                        self.unwatch(key)
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    # The directory watch is gone
+                    if not mask & IN_IGNORED:
+                        self._rm_watch(self._fd, wd)
+                    dirty.update(self._remove_directory(wd))
+                elif name:
+                    directory = self._wds.get(wd)
+                    stem = Path(os.fsdecode(name)).stem
+                    if mask & (IN_CREATE | IN_MOVED_TO | IN_ATTRIB):
+                        self._created.add((directory, stem))
+                    keys = self._files.pop((directory, stem), None)
+                    if keys:
+                        LOGGER.debug("Watcher: %s changed in %s", os.fsdecode(name), directory)
+                        dirty.update(keys)
+                        for key in keys:
+                            del self._keys[key]
+        return dirty
+
+    def pop_created(self) -> Set[Tuple[str, str]]:
+        """ Return the (directory, stem) of files created,
+            moved in or with changed attributes since the last call
+        """
+        created, self._created = self._created, set()
+        return created
@@ -11,20 +11,29 @@ The fork serve will ensure that forking processes
 occurs from [almost] the same state.
 """
 import asyncio
+import gc
 import logging
+import multiprocessing
 import os
 import signal
+import threading
 import time
 import traceback
+import uuid
 
 from glob import glob
-from multiprocessing import Process
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
 from multiprocessing.util import Finalize
 from typing import (
     Awaitable,
     Callable,
+    Dict,
     Iterator,
+    List,
     Optional,
+    Set,
+    Tuple,
     Union,
     cast,
 )
@@ -34,13 +43,19 @@ import zmq
 
 from pyqgisservercontrib.core.watchfiles import Scheduler, watchfiles
 
-from .config import confservice
+from .config import config_to_dict, confservice, load_configuration, read_config_dict
+from .logger import setup_log_handler
 from .qgsworker import QgsRequestHandler
+from .zeromq.autoscale import Autoscaler, Metrics
 from .zeromq.pool import Pool
 from .zeromq.supervisor import Supervisor
 
 LOGGER = logging.getLogger('SRVLOG')
 
+# Max number of queued broadcast notifications
+# per worker
+BROADCAST_HWM = 1000
+
 
 class _RestartHandler:
 
@@ -89,19 +104,28 @@ class WorkerPoolServer:
     def __init__(
         self,
         broadcastaddr: str,
-        pool: Process,
+        pool: BaseProcess,
         timeout: int,
         num_workers: int,
         high_water_mark: float,
+        grace_period: int = 0,
+        prefork: bool = False,
+        conn: Optional[Connection] = None,
+        autoscaler: Optional[Autoscaler] = None,
+        autoscale_interval: int = 5,
+        restart_batch_size: int = 1,
+        restart_warmup: bool = False,
+        restart_timeout: int = 120,
     ) -> None:
 
         ctx = zmq.Context.instance()
         pub = ctx.socket(zmq.PUB)
         pub.setsockopt(zmq.LINGER, 500)    # Needed for socket no to wait on close
-        pub.setsockopt(zmq.SNDHWM, 1)      # Max 1 item on send queue
+        pub.setsockopt(zmq.SNDHWM, BROADCAST_HWM)
         pub.bind(broadcastaddr)
 
         self._timeout = timeout
+        self._grace_period = grace_period
         self._sock = pub
         self._num_workers = num_workers
 
@@ -109,16 +133,31 @@ class WorkerPoolServer:
 
         LOGGER.debug("Started pool server")
         self._pool = pool
+        self._pools = [pool]
+        # Pids of pools asked to stop replacing workers
+        self._drained: Set[int] = set()
+        self._conn = conn
+        self._prefork = prefork
         self._supervisor: Union[Supervisor, None] = None
         self._healthcheck = None
 
+        self._autoscaler = autoscaler
+        self._autoscale_interval = autoscale_interval
+        self._autoscale: Optional[asyncio.Future] = None
+
+        self._restart_batch_size = restart_batch_size
+        self._restart_warmup = restart_warmup
+        self._restart_timeout = restart_timeout
+        self._restart_task: Optional[asyncio.Future] = None
+        self._restart_status: Optional[dict] = None
+
         self._restart_handler = _RestartHandler()
 
         # Ensure that pool is terminated is called
         # at process exit
         self._terminate = Finalize(
-            self, self._terminate_pool,
-            args=(self._pool,),
+            self, self._terminate_pools,
+            args=(self._pools,),
             exitpriority=16,
         )
 
@@ -135,6 +174,38 @@ class WorkerPoolServer:
                 LOGGER.error(traceback.format_exc())
             await asyncio.sleep(5)
 
+    async def autoscale(self) -> Awaitable[None]:
+        """ Periodically adjust the number of workers
+        """
+        autoscaler = cast(Autoscaler, self._autoscaler)
+        supervisor = cast(Supervisor, self._supervisor)
+
+        # Initialize cpu usage measurement
+        psutil.cpu_percent()
+
+        rejected = supervisor.queue_stats.rejected
+        busy_time = supervisor.busy_time()
+        sampled_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self._autoscale_interval)
+            try:
+                now = time.monotonic()
+                queue = supervisor.queue_stats
+                busy = supervisor.busy_time()
+                memory = psutil.virtual_memory()
+                metrics = Metrics(
+                    queue_length=queue.length,
+                    queue_wait=queue.wait,
+                    rejected=max(queue.rejected - rejected, 0),
+                    busy_ratio=(busy - busy_time) / ((now - sampled_at) * self._num_workers),
+                    memory_available=memory.available / memory.total,
+                    cpu_usage=psutil.cpu_percent() / 100.,
+                )
+                rejected, busy_time, sampled_at = queue.rejected, busy, now
+                self.resize(autoscaler.target(self._num_workers, metrics))
+            except Exception:
+                LOGGER.error(traceback.format_exc())
+
     def start_supervisor(self):
         """ Start supervisor independently
 
@@ -143,22 +214,27 @@ class WorkerPoolServer:
         """
         if self._supervisor is None:
             LOGGER.info("Initializing supervisor")
-            self._supervisor = Supervisor(self._timeout)
+            self._supervisor = Supervisor(self._timeout, self._grace_period)
             self._supervisor.run()
 
         if self._healthcheck is None:
             LOGGER.info("Initializing pool healthcheck")
             self._healthcheck = asyncio.ensure_future(self.healthcheck())
 
+        if self._autoscaler and self._autoscale is None:
+            LOGGER.info("Initializing pool autoscaling")
+            self._autoscale = asyncio.ensure_future(self.autoscale())
+
         self._restart_handler.start(self.restart)
 
     @classmethod
-    def _terminate_pool(cls, p: Process) -> None:
-        if p and hasattr(p, 'terminate'):
-            if p.exitcode is None:
-                p.terminate()
-            if p.is_alive():
-                p.join()
+    def _terminate_pools(cls, pools: List[BaseProcess]) -> None:
+        for p in pools:
+            if p and hasattr(p, 'terminate'):
+                if p.exitcode is None:
+                    p.terminate()
+                if p.is_alive():
+                    p.join()
 
     def terminate(self):
         """ Terminate handler
@@ -166,30 +242,232 @@ class WorkerPoolServer:
         self._restart_handler.close()
         if self._healthcheck:
             self._healthcheck.cancel()
+        if self._autoscale:
+            self._autoscale.cancel()
+        if self._restart_task:
+            self._restart_task.cancel()
         self._sock.close()
         if self._supervisor:
             self._supervisor.stop()
         self._terminate()
 
-    def broadcast(self, command: bytes) -> None:
+    def broadcast(self, command: bytes, *data: bytes) -> None:
         """ Broadcast notification to workers
         """
         try:
-            self._sock.send(command, zmq.NOBLOCK)
+            if data:
+                self._sock.send_multipart([command, *data], zmq.NOBLOCK)
+            else:
+                self._sock.send(command, zmq.NOBLOCK)
         except zmq.ZMQError as err:
 
             if err.errno != zmq.EAGAIN:
                 LOGGER.error("Broadcast Error %s\n%s", err, traceback.format_exc())
 
     def restart(self) -> None:
-        """ Send restart command
+        """ Restart workers
+
+            Workers are restarted by batches, see `rolling_restart`,
+            unless the batch size is 0 or in prefork mode.
+
+            A restart requested while restarting supersedes the
+            running restart.
+        """
+        if self._restart_task and not self._restart_task.done():
+            LOGGER.info("Restart requested while restarting, starting over")
+            self._restart_task.cancel()
+
+        if self._prefork:
+            self._restart_task = asyncio.ensure_future(self.restart_pool())
+            return
+
+        self.refresh_spares()
+        if self._restart_batch_size > 0 and self._supervisor:
+            self._restart_task = asyncio.ensure_future(self.rolling_restart())
+        else:
+            self._restart_status = dict(status='done', started=time.time(), total=self._num_workers)
+            self.broadcast(b'RESTART')
+
+    async def _wait_replacements(self, count: int, since: float) -> bool:
+        """ Wait until `count` workers started after `since`
+            are ready
+
+            Return False on timeout.
+        """
+        supervisor = cast(Supervisor, self._supervisor)
+        deadline = time.monotonic() + self._restart_timeout
+        while time.monotonic() < deadline:
+            workers = supervisor.workers(warmed=self._restart_warmup)
+            if sum(1 for t in workers.values() if t >= since) >= count:
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+    async def _run_restart(self, restart: Callable[[dict], Awaitable[None]]) -> None:
+        """ Run restart and record its progress
+        """
+        status = self._restart_status = dict(
+            status='running',
+            started=time.time(),
+            finished=None,
+            total=self._num_workers,
+            restarted=0,
+            batch_size=self._restart_batch_size,
+            warmup=self._restart_warmup,
+            timeouts=0,
+        )
+        try:
+            await restart(status)
+            status['status'] = 'done'
+            LOGGER.info("Restarted %s workers in %.1f s", status['restarted'], time.time() - status['started'])
+        except asyncio.CancelledError:
+            status['status'] = 'cancelled'
+            raise
+        except Exception:
+            status['status'] = 'failed'
+            LOGGER.error("Restart failed:\n%s", traceback.format_exc())
+        finally:
+            status['finished'] = time.time()
+
+    async def rolling_restart(self) -> None:
+        """ Restart workers by batches
+
+            Workers of a batch exit gracefully on a 'RESTART'
+            notification targeting their pids and are replaced by
+            the pool. The next batch is restarted when the replacements
+            are ready - and have completed their warm-up if required -
+            or when the batch timeout is reached.
+
+            Oldest workers are restarted first.
+        """
+        supervisor = cast(Supervisor, self._supervisor)
+
+        async def _restart(status: dict) -> None:
+            since = status['started']
+            restarted: Set[int] = set()
+            while True:
+                # Workers started before the restart, recomputed at each
+                # batch for taking exited workers into account
+                workers = supervisor.workers()
+                old = sorted((pid for pid, t in workers.items() if t < since and pid not in restarted), key=workers.get)
+                if not old:
+                    break
+                batch = old[:self._restart_batch_size]
+                LOGGER.info("Rolling restart: restarting workers %s", batch)
+                self.broadcast(b'RESTART', ','.join(str(pid) for pid in batch).encode())
+                restarted.update(batch)
+                status.update(total=len(restarted) + len(old) - len(batch))
+                if not await self._wait_replacements(len(restarted), since):
+                    LOGGER.warning("Rolling restart: replacements not ready after %s s", self._restart_timeout)
+                    status['timeouts'] += 1
+                status['restarted'] = len(restarted)
+
+        await self._run_restart(_restart)
+
+    async def restart_pool(self) -> None:
+        """ Restart the pool process
+
+            In prefork mode, workers are forked from an already
+            initialized pool process: restarting workers is not enough
+            for taking plugins or preloaded projects changes into account.
+
+            A new pool process is started and, once its workers are
+            ready, the current pool is drained: it stops replacing
+            workers which exit gracefully on the 'RESTART' notification.
+            Note that both pools run at the same time while the new
+            pool is starting.
+
+            If the restart is superseded while waiting for the new
+            workers, the previous pools are drained anyway.
+        """
+        async def _restart(status: dict) -> None:
+            # Forget about terminated pools
+            self._pools[:] = [p for p in self._pools if p.exitcode is None]
+            self._drained.intersection_update(p.pid for p in self._pools)
+
+            LOGGER.info("Restarting worker pool")
+            if self._conn:
+                self._conn.close()
+            self._pool, self._conn = start_pool_process(self._num_workers)
+            self._pools.append(self._pool)
+
+            try:
+                if self._supervisor and not await self._wait_replacements(self._num_workers, status['started']):
+                    LOGGER.warning("Pool restart: new workers not ready after %s s", self._restart_timeout)
+                    status['timeouts'] += 1
+            finally:
+                status['restarted'] = self._drain_pools()
+
+        await self._run_restart(_restart)
+
+    def _drain_pools(self) -> int:
+        """ Drain all pools but the current one
+
+            Return the number of workers asked to exit.
         """
-        self.broadcast(b'RESTART')
+        restarted = 0
+        for pool in self._pools:
+            if pool is self._pool or pool.pid in self._drained or pool.exitcode is not None:
+                continue
+            try:
+                workers = [p.pid for p in psutil.Process(pool.pid).children()]
+                os.kill(cast(int, pool.pid), signal.SIGUSR1)
+            except (psutil.NoSuchProcess, ProcessLookupError):
+                continue
+            self._drained.add(cast(int, pool.pid))
+            self.broadcast(b'RESTART', ','.join(str(pid) for pid in workers).encode())
+            restarted += len(workers)
+        return restarted
+
+    def restart_report(self) -> Optional[dict]:
+        """ Return the progress of the last restart
+        """
+        return self._restart_status
+
+    def refresh_spares(self) -> None:
+        """ Replace spare workers of the pool
+        """
+        if self._conn:
+            try:
+                self._conn.send(('refresh_spares',))
+            except OSError as err:
+                LOGGER.error("Failed to refresh spare workers: %s", err)
+
+    def resize(self, num_workers: int) -> None:
+        """ Change the number of workers
+
+            When shrinking, idle workers exit gracefully.
+        """
+        if num_workers == self._num_workers or not self._conn:
+            return
+        busy = self._supervisor.busy_pids() if self._supervisor else []
+        try:
+            self._conn.send(('resize', num_workers, busy))
+        except OSError as err:
+            LOGGER.error("Failed to resize worker pool: %s", err)
+            return
+        self._num_workers = num_workers
 
     @property
     def num_workers(self) -> int:
         return self._num_workers
 
+    def autoscale_report(self) -> Optional[dict]:
+        """ Return autoscaling status
+        """
+        return self._autoscaler.report() if self._autoscaler else None
+
+    @property
+    def num_kills(self) -> int:
+        """ Return the number of workers killed by the supervisor
+        """
+        return self._supervisor.num_kills if self._supervisor else 0
+
+    def respawn_stats(self) -> dict:
+        """ Return workers respawn latency statistics
+        """
+        return self._supervisor.respawn_stats() if self._supervisor else {}
+
     async def get_reports(self) -> list[dict]:
         """ Collect reports
         """
@@ -209,18 +487,53 @@ class WorkerPoolServer:
                 break
         return supervisor.reports
 
+    async def cache_command(self, command: bytes, key: str) -> list[dict]:
+        """ Broadcast a cache command to workers and collect
+            the results
+
+            Workers run commands in idle cycles, results are
+            collected until the request timeout.
+        """
+        if self._supervisor is None:
+            return []
+
+        supervisor = cast(Supervisor, self._supervisor)
+
+        command_id = uuid.uuid4().hex.encode()
+        supervisor.start_command(command_id)
+        try:
+            self.broadcast(command, command_id, key.encode())
+            so_far = 0
+            while len(supervisor.results(command_id)) < self._num_workers:
+                await asyncio.sleep(1)
+                so_far += 1
+                if so_far >= self._timeout:
+                    break
+            return [dict(pid=pid, **result) for pid, result in supervisor.results(command_id).items()]
+        finally:
+            supervisor.end_command(command_id)
+
     def check_oom_status(self):
         """Kill out-of-memory children
 
         This will kill the children using the most memory
         until the memory goes below high water mark
         """
-        # Compute memory used for all childs
+        # Compute memory used for all childs, including
+        # workers of draining pools
         def _mem_usage() -> Iterator[tuple[psutil.Process, float]]:
-            for p in psutil.Process(self._pool.pid).children():
-                mem = p.memory_percent()
-                mem += sum(pp.memory_percent() for pp in p.children(recursive=True))
-                yield (p, mem / 100.0)
+            for pool in self._pools:
+                try:
+                    children = psutil.Process(pool.pid).children()
+                except psutil.NoSuchProcess:
+                    continue
+                for p in children:
+                    try:
+                        mem = p.memory_percent()
+                        mem += sum(pp.memory_percent() for pp in p.children(recursive=True))
+                    except psutil.NoSuchProcess:
+                        continue
+                    yield (p, mem / 100.0)
 
         childs = list(_mem_usage())
 
@@ -249,14 +562,18 @@ def create_poolserver(numworkers: int) -> WorkerPoolServer:
         This ensure that sub-processes all always forked from
         the same parent context
     """
-    router = confservice['zmq']['bindaddr']
     broadcastaddr = confservice['zmq']['broadcastaddr']
     timeout = confservice['server'].getint('timeout')
+    grace_period = confservice['server'].getint('timeout_grace_period')
+    prefork = confservice['server'].getboolean('prefork')
 
     high_water_mark = float(confservice['server']['memory_high_water_mark'])
 
-    p = Process(target=run_worker_pool, args=(numworkers, broadcastaddr, router))
-    p.start()
+    autoscaler = create_autoscaler()
+    if autoscaler:
+        numworkers = autoscaler.clamp(numworkers)
+
+    p, conn = start_pool_process(numworkers)
 
     poolserver = WorkerPoolServer(
         broadcastaddr,
@@ -264,14 +581,112 @@ def create_poolserver(numworkers: int) -> WorkerPoolServer:
         timeout,
         numworkers,
         high_water_mark=high_water_mark,
+        grace_period=grace_period,
+        prefork=prefork,
+        conn=conn,
+        autoscaler=autoscaler,
+        autoscale_interval=confservice['server'].getint('autoscale_interval'),
+        restart_batch_size=confservice['server'].getint('restart_batch_size'),
+        restart_warmup=confservice['server'].getboolean('restart_warmup'),
+        restart_timeout=confservice['server'].getint('restart_timeout'),
     )
     return poolserver
 
 
-def run_worker_pool(numworkers: int, broadcastaddr: str, router: str) -> None:
+def create_autoscaler() -> Optional[Autoscaler]:
+    """ Create the autoscaling policy from configuration
+    """
+    conf = confservice['server']
+    if not conf.getboolean('autoscale'):
+        return None
+    return Autoscaler(
+        conf.getint('min_workers'),
+        conf.getint('max_workers'),
+        cooldown=conf.getint('autoscale_cooldown'),
+        up_threshold=conf.getfloat('autoscale_up_threshold'),
+        down_threshold=conf.getfloat('autoscale_down_threshold'),
+        max_wait=conf.getfloat('autoscale_max_wait'),
+        min_memory=conf.getfloat('autoscale_min_memory'),
+        max_cpu=conf.getfloat('autoscale_max_cpu'),
+    )
+
+
+def start_pool_process(numworkers: int) -> Tuple[BaseProcess, Connection]:
+    """ Start the worker pool process
+
+        The pool process is spawned: pools are restarted while the
+        server is running and must not inherit the server state
+        (event loop, listening sockets, zmq contexts...).
+
+        Return the process and the connection for
+        resizing the pool
+    """
+    router = confservice['zmq']['bindaddr']
+    broadcastaddr = confservice['zmq']['broadcastaddr']
+
+    ctx = multiprocessing.get_context('spawn')
+    reader, writer = ctx.Pipe(duplex=False)
+    p = ctx.Process(
+        target=_run_pool_process,
+        args=(config_to_dict(raw=True), numworkers, broadcastaddr, router, reader),
+    )
+    p.start()
+    reader.close()
+    return p, writer
+
+
+def _run_pool_process(config: Dict[str, Dict[str, str]], *args) -> None:
+    """ Pool process entry point
+
+        Restore the configuration of the server
+        then run the worker pool
+    """
+    load_configuration()
+    read_config_dict(config)
+    setup_log_handler(confservice.get('logging', 'level'))
+    run_worker_pool(*args)
+
+
+def prefork_server() -> None:
+    """ Initialize Qgis server in the pool process
+
+        Workers forked from the pool process will share
+        Qgis initialization and preloaded projects as copy-on-write
+        memory.
+    """
+    from qgis.PyQt.QtCore import QThreadPool
+
+    LOGGER.info("Prefork: initializing Qgis server in pool process")
+    QgsRequestHandler.init_server()
+
+    # Threads are not inherited by forked processes, make sure
+    # that no pending jobs are left in Qt pools and warn about
+    # Python threads started at initialization (i.e from plugins)
+    QThreadPool.globalInstance().waitForDone()
+    if threading.active_count() > 1:
+        LOGGER.warning(
+            "Prefork: %s threads running in pool process, they will not be available in workers",
+            threading.active_count() - 1,
+        )
+
+    # Move objects to permanent generation so that garbage
+    # collection in workers do not touch shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker_pool(
+    numworkers: int,
+    broadcastaddr: str,
+    router: str,
+    conn: Optional[Connection] = None,
+) -> None:
     """ Run a qgis worker pool
 
         Ensure that child processes run in the main thread
+
+        :param conn: Connection receiving commands from the
+            pool server
     """
 
     # Try to exit gracefully
@@ -279,21 +694,58 @@ def run_worker_pool(numworkers: int, broadcastaddr: str, router: str) -> None:
         # print("Caught signal: %s" % signum, file=sys.stderr)
         raise SystemExit()
 
+    prefork = confservice.getboolean('server', 'prefork')
+    if prefork:
+        prefork_server()
+
+    spares = confservice.getint('server', 'spare_workers')
+
     LOGGER.info("Starting worker pool")
     pool = Pool(
         numworkers,
         target=QgsRequestHandler.run,
         args=(router,),
-        kwargs={'broadcastaddr': broadcastaddr},
+        # Project change notifications are forwarded
+        # by the server through the broadcast
+        kwargs={'broadcastaddr': broadcastaddr, 'notifications': True},
+        # Prefork requires that workers are forked from
+        # the pool process
+        start_method='fork' if prefork else None,
+        # Spare workers are initialized before being
+        # activated as replacement
+        initializer=QgsRequestHandler.init_server,
+        spares=spares,
+        # Spare workers load scheduled projects while
+        # waiting for activation
+        warmup=QgsRequestHandler.warmup_spare,
     )
 
+    # Stop replacing workers, used for restarting the pool
+    def drain_signal(signum, frames):
+        LOGGER.info("Draining worker pool")
+        pool.drain()
+
     signal.signal(signal.SIGTERM, term_signal)
+    signal.signal(signal.SIGUSR1, drain_signal)
 
     try:
         while True:
             if pool.critical_failure:
                 raise RuntimeError("Server aborting prematurely !")
             pool.maintain_pool()
+            if pool.draining and len(pool) == 0:
+                LOGGER.info("Worker pool drained")
+                break
+            try:
+                while conn and conn.poll():
+                    command, *args = conn.recv()
+                    if command == 'resize':
+                        pool.resize(*args)
+                    elif command == 'refresh_spares':
+                        pool.refresh_spares()
+            except EOFError:
+                # Closed by the pool server
+                conn = None
             time.sleep(0.1)
     except (KeyboardInterrupt, SystemExit):
         LOGGER.warning("Pool Interrupted")
@@ -15,19 +15,21 @@
         - https://qgis.org/pyqgis/master/server/QgsBufferServerRequest.html
 """
 import hashlib
+import json
 import logging
 import os
+import threading
 import traceback
 
 from contextlib import contextmanager
 from datetime import datetime
 from time import time
-from typing import Callable, Dict, Generator, Optional, Tuple
+from typing import Callable, Dict, Generator, Optional, Sequence, Tuple, cast
 
 import psutil
 
-from qgis.core import QgsProject
-from qgis.PyQt.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from qgis.core import QgsFeedback, QgsProject
+from qgis.PyQt.QtCore import QBuffer, QByteArray, QIODevice, Qt, QThreadPool
 from qgis.server import (
     QgsServer,
     QgsServerException,
@@ -35,9 +37,11 @@ from qgis.server import (
     QgsServerResponse,
 )
 
-from .config import configure_qgis_api, confservice, qgis_api_endpoints
+from .config import configure_qgis_api, confservice, qgis_api_endpoints, request_deadline
+from .isolation import IsolationRule, match_rules, parse_rules, run_isolated
 from .plugins import load_plugins
 from .qgscache.cachemanager import (
+    CacheDetails,
     CacheType,
     PathNotAllowedError,
     QgsCacheManager,
@@ -48,10 +52,15 @@ from .qgscache.cachemanager import (
     preload_projects,
 )
 from .qgscache.observer import Client as CacheObserver
-from .zeromq.worker import RequestHandler, run_worker
+from .utils.memory import release_memory
+from .zeromq.worker import RecyclePolicy, RequestHandler, run_worker
 
 LOGGER = logging.getLogger('SRVLOG')
 
+# Interval in seconds between project access reports
+# to the cache observer
+ACCESS_REPORT_INTERVAL = 30
+
 HTTP_METHODS = {
     'GET': QgsServerRequest.GetMethod,
     'PUT': QgsServerRequest.PutMethod,
@@ -107,6 +116,12 @@ class Response(QgsServerResponse):
         if self._metadata_fn:
             return self._metadata_fn()
 
+    def feedback(self) -> QgsFeedback:
+        """ Return the feedback object used for cancelling
+            the request processing
+        """
+        return self._handler.feedback
+
     def setExtraHeader(self, key: str, value: str):
         # Keep extra headers so we may
         # set them again on clear()
@@ -134,6 +149,14 @@ class Response(QgsServerResponse):
 
             Headers will be written at the first call to flush()
         """
+        # A started response is not cancelled: the client could not
+        # tell a truncated response from a complete one
+        self._handler.disarm_deadline()
+        if self._handler.cancelled:
+            # Request has been cancelled: drop the data,
+            # the error is handled when Qgis returns
+            self.truncate()
+            return
         try:
             meta = self.get_metadata()
 
@@ -192,6 +215,7 @@ class Response(QgsServerResponse):
         self._handler.headers.pop(key, None)
 
     def sendError(self, code: int, message: Optional[str] = None):
+        self._handler.disarm_deadline()
         try:
             if not self._handler.header_written:
                 LOGGER.error("%s (%s)", message, code)
@@ -230,7 +254,19 @@ class QgsRequestHandler(RequestHandler):
     _advanced_report: Optional[psutil.Process] = None
     _cache_service: QgsCacheManager
     _cache_check_interval: int
+    _cache_refresh_budget: float
     _default_project_location: Optional[str] = None
+    _request_deadline: float = 0
+    _num_cancelled: int = 0
+    _isolation_rules: Sequence[IsolationRule] = ()
+    _num_isolated: int = 0
+    _cache_observer: Optional[CacheObserver] = None
+    _last_access_report: float = 0
+
+    cancelled: bool = False
+    feedback: Optional[QgsFeedback] = None
+    watchdog: Optional[threading.Timer] = None
+    deadline_lock: Optional[threading.Lock] = None
 
     @classmethod
     def init_server(cls):
@@ -256,21 +292,19 @@ class QgsRequestHandler(RequestHandler):
         if cache_config.getboolean('disable_getprint'):
             os.environ['QGIS_SERVER_DISABLE_GETPRINT'] = 'yes'
 
+        # Cooperative cancellation of requests, the deadline must expire
+        # before the front-end timeout for the client to get the reply
+        cls._request_deadline = request_deadline()
+
+        # Heavy requests run in isolated subprocesses
+        cls._isolation_rules = parse_rules(confservice.get('server', 'isolated_requests'))
+
         # Get refresh interval
         cls._cache_service = get_cacheservice()
         cls._cache_check_interval = cache_config.getint('check_interval')
+        cls._cache_refresh_budget = cache_config.getint('refresh_budget') / 1000.
         cls._cache_last_check = time()
 
-        cls._pid = os.getpid()
-        if cache_config.getboolean('advanced_report'):
-            cls._advanced_report = psutil.Process(cls._pid)
-
-        # Attach cache observer
-        if cache_config.getboolean('has_observers'):
-            LOGGER.info("Attaching worker cache observer")
-            cls._cache_observer = CacheObserver()
-            cls._cache_service.add_observer(cls._cache_observer.observe)
-
         # Configure qgis api
         for name, _ in qgis_api_endpoints(enabled_only=False):
             configure_qgis_api(name)
@@ -298,23 +332,107 @@ class QgsRequestHandler(RequestHandler):
 
         setattr(cls, 'qgis_server', qgsserver)
 
+    @classmethod
+    def init_worker(cls):
+        """ Initialize worker process
+
+            Initialize per-process resources: this must be called
+            in the worker process, i.e after forking.
+        """
+        cache_config = confservice['projects.cache']
+
+        cls._pid = os.getpid()
+        if cache_config.getboolean('advanced_report'):
+            cls._advanced_report = psutil.Process(cls._pid)
+
+        # Attach cache observer
+        if cache_config.getboolean('has_observers'):
+            LOGGER.info("Attaching worker cache observer")
+            cls._cache_observer = CacheObserver()
+            cls._cache_service.add_observer(cls._cache_observer.observe)
+
     @classmethod
     def default_project_location(cls) -> Optional[str]:
         return cls._default_project_location
 
     @classmethod
-    def refresh_cache(cls):
-        if cls._cache_check_interval <= 0 or time() - cls._cache_last_check < cls._cache_check_interval:
+    def refresh_cache(cls, idle: bool):
+        """ Refresh the cache incrementally
+
+            Entries are validated round-robin and changed entries are
+            reloaded in idle cycles within the refresh time budget. Meanwhile,
+            the current version of the projects are served until the
+            cache max staleness is reached.
+        """
+        if cls._cache_check_interval <= 0:
             return
-        LOGGER.debug("Refreshing cache")
+
+        cache = cls._cache_service
+        if time() - cls._cache_last_check >= cls._cache_check_interval:
+            LOGGER.debug("Refreshing cache")
+            cache.start_validation()
+            cls._cache_last_check = time()
+
+        budget = cls._cache_refresh_budget if idle else 0
+        cache.validate(budget)
+
         iface = cls.qgis_server.serverInterface()
-        for (key, state) in cls._cache_service.refresh():
-            # Remove from Qgis server ConfigCache
-            if state == UpdateState.UPDATED:
-                details = cls._cache_service.peek(key)
+        for _, state, details in cache.reload_pending(budget):
+            # Remove updated or removed projects from Qgis server ConfigCache
+            if state != UpdateState.UNCHANGED:
                 iface.removeConfigCacheEntry(details.project.fileName())
 
-        cls._cache_last_check = time()
+    @classmethod
+    def invalidate(cls, data: bytes):
+        """ Handle project change notifications
+        """
+        try:
+            payload = json.loads(data)
+            if 'key' in payload:
+                # Update detected by another worker
+                cls._cache_service.invalidate_key(
+                    payload['key'],
+                    datetime.fromisoformat(payload['modified_time']),
+                )
+            else:
+                cls._cache_service.invalidate_notified(payload)
+        except Exception:
+            LOGGER.error("Invalid change notification: %s\n%s", data, traceback.format_exc())
+
+    @classmethod
+    def run_command(cls, command: bytes, data: bytes) -> Dict:
+        """ Run cache commands
+
+            * PRELOAD: load the project in the LRU cache
+            * EVICT: remove the project from the caches
+        """
+        key = data.decode()
+        cache = cls._cache_service
+        iface = cls.qgis_server.serverInterface()
+        if command == b'PRELOAD':
+            try:
+                project, updated = cache.lookup(key)
+            except FileNotFoundError:
+                return dict(key=key, status='not_found')
+            except PathNotAllowedError:
+                return dict(key=key, status='forbidden')
+            except (StrictCheckingError, UnreadableResourceError) as err:
+                return dict(key=key, status='invalid', error=str(err))
+            if updated:
+                iface.removeConfigCacheEntry(project.fileName())
+            LOGGER.info("Preloaded project '%s' (%s)", key, updated.name)
+            return dict(key=key, status='ok', state=updated.name.lower())
+        elif command == b'EVICT':
+            details = cache.evict(key)
+            if not details:
+                return dict(key=key, status='not_found')
+            LOGGER.info("Evicted project '%s' from cache", key)
+            iface.removeConfigCacheEntry(details.project.fileName())
+            # Release project before returning memory
+            del details
+            release_memory()
+            return dict(key=key, status='ok')
+        return super().run_command(command, data)
 
     @classmethod
     def cache_lookup(cls, key: str) -> Tuple[QgsProject, UpdateState]:
@@ -326,7 +444,61 @@ class QgsRequestHandler(RequestHandler):
 
             At this time request has been replied and worker is not busy anymore
         """
-        cls.refresh_cache()
+        cls.refresh_cache(idle)
+        if idle:
+            cls.expire_cache()
+            cls.warmup_cache()
+        cls.report_accesses()
+
+    @classmethod
+    def is_warmed(cls) -> bool:
+        """ The worker is warmed when all scheduled
+            projects are loaded
+        """
+        return cls._cache_service.num_scheduled() == 0
+
+    @classmethod
+    def warmup_cache(cls):
+        """ Load scheduled projects from the preload
+            configuration and the hot set
+        """
+        for key, state in cls._cache_service.warmup(cls._cache_refresh_budget):
+            LOGGER.info("Loaded scheduled project '%s' (%s)", key, state.name)
+
+    @classmethod
+    def warmup_spare(cls) -> bool:
+        """ Load scheduled projects in spare workers
+
+            Return True when all scheduled projects are loaded
+        """
+        cls.warmup_cache()
+        return cls.is_warmed()
+
+    @classmethod
+    def report_accesses(cls):
+        """ Report project accesses to the cache observer
+        """
+        if not cls._cache_observer or time() - cls._last_access_report < ACCESS_REPORT_INTERVAL:
+            return
+        cls._last_access_report = time()
+        counts = cls._cache_service.pop_access_counts()
+        if counts:
+            cls._cache_observer.send_access_counts(counts)
+
+    @classmethod
+    def expire_cache(cls):
+        """ Evict projects not accessed since the cache idle ttl
+        """
+        expired = cls._cache_service.expire_entries()
+        if not expired:
+            return
+        iface = cls.qgis_server.serverInterface()
+        for key, details in expired:
+            LOGGER.info("Evicting idle project '%s' from cache", key)
+            iface.removeConfigCacheEntry(details.project.fileName())
+        # Release projects before returning memory
+        expired.clear()
+        release_memory()
 
     @classmethod
     def get_modified_time(cls, key: str, from_cache: bool = True) -> datetime:
@@ -381,16 +553,31 @@ class QgsRequestHandler(RequestHandler):
         return etag == "*" or etag == computed_etag
 
     @staticmethod
-    def run(router: str, identity: str = "", **kwargs):
+    def run(router: str, identity: str = "", notifications: bool = False, **kwargs):
         """ Run qgis server worker loop
+
+            :param notifications: True if project change notifications
+                are forwarded through the broadcast
         """
         QgsRequestHandler.init_server()
+        QgsRequestHandler.init_worker()
+
+        if notifications:
+            QgsRequestHandler._cache_service.enable_notifications()
+
+        conf = confservice['server']
+        recycle = RecyclePolicy(
+            max_requests=conf.getint('max_requests'),
+            max_rss_growth=conf.getint('max_rss_growth') * 1024 * 1024,
+            max_age=conf.getint('max_age'),
+        )
 
         run_worker(
             router,
             QgsRequestHandler,
             identity=bytes(identity.encode('ascii')),
             postprocess=QgsRequestHandler.post_process,
+            recycle=recycle,
             **kwargs,
         )
 
@@ -424,6 +611,63 @@ class QgsRequestHandler(RequestHandler):
                 LOGGER.debug("[DEBUG OFF][REQ_ID: %s]", request_id or "-")
                 LOGGER.setLevel(previous_level)
 
+    def cancel(self):
+        """ Cancel the request
+
+            Called from the watchdog thread when the request deadline
+            is reached: the Qgis processing is notified through the
+            response feedback and the remaining output is dropped.
+
+            Requests are not cancelled once the response is started.
+        """
+        with cast(threading.Lock, self.deadline_lock):
+            if self.watchdog is None:
+                # Disarmed
+                return
+            self.cancelled = True
+        LOGGER.error("Request deadline reached (%ss), cancelling request %s", self._request_deadline, self.msgid)
+        if self.feedback:
+            self.feedback.cancel()
+
+    @contextmanager
+    def request_deadline(self) -> Generator[None, None, None]:
+        """ Watch the request deadline
+        """
+        if self._request_deadline <= 0:
+            yield
+            return
+
+        self.feedback = QgsFeedback()
+        self.deadline_lock = threading.Lock()
+        self.watchdog = threading.Timer(self._request_deadline, self.cancel)
+        self.watchdog.daemon = True
+        self.watchdog.start()
+        try:
+            yield
+        finally:
+            self.disarm_deadline()
+
+    def disarm_deadline(self):
+        """ Stop watching the request deadline
+
+            The request cannot be cancelled afterwards, check
+            `cancelled` for knowing if it was cancelled before.
+        """
+        watchdog = self.watchdog
+        if watchdog:
+            with cast(threading.Lock, self.deadline_lock):
+                self.watchdog = None
+            watchdog.cancel()
+
+    def send_cancelled(self):
+        """ Reply to a cancelled request
+        """
+        if not self.header_written:
+            QgsRequestHandler._num_cancelled += 1
+            self.status_code = 504
+            self.headers = {}
+            self.send(b"Request timeout error")
+
     def handle_message(self):
         """ Override this method to handle_messages
         """
@@ -470,7 +714,11 @@ class QgsRequestHandler(RequestHandler):
                         response.finish()
                         return
 
-            self.handle_qgis_request(ogc_scheme, project_location, request, response, request_id)
+            with self.request_deadline():
+                self.handle_qgis_request(ogc_scheme, project_location, request, response, request_id)
+
+            if self.cancelled:
+                self.send_cancelled()
 
     def handle_qgis_request(
         self,
@@ -492,13 +740,14 @@ class QgsRequestHandler(RequestHandler):
 
         if not project_location:
             # Pass request directly
-            self.qgis_server.handleRequest(request, response)
+            self.run_qgis_request(request, response)
             return
 
         # Handle cached project
         iface = self.qgis_server.serverInterface()
         try:
             project, updated = self.cache_lookup(project_location)
+            self._cache_service.resolve_layers(project, request.parameter)
             config_path = project.fileName()
             if updated:
                 # Needed to cleanup cached capabilities
@@ -508,8 +757,9 @@ class QgsRequestHandler(RequestHandler):
             last_modified = self.get_modified_time(project_location)
 
             # Set the project uri in separate header, this
-            # is useful for invalidating front-end cache
-            response.setExtraHeader('X-Map-Id', project_location)
+            # is useful for invalidating front-end cache: use the
+            # canonical key which is the key notified to observers
+            response.setExtraHeader('X-Map-Id', self._cache_service.canonical_key(project_location))
             response.setExtraHeader('Last-Modified', last_modified.astimezone().isoformat())
 
             if request_id:
@@ -534,26 +784,63 @@ class QgsRequestHandler(RequestHandler):
         else:
             # See https://github.com/qgis/QGIS/pull/9773
             iface.setConfigFilePath(config_path)
-            self.qgis_server.handleRequest(request, response, project=project)
+            self.run_qgis_request(request, response, project)
+
+    def run_qgis_request(self, request: Request, response: Response, project: Optional[QgsProject] = None):
+        """ Run the request with Qgis server
+
+            Requests matching the isolation rules are run
+            in a forked subprocess.
+        """
+        def _handle():
+            if project is not None:
+                self.qgis_server.handleRequest(request, response, project=project)
+            else:
+                self.qgis_server.handleRequest(request, response)
+
+        def _handle_isolated():
+            # The deadline is watched by the parent, the lock
+            # may have been held by the watchdog thread when forking
+            self.watchdog = None
+            self.deadline_lock = None
+            _handle()
+
+        if self._isolation_rules and match_rules(self._isolation_rules, request.parameter):
+            QgsRequestHandler._num_isolated += 1
+            # Threads are not inherited by forked processes, make sure
+            # that no pending jobs are left in Qt pools
+            QThreadPool.globalInstance().waitForDone()
+            run_isolated(self, _handle_isolated, cancelled=lambda: self.cancelled and not self.header_written)
+        else:
+            _handle()
 
     @classmethod
     def get_report(cls):
         report = super().get_report()
 
-        def _to_json(key: str, project: QgsProject, static: bool) -> Dict:
+        cacheservice = get_cacheservice()
+
+        def _to_json(key: str, details: CacheDetails, static: bool) -> Dict:
+            project = details.project
             return dict(
                 key=key,
+                aliases=cacheservice.key_aliases(key),
                 filename=project.fileName(),
                 last_modified=project.lastModified().toString(Qt.ISODate),
                 num_layers=project.count(),
                 static=static,
+                weight=details.weight,
             )
 
-        items = {k: (d, False) for k, d in get_cacheservice().items(CacheType.LRU)}
-        items.update((k, (d, True)) for (k, d) in get_cacheservice().items(CacheType.STATIC))
+        items = {k: (d, False) for k, d in cacheservice.items(CacheType.LRU)}
+        items.update((k, (d, True)) for (k, d) in cacheservice.items(CacheType.STATIC))
 
         report.update(
-            cache=[_to_json(k, d.project, static) for (k, (d, static)) in items.items()],
+            cache=[_to_json(k, d, static) for (k, (d, static)) in items.items()],
+            cache_weight=cacheservice.weight(),
+            cache_scheduled=cacheservice.num_scheduled(),
+            cancelled=cls._num_cancelled,
+            isolated=cls._num_isolated,
         )
         return report
 
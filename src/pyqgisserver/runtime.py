@@ -22,6 +22,7 @@ import tornado.web
 
 from .config import confservice, qgis_api_endpoints
 from .handlers import (
+    CatalogHandler,
     LandingPage,
     NotFoundHandler,
     OAPIHandler,
@@ -74,6 +75,13 @@ def configure_handlers(client: client.AsyncClient) -> List:
         rv.update(*args, **kwargs)
         return rv
 
+    # Project catalog
+    if confservice.getboolean('catalog', 'enabled'):
+        from .catalog import CatalogIndex, catalog_database
+        endpoint = '/' + confservice.get('catalog', 'endpoint').strip('/')
+        index = CatalogIndex(catalog_database(), confservice.get('projects.cache', 'rootdir'))
+        handlers.append((rf"{endpoint}(/.*)?", CatalogHandler, dict(index=index, endpoint=endpoint)))
+
     add_handler(r"/ows/?", OwsHandler, _ows_args(getfeaturelimit=cfg.getint('getfeaturelimit')))
 
     wfs3_api_endpoints = [
@@ -216,6 +224,7 @@ def run_server(port: int, address: str = "", user: Optional[str] = None, workers
     broker_pr = None
     cache_observer = None
     management = None
+    catalog_indexer = None
 
     # Setup ssl config
     if confservice.getboolean('server', 'ssl'):
@@ -262,11 +271,18 @@ def run_server(port: int, address: str = "", user: Optional[str] = None, workers
 
             # Start cache observer
             nonlocal cache_observer
-            cache_observer = start_cache_observer()
+            cache_observer = start_cache_observer(worker_pool.broadcast if worker_pool else None)
 
             if management:
                 management.cache_observer = cache_observer
 
+            # Start catalog indexer, the catalog is served by the
+            # front-end even if workers run in separate processes
+            if confservice.getboolean('catalog', 'enabled'):
+                from .catalog import start_catalog_indexer
+                nonlocal catalog_indexer
+                catalog_indexer = start_catalog_indexer()
+
             event = asyncio.Event()
 
             loop = asyncio.get_running_loop()
@@ -318,6 +334,8 @@ def run_server(port: int, address: str = "", user: Optional[str] = None, workers
         print(f"PID {os.getpid()}: Server instance stopped", flush=True)  # noqa: T201
     if cache_observer:
         cache_observer.stop()
+    if catalog_indexer:
+        catalog_indexer.stop()
     if worker_pool:
         print("Stopping workers", flush=True)  # noqa: T201
         worker_pool.terminate()
@@ -0,0 +1,133 @@
+#
+# Copyright 2025 3liz
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Compare project cache eviction policies on a recorded access trace
+
+    Traces are recorded by workers when the `projects.cache:trace_file`
+    option is set, each line is a tab separated record of:
+
+        timestamp  key  load_time  weight
+
+    Usage:
+
+        python -m pyqgisserver.utils.cachesim TRACE --size 10 --max-weight 2000
+"""
+import sys
+
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    TextIO,
+    Union,
+)
+
+from .gdsf import gdsfcache
+from .lru import lrucache
+
+
+class TraceEntry(NamedTuple):
+    key: str
+    load_time: float
+    weight: int
+
+
+class SimResult(NamedTuple):
+    policy: str
+    requests: int
+    hits: int
+    load_time: float
+    p99: float
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.requests if self.requests else 0.
+
+
+def read_trace(fp: TextIO) -> Iterator[TraceEntry]:
+    """ Read access trace
+    """
+    for line in fp:
+        fields = line.split('\t')
+        if len(fields) != 4:
+            continue
+        _, key, load_time, weight = fields
+        yield TraceEntry(key, float(load_time), int(weight))
+
+
+def create_cache(policy: str, size: int, max_weight: int = 0) -> Union[lrucache, gdsfcache]:
+    """ Create a cache for the given eviction policy
+    """
+    def weigher(e: TraceEntry) -> int:
+        return e.weight
+
+    if policy == 'lru':
+        return lrucache(size, max_weight=max_weight, weigher=weigher)
+    elif policy == 'gdsf':
+        return gdsfcache(size, max_weight=max_weight, weigher=weigher, coster=lambda e: e.load_time)
+    raise ValueError(f"Unknown eviction policy '{policy}'")
+
+
+def simulate(policy: str, trace: Iterable[TraceEntry], size: int, max_weight: int = 0) -> SimResult:
+    """ Replay the trace and return the load latency statistics
+    """
+    cache = create_cache(policy, size, max_weight)
+    latencies: List[float] = []
+    hits = 0
+    for entry in trace:
+        if entry.key in cache:
+            cache[entry.key]
+            hits += 1
+            latencies.append(0.)
+        else:
+            cache[entry.key] = entry
+            latencies.append(entry.load_time)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.
+    return SimResult(
+        policy=policy,
+        requests=len(latencies),
+        hits=hits,
+        load_time=sum(latencies),
+        p99=p99,
+    )
+
+
+POLICIES = ('lru', 'gdsf')
+
+
+def compare(trace: List[TraceEntry], size: int, max_weight: int = 0) -> Dict[str, SimResult]:
+    return {policy: simulate(policy, trace, size, max_weight) for policy in POLICIES}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare cache eviction policies')
+    parser.add_argument('trace', metavar='PATH', help="Access trace file")
+    parser.add_argument('--size', type=int, default=10, help="Cache size")
+    parser.add_argument('--max-weight', type=int, default=0, metavar='MB', help="Cache max weight in MB")
+
+    args = parser.parse_args()
+
+    with open(args.trace) as fp:
+        trace = list(read_trace(fp))
+
+    results = compare(trace, args.size, args.max_weight * 1024 * 1024)
+
+    print(f"{'policy':<8}{'requests':>10}{'hit ratio':>12}{'load time (s)':>16}{'p99 (s)':>10}")  # noqa: T201
+    for r in results.values():
+        print(  # noqa: T201
+            f"{r.policy:<8}{r.requests:>10}{r.hit_ratio:>12.3f}{r.load_time:>16.3f}{r.p99:>10.3f}",
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#
+# Copyright 2025 3liz
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Greedy-Dual-Size-Frequency cache implementation
+
+    Each item is given a priority:
+
+        H = L + frequency * cost / size
+
+    where L is an aging factor set to the priority of the last
+    evicted item. The item with the lowest priority is evicted
+    first: items that are costly to load, small and frequently
+    accessed are kept longer, aging prevents items that were
+    frequently accessed in the past from staying forever.
+
+    The interface is the same as `lrucache`.
+"""
+from collections import OrderedDict
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+V = TypeVar('V')
+K = TypeVar('K', bound=Hashable)
+
+
+class gdsfcache(Generic[K, V]):
+
+    def __init__(
+        self,
+        size: int,
+        max_weight: int = 0,
+        weigher: Optional[Callable[[V], int]] = None,
+        coster: Optional[Callable[[V], float]] = None,
+    ) -> None:
+        """ Create a GDSF cache
+
+            :param size: maximum number of elements in the cache
+            :param max_weight: maximum total weight of the elements in the cache,
+                a value of zero disables the weight limit.
+            :param weigher: return the weight (size) of a value
+            :param coster: return the cost for loading a value
+        """
+        # Keep recency order for iteration
+        self._table = OrderedDict[K, V]()
+        # Frequency and priority
+        self._entries: Dict[K, List] = {}
+        self._weights: Dict[K, int] = {}
+        self._weight = 0
+        self._max_weight = max_weight
+        self._weigher = weigher
+        self._coster = coster
+        self._aging = 0.
+        self._capacity = size
+
+        # Adjust the size
+        self.size(size)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def clear(self) -> None:
+        self._table.clear()
+        self._entries.clear()
+        self._weights.clear()
+        self._weight = 0
+        self._aging = 0.
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._table
+
+    def _priority(self, key: K, value: V, frequency: int) -> float:
+        cost = self._coster(value) if self._coster else 1.
+        size = max(self._weights.get(key, 1), 1)
+        return self._aging + frequency * cost / size
+
+    def _popitem(self) -> None:
+        """ Remove the item with the lowest priority
+        """
+        key = min(self._entries, key=lambda k: self._entries[k][1])
+        self._aging = self._entries[key][1]
+        del self[key]
+
+    def _overweight(self, weight: int) -> bool:
+        return self._max_weight > 0 and self._weight + weight > self._max_weight
+
+    def peek(self, key: K) -> Optional[V]:
+        """ Looks up a value in the cache without affecting cache order
+
+            Return None if the key doesn't exists
+        """
+        return self._table.get(key)
+
+    def __getitem__(self, key: K) -> V:
+        """ Look up the node
+        """
+        value = self._table[key]
+        self._table.move_to_end(key)
+        entry = self._entries[key]
+        entry[0] += 1
+        entry[1] = self._priority(key, value, entry[0])
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        """ Define a dict like setter
+        """
+        # Keep the frequency of replaced values
+        frequency = 1
+        if key in self._table:
+            frequency = self._entries[key][0]
+            del self[key]
+
+        weight = self._weigher(value) if self._weigher else 0
+
+        # Keep size and weight, note that an item heavier
+        # than the max weight is kept alone in the cache
+        while self._table and (len(self._table) >= self._capacity or self._overweight(weight)):
+            self._popitem()
+
+        self._table[key] = value
+        if weight:
+            self._weights[key] = weight
+            self._weight += weight
+        self._entries[key] = [frequency, self._priority(key, value, frequency)]
+
+    def __delitem__(self, key: K) -> None:
+        """ Remove from cache
+        """
+        del self._table[key]
+        del self._entries[key]
+        self._weight -= self._weights.pop(key, 0)
+
+    def __iter__(self) -> Iterator[K]:
+        """ Return an iterator that returns the keys in the cache.
+
+            Values are returned in order from the most recently to least recently used.
+        """
+        return reversed(self._table.keys())
+
+    def items(self) -> Iterator[Tuple[K, V]]:
+        """ Return an iterator that returns the (key, value) pairs in the cache.
+
+            Items are returned  in order from the most recently to least recently used.
+        """
+        return reversed(self._table.items())
+
+    def keys(self) -> Iterator[K]:
+        """ Return an iterator that returns the keys in the cache.
+
+            Keys are returned in order from the most recently to least recently used.
+        """
+        return reversed(self._table.keys())
+
+    def values(self) -> Iterator[V]:
+        """ Return an iterator that returns the values in the cache.
+
+            Values are returned  in order from the most recently to least recently used.
+        """
+        return reversed(self._table.values())
+
+    def size(self, size: Optional[int] = None) -> int:
+        """ Set the size of the cache
+
+            :param int size: maximum number of elements in the cache
+        """
+        if size is not None:
+            assert size > 0
+            while len(self._table) > size:
+                self._popitem()
+            self._capacity = size
+
+        return self._capacity
+
+    def weight(self, key: Optional[K] = None) -> int:
+        """ Return the weight of the item or the total
+            weight of the cache if key is None
+        """
+        if key is not None:
+            return self._weights.get(key, 0)
+        return self._weight
+
+    @property
+    def max_weight(self) -> int:
+        return self._max_weight
+
+    def priority(self, key: K) -> float:
+        """ Return the priority of the item
+        """
+        return self._entries[key][1]
@@ -9,6 +9,8 @@
 """
 from collections import OrderedDict
 from typing import (
+    Callable,
+    Dict,
     Generic,
     Hashable,
     Iterator,
@@ -23,8 +25,24 @@ K = TypeVar('K', bound=Hashable)
 
 class lrucache(Generic[K, V]):
 
-    def __init__(self, size: int) -> None:
+    def __init__(
+        self,
+        size: int,
+        max_weight: int = 0,
+        weigher: Optional[Callable[[V], int]] = None,
+    ) -> None:
+        """ Create a LRU cache
+
+            :param size: maximum number of elements in the cache
+            :param max_weight: maximum total weight of the elements in the cache,
+                a value of zero disables the weight limit.
+            :param weigher: return the weight of a value
+        """
         self._table = OrderedDict[K, V]()
+        self._weights: Dict[K, int] = {}
+        self._weight = 0
+        self._max_weight = max_weight
+        self._weigher = weigher
         self._capacity = size
 
         # Adjust the size
@@ -35,6 +53,17 @@ class lrucache(Generic[K, V]):
 
     def clear(self) -> None:
         self._table.clear()
+        self._weights.clear()
+        self._weight = 0
+
+    def _popitem(self) -> None:
+        """ Remove the least recently used item
+        """
+        key, _ = self._table.popitem(last=False)
+        self._weight -= self._weights.pop(key, 0)
+
+    def _overweight(self, weight: int) -> bool:
+        return self._max_weight > 0 and self._weight + weight > self._max_weight
 
     def __contains__(self, key: K) -> bool:
         return key in self._table
@@ -60,18 +89,25 @@ class lrucache(Generic[K, V]):
         # First, see if any value is stored under 'key' in the cache already.
         # If so we are going to replace that value with the new one.
         if key in self._table:
-            del self._table[key]
+            del self[key]
 
-        # Keep size
-        while len(self._table) >= self._capacity:
-            self._table.popitem(last=False)
+        weight = self._weigher(value) if self._weigher else 0
+
+        # Keep size and weight, note that an item heavier
+        # than the max weight is kept alone in the cache
+        while self._table and (len(self._table) >= self._capacity or self._overweight(weight)):
+            self._popitem()
 
         self._table.__setitem__(key, value)
+        if weight:
+            self._weights[key] = weight
+            self._weight += weight
 
     def __delitem__(self, key: K) -> None:
         """ Remove from _
         """
         del self._table[key]
+        self._weight -= self._weights.pop(key, 0)
 
     def __iter__(self) -> Iterator[K]:
         """ Return an iterator that returns the keys in the cache.
@@ -118,7 +154,19 @@ class lrucache(Generic[K, V]):
                 d = self._table
                 # Remove extra items
                 while len(d) > size:
-                    d.popitem(last=False)
+                    self._popitem()
             self._capacity = size
 
         return self._capacity
+
+    def weight(self, key: Optional[K] = None) -> int:
+        """ Return the weight of the item or the total
+            weight of the cache if key is None
+        """
+        if key is not None:
+            return self._weights.get(key, 0)
+        return self._weight
+
+    @property
+    def max_weight(self) -> int:
+        return self._max_weight
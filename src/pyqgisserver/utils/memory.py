@@ -0,0 +1,40 @@
+#
+# Copyright 2025 3liz
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Memory utilities
+"""
+import ctypes
+import ctypes.util
+import gc
+import logging
+
+from typing import Callable, Optional
+
+LOGGER = logging.getLogger('SRVLOG')
+
+
+def _get_malloc_trim() -> Optional[Callable[[int], int]]:
+    """ Return glibc malloc_trim if available
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+        return libc.malloc_trim
+    except (OSError, AttributeError, TypeError):
+        LOGGER.debug("malloc_trim not available")
+        return None
+
+
+_malloc_trim = _get_malloc_trim()
+
+
+def release_memory() -> None:
+    """ Run garbage collection and return free memory
+        to the operating system
+    """
+    gc.collect()
+    if _malloc_trim:
+        _malloc_trim(0)
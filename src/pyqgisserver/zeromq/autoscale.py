@@ -0,0 +1,148 @@
+#
+# Copyright 2025 3liz
+# Author David Marteau
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+""" Worker pool autoscaling policy
+
+    The number of workers is adjusted between a minimum and a maximum
+    from periodic samples of the load:
+
+    * The broker waiting queue length, the waiting time of the oldest
+      request and the number of rejected requests.
+    * The ratio of time spent by workers handling requests.
+    * The available memory and the cpu usage of the host.
+
+    Distinct thresholds for growing and shrinking give hysteresis: the
+    pool grows when the busy ratio is above the upper threshold or when
+    requests are waiting too long, and shrinks when the busy ratio stays
+    below the lower threshold for the cooldown delay. No scaling happens
+    during the cooldown delay after a scaling action.
+"""
+import logging
+import time
+
+from typing import (
+    Any,
+    Dict,
+    NamedTuple,
+    Optional,
+)
+
+LOGGER = logging.getLogger('SRVLOG')
+
+
+class Metrics(NamedTuple):
+    # Number of waiting requests
+    queue_length: int = 0
+    # Waiting time of the oldest request in seconds
+    queue_wait: float = 0.
+    # Number of rejected requests since the last sample
+    rejected: int = 0
+    # Ratio of time spent by workers handling requests
+    busy_ratio: float = 0.
+    # Fraction of available memory
+    memory_available: float = 1.
+    # Fraction of cpu usage
+    cpu_usage: float = 0.
+
+
+class Autoscaler:
+    """ Compute the number of workers from load metrics
+    """
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        cooldown: float = 60,
+        up_threshold: float = 0.8,
+        down_threshold: float = 0.3,
+        max_wait: float = 0.5,
+        min_memory: float = 0.1,
+        max_cpu: float = 0.9,
+    ):
+        """
+            :param cooldown: Delay in seconds between two scaling actions
+            :param up_threshold: Busy ratio above which the pool grows
+            :param down_threshold: Busy ratio below which the pool shrinks
+            :param max_wait: Waiting time in seconds above which the pool grows
+            :param min_memory: Fraction of available memory below which
+                the pool does not grow and may shrink
+            :param max_cpu: Fraction of cpu usage above which the pool does not grow
+        """
+        if min_workers < 1 or max_workers < min_workers:
+            raise ValueError(f"Invalid autoscaling range: {min_workers} - {max_workers}")
+        if down_threshold >= up_threshold:
+            raise ValueError("Autoscaling down threshold must be lower than up threshold")
+
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.cooldown = cooldown
+        self.up_threshold = up_threshold
+        self.down_threshold = down_threshold
+        self.max_wait = max_wait
+        self.min_memory = min_memory
+        self.max_cpu = max_cpu
+
+        # Let workers start before scaling
+        self._last_action = time.time()
+        self._last_scaling: Optional[float] = None
+        self._low_since: Optional[float] = None
+        self._metrics = Metrics()
+
+    def clamp(self, num_workers: int) -> int:
+        return min(max(num_workers, self.min_workers), self.max_workers)
+
+    def target(self, num_workers: int, metrics: Metrics, now: Optional[float] = None) -> int:
+        """ Return the number of workers for the given metrics
+        """
+        now = now or time.time()
+        self._metrics = metrics
+
+        overloaded = (
+            metrics.busy_ratio >= self.up_threshold
+            or metrics.queue_wait >= self.max_wait
+            or metrics.rejected > 0
+        )
+        underloaded = metrics.queue_length == 0 and metrics.busy_ratio <= self.down_threshold
+        low_memory = metrics.memory_available < self.min_memory
+
+        # Shrinking requires a sustained low load
+        if not (underloaded or low_memory):
+            self._low_since = None
+        elif self._low_since is None:
+            self._low_since = now
+        low_duration = now - self._low_since if self._low_since is not None else 0.
+
+        if now - self._last_action < self.cooldown:
+            return num_workers
+
+        target = num_workers
+        if low_memory:
+            target = num_workers - 1
+        elif overloaded and metrics.cpu_usage < self.max_cpu:
+            # Grow enough to absorb the waiting queue,
+            # at most double the pool at once
+            target = num_workers + max(1, min(metrics.queue_length, num_workers))
+        elif underloaded and low_duration >= self.cooldown:
+            target = num_workers - 1
+
+        target = self.clamp(target)
+        if target != num_workers:
+            LOGGER.info("Autoscaling: %s -> %s workers (%s)", num_workers, target, metrics)
+            self._last_action = now
+            self._last_scaling = now
+            self._low_since = None
+        return target
+
+    def report(self) -> Dict[str, Any]:
+        return dict(
+            min_workers=self.min_workers,
+            max_workers=self.max_workers,
+            last_scaling=self._last_scaling,
+            metrics=self._metrics._asdict(),
+        )
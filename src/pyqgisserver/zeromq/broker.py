@@ -24,9 +24,14 @@ import zmq
 
 from ..logger import setup_log_handler
 from .messages import WORKER_READY
+from .supervisor import Client as SupervisorClient
+from .supervisor import QueueStats
 
 LOGGER = logging.getLogger('SRVLOG')
 
+# Interval in seconds for sending queue statistics
+STATS_INTERVAL = 1
+
 
 def run_broker(inaddr: str, outaddr: str, maxqueue: int = 100, timeout: int = 3000) -> None:
     """ Create a ROUTER-ROUTER broker
@@ -62,6 +67,11 @@ def run_broker(inaddr: str, outaddr: str, maxqueue: int = 100, timeout: int = 30
     workers = set()    # Workers available
     waiting: deque = deque()  # Client waiting
 
+    # Export queue statistics to the supervisor
+    supervisor = SupervisorClient()
+    rejected = 0
+    stats_time = 0.
+
     LOGGER.info("Starting ZMQ broker loop")
 
     # Try to exit gracefully
@@ -74,7 +84,7 @@ def run_broker(inaddr: str, outaddr: str, maxqueue: int = 100, timeout: int = 30
     try:
         while True:
             # Poll incoming requests
-            sockets = dict(poller.poll())
+            sockets = dict(poller.poll(STATS_INTERVAL * 1000))
 
             # Handle worker activity on the backends
             if backend in sockets:
@@ -107,6 +117,7 @@ def run_broker(inaddr: str, outaddr: str, maxqueue: int = 100, timeout: int = 30
                     # Push on waiting queue
                     if len(waiting) >= maxqueue:
                         LOGGER.error("Max waiting requests reached (max %d)", maxqueue)
+                        rejected += 1
                         try:
                             frontend.send_multipart([client_id, msgid, b"ERR", b"509"])
                         except zmq.ZMQError as err:
@@ -141,11 +152,21 @@ def run_broker(inaddr: str, outaddr: str, maxqueue: int = 100, timeout: int = 30
                                 # push back the request on the queue
                                 waiting.append((tm, client_id, msgid, data))
 
+            now = time()
+            if now - stats_time >= STATS_INTERVAL:
+                stats_time = now
+                supervisor.send_queue_stats(QueueStats(
+                    length=len(waiting),
+                    wait=now - waiting[-1][0] if waiting else 0.,
+                    rejected=rejected,
+                ))
+
     except (KeyboardInterrupt, SystemExit):
         LOGGER.warning("Broker Terminated")
     except Exception:
         LOGGER.critical("Uncaught Exception:\n%s", traceback.format_exc())
     finally:
+        supervisor.close()
         backend.close()
         frontend.close()
         context.term()
@@ -9,22 +9,95 @@
 """ Pool server
 """
 import logging
+import multiprocessing
 import os
 import signal
 import time
 
-from multiprocessing import Process
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
 from multiprocessing.util import Finalize
 
-from typing_extensions import Callable, Dict, List, Sequence
+from typing_extensions import Callable, Collection, Dict, List, Optional, Sequence, Set, Tuple, cast
 
 # Early failure min delay
 # If any process fail before that starting delay
 # we abort the whole process
 EARLY_FAILURE_DELAY = 5
 
+# Delay for spare workers to check
+# that their parent is still alive
+SPARE_CHECK_DELAY = 5
+
 LOGGER = logging.getLogger('SRVLOG')
 
+# Set in respawned workers
+_respawn_time: Optional[float] = None
+
+# Set when the pool asks the worker to exit
+_retired = False
+
+
+def respawn_time() -> Optional[float]:
+    """ Return the time at which the exit of the worker
+        replaced by the current process has been detected
+        or None if the current process is not a replacement.
+    """
+    return _respawn_time
+
+
+def retired() -> bool:
+    """ Return True if the pool asked the current process
+        to exit gracefully
+    """
+    return _retired
+
+
+def _retire_signal(signum, frames):
+    global _retired
+    _retired = True
+
+
+def _run_process(
+    target: Callable,
+    args: Sequence,
+    kwargs: Dict,
+    initializer: Optional[Callable] = None,
+    conn: Optional[Connection] = None,
+    respawned_at: Optional[float] = None,
+    warmup: Optional[Callable[[], bool]] = None,
+):
+    """ Pool process entry point
+
+        Spare processes run the initializer then wait
+        for activation before running the target.
+
+        While waiting, spares run the warm-up callable until
+        it returns True.
+    """
+    global _respawn_time
+    signal.signal(signal.SIGUSR2, _retire_signal)
+    if initializer:
+        initializer()
+    if conn is not None:
+        ppid = os.getppid()
+        warmed = warmup is None
+        try:
+            while not conn.poll(SPARE_CHECK_DELAY if warmed else 0):
+                if os.getppid() != ppid:
+                    # Orphaned spare
+                    return
+                if not warmed:
+                    warmed = cast(Callable[[], bool], warmup)()
+            respawned_at = conn.recv()
+        except (EOFError, OSError):
+            # Spare released
+            return
+        finally:
+            conn.close()
+    _respawn_time = respawned_at
+    target(*args, **kwargs)
+
 
 class Pool:
 
@@ -34,26 +107,52 @@ class Pool:
         target: Callable,
         args: Sequence = (),
         kwargs: Dict = {},
+        start_method: Optional[str] = None,
+        initializer: Optional[Callable] = None,
+        spares: int = 0,
+        warmup: Optional[Callable[[], bool]] = None,
     ):
+        """ Create a pool of worker processes
 
+            :param start_method: The multiprocessing start method used
+                for starting workers, use the default if not set.
+            :param initializer: Callable run in each process before
+                the target.
+            :param spares: Number of spare processes kept initialized
+                for replacing exited workers.
+            :param warmup: Callable run repeatedly by spare processes
+                waiting for activation, until it returns True.
+        """
         self.critical_failure = False
 
+        self._ctx = multiprocessing.get_context(start_method)
+        self._draining = False
         self._num_workers = num_workers
-        self._pool: List[Process] = []
+        self._pool: List[BaseProcess] = []
+        self._retiring: Set[int] = set()
+        self._spares: List[Tuple[BaseProcess, Connection]] = []
+        self._num_spares = spares
+        self._initializer = initializer
+        self._warmup = warmup
         self._args = args
         self._kwargs = kwargs
         self._target = target
         self._start_time = time.time()
 
+        # Inherited by forked processes until they
+        # install their own handler
+        signal.signal(signal.SIGUSR2, _retire_signal)
+
         # Ensure that pool is terminated is called
         # at process exit
         self._terminate = Finalize(
             self, self._terminate_pool,
-            args=(self._pool,),
+            args=(self._pool, self._spares),
             exitpriority=15,
         )
 
         self._repopulate_pool()
+        self._replenish_spares()
 
     def _join_exited_workers(self) -> bool:
         """Cleanup after any worker processes which have exited due to reaching
@@ -77,28 +176,163 @@ class Pool:
                         os.kill(os.getpid(), signal.SIGABRT)
                 # worker exited
                 worker.join()
+                self._retiring.discard(worker.pid)
                 cleaned = True
                 del self._pool[i]
         return cleaned
 
-    def _repopulate_pool(self):
+    def _start_process(self, name: str, **kwargs) -> BaseProcess:
+        w = self._ctx.Process(
+            target=_run_process,
+            args=(self._target, self._args, self._kwargs, self._initializer),
+            kwargs=kwargs,
+        )
+        w.name = w.name.replace('Process', name)
+        w.start()
+        return w
+
+    def _activate_spare(self, respawned_at: Optional[float]) -> Optional[BaseProcess]:
+        """ Return an activated spare process or None
+            if no spare is available
+        """
+        while self._spares:
+            w, conn = self._spares.pop(0)
+            try:
+                if w.exitcode is None:
+                    conn.send(respawned_at)
+                    w.name = w.name.replace('SpareWorker', 'PoolWorker')
+                    LOGGER.debug("Activated spare worker %s", w.pid)
+                    return w
+            except OSError as err:
+                LOGGER.error("Failed to activate spare worker %s: %s", w.pid, err)
+            finally:
+                conn.close()
+            w.join()
+        return None
+
+    def _repopulate_pool(self, respawned_at: Optional[float] = None):
         """Bring the number of pool processes up to the specified number,
         for use after reaping workers which have exited.
         """
-        for _ in range(self._num_workers - len(self._pool)):
-            w = Process(target=self._target, args=self._args, kwargs=self._kwargs)
+        for _ in range(self._num_workers - self.num_active):
+            w = self._activate_spare(respawned_at)
+            if w is None:
+                w = self._start_process('PoolWorker', respawned_at=respawned_at)
             self._pool.append(w)
-            w.name = w.name.replace('Process', 'PoolWorker')
-            w.start()
+
+    def _replenish_spares(self):
+        """ Clean up exited spares and bring the number of spares
+            up to the specified number
+        """
+        for i in reversed(range(len(self._spares))):
+            w, conn = self._spares[i]
+            if w.exitcode is not None:
+                LOGGER.warning("Spare worker %s exited with code %s", w.pid, w.exitcode)
+                conn.close()
+                w.join()
+                del self._spares[i]
+
+        for _ in range(self._num_spares - len(self._spares)):
+            reader, writer = self._ctx.Pipe(duplex=False)
+            w = self._start_process('SpareWorker', conn=reader, warmup=self._warmup)
+            reader.close()
+            self._spares.append((w, writer))
 
     def maintain_pool(self):
         """Clean up any exited workers and start replacements for them.
         """
+        if self._draining:
+            self._join_exited_workers()
+            return
         if self._join_exited_workers():
+            self._repopulate_pool(respawned_at=time.time())
+        if self._num_spares:
+            self._replenish_spares()
+
+    def refresh_spares(self):
+        """ Replace spare processes
+
+            Spares are initialized before being activated: they
+            must be replaced when workers are restarted for
+            reloading plugins.
+        """
+        for w, conn in self._spares:
+            conn.close()
+            if w.exitcode is None:
+                w.terminate()
+            w.join()
+        self._spares.clear()
+        if not self._draining:
+            self._replenish_spares()
+
+    def drain(self):
+        """ Stop replacing exited workers
+        """
+        self._draining = True
+        # Release spares
+        for w, conn in self._spares:
+            conn.close()
+            if w.exitcode is None:
+                w.terminate()
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    @property
+    def num_workers(self) -> int:
+        """ Return the target number of workers
+        """
+        return self._num_workers
+
+    @property
+    def num_active(self) -> int:
+        """ Return the number of workers not asked to exit
+        """
+        return len(self._pool) - len(self._retiring)
+
+    def resize(self, num_workers: int, busy: Collection[int] = ()):
+        """ Change the number of workers
+
+            When shrinking, surplus workers are asked to exit
+            gracefully at their next idle cycle. The most recently
+            started idle workers are retired first: older workers
+            are more likely to hold warm caches.
+
+            :param busy: Pids of the workers known to be handling
+                a request
+        """
+        if self._draining:
+            return
+        num_workers = max(num_workers, 1)
+        LOGGER.info("Resizing worker pool: %s -> %s workers", self.num_active, num_workers)
+        self._num_workers = num_workers
+        surplus = self.num_active - num_workers
+        if surplus <= 0:
             self._repopulate_pool()
+            return
+        candidates = [w for w in reversed(self._pool) if w.pid not in self._retiring and w.exitcode is None]
+        candidates.sort(key=lambda w: w.pid in busy)
+        for w in candidates[:surplus]:
+            self.retire(w)
+
+    def retire(self, worker: BaseProcess):
+        """ Ask a worker to exit gracefully without replacing it
+        """
+        try:
+            os.kill(worker.pid, signal.SIGUSR2)
+            self._retiring.add(worker.pid)
+            LOGGER.debug("Retiring worker %s", worker.pid)
+        except ProcessLookupError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._pool)
 
     @classmethod
-    def _terminate_pool(cls, pool: List[Process]):
+    def _terminate_pool(cls, pool: List[BaseProcess], spares: List[Tuple[BaseProcess, Connection]]):
+
+        pool = pool + [w for w, _ in spares]
 
         # Send terminate to workers
         if pool and hasattr(pool[0], 'terminate'):
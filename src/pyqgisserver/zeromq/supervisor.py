@@ -22,11 +22,15 @@ import os
 import signal
 import traceback
 
+from collections import deque
+from time import time
 from typing import (
     Any,
     Dict,
+    List,
     NamedTuple,
     Optional,
+    Set,
     Union,
 )
 
@@ -38,10 +42,39 @@ from .utils import _get_ipc
 LOGGER = logging.getLogger('SRVLOG')
 
 
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
 class _Report(NamedTuple):
     data: Any
 
 
+class _Respawn(NamedTuple):
+    latency: float
+
+
+class _Result(NamedTuple):
+    command_id: bytes
+    data: Any
+
+
+class QueueStats(NamedTuple):
+    """ Broker waiting queue statistics
+    """
+    length: int = 0
+    # Waiting time of the oldest request in seconds
+    wait: float = 0.
+    # Total number of rejected requests
+    rejected: int = 0
+
+
 class Client:
 
     def __init__(self):
@@ -61,7 +94,7 @@ class Client:
         self._pid = os.getpid()
         self._busy = False
 
-    def _send(self, data: Union[bytes, _Report]):
+    def _send(self, data: Union[bytes, _Report, _Respawn, _Result, QueueStats]):
         if not self._sock:
             return
         try:
@@ -84,6 +117,23 @@ class Client:
             self._busy = True
             self._send(b'BUSY')
 
+    def notify_ready(self):
+        """ Send 'ready' notification when the worker
+            starts handling requests
+        """
+        self._send(b'READY')
+
+    def notify_warmed(self):
+        """ Send 'warmed' notification when the worker
+            has completed its warm-up
+        """
+        self._send(b'WARMED')
+
+    def notify_exit(self):
+        """ Send 'exit' notification
+        """
+        self._send(b'EXIT')
+
     def close(self):
         if self._sock:
             self._sock.close()
@@ -91,13 +141,31 @@ class Client:
     def send_report(self, data: Any):
         self._send(_Report(data=data))
 
+    def notify_respawn(self, latency: float):
+        """ Send the delay between the exit of the replaced
+            worker and the readiness of the current worker
+        """
+        self._send(_Respawn(latency=latency))
+
+    def send_result(self, command_id: bytes, data: Any):
+        """ Send the result of a broadcast command
+        """
+        self._send(_Result(command_id=command_id, data=data))
+
+    def send_queue_stats(self, stats: QueueStats):
+        """ Send the broker waiting queue statistics
+        """
+        self._send(stats)
+
 
 class Supervisor:
 
-    def __init__(self, timeout: int):
+    def __init__(self, timeout: int, grace_period: int = 0):
         """ Run supervisor
 
             :param timeout: timeout delay in seconds
+            :param grace_period: delay in seconds given to workers
+                for cancelling the request by themselves before being killed
         """
         address = _get_ipc('supervisor')
 
@@ -106,11 +174,22 @@ class Supervisor:
         self._sock.setsockopt(zmq.RCVTIMEO, 1000)
         self._sock.bind(address)
 
-        self._timeout = timeout
-        self._busy: Dict[int, asyncio.Task] = {}
+        self._timeout = timeout + grace_period
+        self._busy: Dict[int, asyncio.TimerHandle] = {}
+        self._busy_time = 0.
         self._stopped = True
         self._task: Optional[asyncio.Task] = None
         self._reports: Dict[int, Any] = {}
+        # Running workers with their start time
+        self._workers: Dict[int, float] = {}
+        self._warmed: Set[int] = set()
+        self._results: Dict[bytes, Dict[int, Any]] = {}
+
+        self.num_kills = 0
+        self.num_respawns = 0
+        self._respawns: deque = deque(maxlen=100)
+
+        self.queue_stats = QueueStats()
 
     def run(self):
         self._task = asyncio.create_task(self._run_async())
@@ -121,9 +200,13 @@ class Supervisor:
         loop = asyncio.get_running_loop()
 
         def kill(pid: int):
+            self._busy_time += self._timeout
             del self._busy[pid]
+            self._workers.pop(pid, None)
+            self._warmed.discard(pid)
             try:
                 os.kill(pid, signal.SIGKILL)
+                self.num_kills += 1
                 LOGGER.critical("Killed stalled process %s", pid)
             except ProcessLookupError:
                 # Process was already terminated/crashed
@@ -136,13 +219,34 @@ class Supervisor:
                 pid, msg = await self._sock.recv_pyobj()
                 if msg == b'BUSY':
                     self._busy[pid] = loop.call_later(self._timeout, kill, pid)
+                    # Worker started before the supervisor
+                    self._workers.setdefault(pid, 0.)
                 elif msg == b'DONE':
                     try:
-                        self._busy.pop(pid).cancel()
+                        th = self._busy.pop(pid)
+                        th.cancel()
+                        self._busy_time += loop.time() - th.when() + self._timeout
                     except KeyError:
                         pass
+                elif msg == b'READY':
+                    self._workers[pid] = time()
+                elif msg == b'WARMED':
+                    self._warmed.add(pid)
+                elif msg == b'EXIT':
+                    self._workers.pop(pid, None)
+                    self._warmed.discard(pid)
                 elif isinstance(msg, _Report):
                     self._reports[pid] = msg.data
+                elif isinstance(msg, _Result):
+                    results = self._results.get(msg.command_id)
+                    if results is not None:
+                        results[pid] = msg.data
+                elif isinstance(msg, _Respawn):
+                    LOGGER.debug("Worker %s respawned in %.3fs", pid, msg.latency)
+                    self.num_respawns += 1
+                    self._respawns.append(msg.latency)
+                elif isinstance(msg, QueueStats):
+                    self.queue_stats = msg
             except zmq.ZMQError as err:
                 if err.errno != zmq.EAGAIN:
                     LOGGER.error("%s\n%s", zmq.strerror(err.errno), traceback.format_exc())
@@ -156,12 +260,66 @@ class Supervisor:
     def reports(self):
         return list(self._reports.values())
 
+    def respawn_stats(self) -> Dict[str, Any]:
+        """ Return respawn latency statistics in milliseconds
+
+            Statistics are computed over the last 100 respawns.
+        """
+        latencies = [int(t * 1000) for t in self._respawns]
+        return dict(
+            count=self.num_respawns,
+            last=latencies[-1] if latencies else None,
+            mean=sum(latencies) // len(latencies) if latencies else None,
+            max=max(latencies) if latencies else None,
+        )
+
+    def busy_pids(self) -> List[int]:
+        """ Return the pids of the workers handling a request
+        """
+        return list(self._busy)
+
+    def busy_time(self) -> float:
+        """ Return the total time in seconds spent by workers
+            handling requests
+        """
+        now = asyncio.get_running_loop().time()
+        return self._busy_time + sum(now - th.when() + self._timeout for th in self._busy.values())
+
+    def workers(self, warmed: bool = False) -> Dict[int, float]:
+        """ Return the running workers with their start time
+
+            :param warmed: Return only workers which have
+                completed their warm-up
+        """
+        for pid in list(self._workers):
+            if not _is_alive(pid):
+                self._workers.pop(pid)
+                self._warmed.discard(pid)
+        if warmed:
+            return {pid: t for pid, t in self._workers.items() if pid in self._warmed}
+        return dict(self._workers)
+
     def num_reports(self) -> int:
         return len(self._reports)
 
     def clear_reports(self):
         self._reports = {}
 
+    def start_command(self, command_id: bytes):
+        """ Start collecting results for the command
+        """
+        self._results[command_id] = {}
+
+    def results(self, command_id: bytes) -> Dict[int, Any]:
+        """ Return the results of the command by worker pid
+        """
+        return self._results.get(command_id, {})
+
+    def end_command(self, command_id: bytes):
+        """ Stop collecting results for the command
+        """
+        self._results.pop(command_id, None)
+
     def stop(self):
         """ Stop the supervisor
         """
@@ -22,6 +22,8 @@ import sys
 import traceback
 import uuid
 
+from collections import deque
+from time import time
 from typing import (
     Callable,
     Dict,
@@ -37,10 +39,14 @@ import zmq
 from ..logger import setup_log_handler
 from ..utils import stats
 from .messages import WORKER_READY, ReplyMessage
+from .pool import respawn_time, retired
 from .supervisor import Client as SupervisorClient
 
 LOGGER = logging.getLogger('SRVLOG')
 
+# Broadcast commands run in idle cycles
+COMMANDS = (b'PRELOAD', b'EVICT')
+
 
 # Define an abstract type for HTTPRequest
 class HTTPRequest(Protocol):
@@ -128,6 +134,27 @@ class RequestHandler:
         self.send(b"Chunk 2", True)
         self.send(b"", False)
 
+    @classmethod
+    def invalidate(cls, data: bytes):
+        """ Override this method to handle cache invalidation
+            notifications
+        """
+
+    @classmethod
+    def run_command(cls, command: bytes, data: bytes) -> Dict:
+        """ Override this method to run broadcast commands
+
+            Return the command result
+        """
+        return dict(status='unsupported')
+
+    @classmethod
+    def is_warmed(cls) -> bool:
+        """ Override this method to tell when the worker
+            has completed its warm-up
+        """
+        return True
+
     @classmethod
     def get_report(cls):
         data = stats.stats()
@@ -135,6 +162,71 @@ class RequestHandler:
         return data
 
 
+class RecyclePolicy:
+    """ Worker recycling policy
+
+        Define the limits after which a worker exits gracefully
+        between two requests and let the pool start a replacement.
+
+        A value of zero disables the corresponding limit.
+    """
+
+    def __init__(self, max_requests: int = 0, max_rss_growth: int = 0, max_age: int = 0):
+        """
+            :param max_requests: Maximum number of requests handled
+            :param max_rss_growth: Maximum resident memory growth in bytes since warm-up
+            :param max_age: Maximum age of the worker in seconds
+        """
+        self.max_requests = max_requests
+        self.max_rss_growth = max_rss_growth
+        self.max_age = max_age
+
+        self.num_requests = 0
+        self._start_time = time()
+        self._base_rss = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_requests > 0 or self.max_rss_growth > 0 or self.max_age > 0
+
+    def _rss(self) -> int:
+        return stats.stats().get('mem_usage', 0)
+
+    def warmed_up(self):
+        """ Record the reference memory usage
+        """
+        self._start_time = time()
+        self._base_rss = self._rss()
+
+    def rss_growth(self) -> int:
+        return self._rss() - self._base_rss if self._base_rss else 0
+
+    def age(self) -> float:
+        return time() - self._start_time
+
+    def check(self, handled: bool) -> Optional[str]:
+        """ Return the reason for recycling the worker or None
+        """
+        if handled:
+            self.num_requests += 1
+            if self.max_requests > 0 and self.num_requests >= self.max_requests:
+                return f"max requests reached ({self.num_requests})"
+            if self.max_rss_growth > 0:
+                growth = self.rss_growth()
+                if growth > self.max_rss_growth:
+                    return f"max memory growth reached ({growth} bytes)"
+        if self.max_age > 0 and self.age() > self.max_age:
+            return f"max age reached ({int(self.age())}s)"
+        return None
+
+    def report(self) -> Dict:
+        return dict(
+            num_requests=self.num_requests,
+            rss_growth=self.rss_growth(),
+            age=int(self.age()),
+        )
+
+
 def dealer_socket(ctx: zmq.Context, address: str, identity: Optional[bytes] = None) -> zmq.Socket:
     """ Socket for receiving incoming messages
     """
@@ -159,6 +251,9 @@ def broadcast_socket(ctx: zmq.Context, broadcastaddr: str) -> zmq.Socket:
     sub.setsockopt(zmq.LINGER, 500)    # Needed for socket no to wait on close
     sub.setsockopt(zmq.SUBSCRIBE, b'RESTART')
     sub.setsockopt(zmq.SUBSCRIBE, b'REPORT')
+    sub.setsockopt(zmq.SUBSCRIBE, b'INVALIDATE')
+    for command in COMMANDS:
+        sub.setsockopt(zmq.SUBSCRIBE, command)
     sub.connect(broadcastaddr)
     return sub
 
@@ -169,8 +264,12 @@ def run_worker(
     identity: Optional[bytes] = None,
     broadcastaddr: Optional[str] = None,
     postprocess: Optional[Callable[[bool], None]] = None,
+    recycle: Optional[RecyclePolicy] = None,
 ):
     """ Enter the message loop
+
+        If a recycle policy is given, the worker will exit the
+        loop when one of the policy limits is reached.
     """
     ctx = zmq.Context.instance()
 
@@ -186,6 +285,23 @@ def run_worker(
         LOGGER.debug("RCV %s: %s", client_id, corr_id)
         return client_id, corr_id, pickle.loads(request)
 
+    if recycle and recycle.enabled:
+        recycle.warmed_up()
+    else:
+        recycle = None
+
+    # Pending broadcast commands
+    commands: deque = deque()
+
+    # Report the latency if we are replacing an exited worker
+    respawned_at = respawn_time()
+    if respawned_at:
+        supervisor.notify_respawn(time() - respawned_at)
+
+    supervisor.notify_ready()
+    warmed = False
+    pid = str(os.getpid()).encode()
+
     try:
         LOGGER.info("Starting ZMQ worker loop")
         while True:
@@ -216,20 +332,46 @@ def run_worker(
             finally:
                 supervisor.notify_done()
 
-            # Handle broadcast notifications
-            try:
-                if broadcastaddr:
-                    msg = sub.recv(flags=zmq.NOBLOCK)
-                    if msg == b'RESTART':
-                        # There is no really way to restart
-                        # so exit and let the framework restart a new worker
-                        LOGGER.info("Exiting on RESTART notification")
+            # Handle all pending broadcast notifications
+            restart, report_asked = False, False
+            while broadcastaddr:
+                try:
+                    msg, *data = sub.recv_multipart(flags=zmq.NOBLOCK)
+                except zmq.error.Again:
+                    break
+                if msg == b'RESTART':
+                    # Restart may target a list of workers
+                    restart = not data or pid in data[0].split(b',')
+                    if restart:
                         break
-                    elif msg == b'REPORT':
-                        # Reporting asked
-                        supervisor.send_report(handler_factory.get_report())
-            except zmq.error.Again:
-                pass
+                elif msg == b'REPORT':
+                    report_asked = True
+                elif msg == b'INVALIDATE' and data:
+                    handler_factory.invalidate(data[0])
+                elif msg in COMMANDS and len(data) == 2:
+                    commands.append((msg, *data))
+
+            if restart:
+                # There is no really way to restart
+                # so exit and let the framework restart a new worker
+                LOGGER.info("Exiting on RESTART notification")
+                break
+
+            if report_asked:
+                report = handler_factory.get_report()
+                if recycle:
+                    report.update(recycle=recycle.report())
+                supervisor.send_report(report)
+
+            # Run pending commands in idle cycles
+            while idle and commands:
+                command, command_id, data = commands.popleft()
+                try:
+                    result = handler_factory.run_command(command, data)
+                except Exception as err:
+                    LOGGER.error("Command %s failed:\n%s", command, traceback.format_exc())
+                    result = dict(status='error', error=str(err))
+                supervisor.send_result(command_id, result)
 
             try:
                 # Run callbacks
@@ -238,9 +380,28 @@ def run_worker(
             except Exception:
                 LOGGER.critical("Unhandled exception:\n%s", traceback.format_exc())
 
+            if not warmed and handler_factory.is_warmed():
+                warmed = True
+                supervisor.notify_warmed()
+
+            # Exit when asked by the pool, idle workers
+            # are not handling any request
+            if idle and retired():
+                LOGGER.info("Exiting on pool shrinking")
+                break
+
+            # Check for recycling, at this point the request
+            # has been replied and we may exit gracefully
+            if recycle:
+                reason = recycle.check(handled=handler is not None)
+                if reason:
+                    LOGGER.info("Recycling worker: %s", reason)
+                    break
+
     except (KeyboardInterrupt, SystemExit):
         pass
 
+    supervisor.notify_exit()
     if broadcastaddr:
         sub.close()
     sock.close()
@@ -21,3 +21,32 @@ def test_lru_ordering():
 
     assert len(c) == 3
     assert tuple(c.keys()) == ('k4', 'k1', 'k3')
+
+
+def test_lru_weight():
+    """ Test lru cache with weight limit
+    """
+    c = lrucache(10, max_weight=100, weigher=lambda v: v)
+
+    c['k1'] = 40
+    c['k2'] = 40
+    assert c.weight() == 80
+
+    # Evict least recently used items until weight fit
+    _k = c['k1']
+    c['k3'] = 50
+    assert tuple(c.keys()) == ('k3', 'k1')
+    assert c.weight() == 90
+
+    # Replace item
+    c['k1'] = 10
+    assert c.weight() == 60
+    assert c.weight('k1') == 10
+
+    # Item heavier than max weight is kept alone
+    c['k4'] = 200
+    assert tuple(c.keys()) == ('k4',)
+    assert c.weight() == 200
+
+    del c['k4']
+    assert c.weight() == 0
@@ -0,0 +1,70 @@
+""" Test worker pool autoscaling policy
+"""
+import time
+
+import pytest
+
+from pyqgisserver.zeromq.autoscale import Autoscaler, Metrics
+
+
+def test_autoscale_grow():
+    """ Test growing on load
+    """
+    scaler = Autoscaler(1, 4, cooldown=10)
+    now = time.time()
+
+    # Cooldown at startup
+    assert scaler.target(2, Metrics(busy_ratio=1.), now) == 2
+
+    now += 10
+    assert scaler.target(2, Metrics(busy_ratio=1.), now) == 3
+    # Cooldown after scaling
+    assert scaler.target(3, Metrics(busy_ratio=1.), now + 5) == 3
+
+    # Absorb waiting queue up to the maximum
+    now += 10
+    assert scaler.target(3, Metrics(queue_length=10, queue_wait=1.), now) == 4
+
+    # Rejected requests
+    scaler = Autoscaler(1, 4, cooldown=10)
+    assert scaler.target(2, Metrics(busy_ratio=0.5, rejected=1), now + 10) == 3
+
+
+def test_autoscale_resources():
+    """ Test that short resources prevent growing
+    """
+    scaler = Autoscaler(1, 4, cooldown=10)
+    now = time.time() + 10
+
+    assert scaler.target(2, Metrics(busy_ratio=1., cpu_usage=0.95), now) == 2
+    # Low memory shrinks the pool
+    assert scaler.target(2, Metrics(busy_ratio=1., memory_available=0.05), now) == 1
+
+
+def test_autoscale_shrink():
+    """ Test hysteresis on shrinking
+    """
+    scaler = Autoscaler(1, 4, cooldown=10)
+    now = time.time() + 10
+
+    # Low load must be sustained
+    assert scaler.target(3, Metrics(busy_ratio=0.1), now) == 3
+    assert scaler.target(3, Metrics(busy_ratio=0.5), now + 5) == 3
+    assert scaler.target(3, Metrics(busy_ratio=0.1), now + 10) == 3
+    assert scaler.target(3, Metrics(busy_ratio=0.1), now + 20) == 2
+
+    # Between thresholds
+    now += 40
+    assert scaler.target(2, Metrics(busy_ratio=0.5), now) == 2
+    assert scaler.target(2, Metrics(busy_ratio=0.5), now + 20) == 2
+
+    # Do not shrink below minimum
+    assert scaler.target(1, Metrics(), now + 30) == 1
+    assert scaler.target(1, Metrics(), now + 50) == 1
+
+
+def test_autoscale_invalid():
+    with pytest.raises(ValueError):
+        Autoscaler(2, 1)
+    with pytest.raises(ValueError):
+        Autoscaler(1, 2, up_threshold=0.5, down_threshold=0.5)
@@ -1,6 +1,9 @@
 """
     Test server disponibility
 """
+from pathlib import Path
+
+from pyqgisserver.config import confservice
 from pyqgisserver.tests import HTTPTestCase
 
 
@@ -99,3 +102,13 @@ class Tests(HTTPTestCase):
 
         # Check that X-Request-Id is correctly forwarded
         assert rv.headers['X-Request-Id'] == headers['X-Request-Id']
+
+    def test_map_id_header(self):
+        """ Test that the X-Map-Id header is the canonical project key
+            notified to cache observers
+        """
+        rootpath = Path(confservice.get('projects.cache', 'rootdir'))
+        for map_ in ('france_parts', 'france_parts.qgs'):
+            rv = self.client.get(f"?MAP={map_}&SERVICE=WMS&request=GetCapabilities")
+            assert rv.status_code == 200
+            assert rv.headers['X-Map-Id'] == f"file://{rootpath / 'france_parts.qgs'}"
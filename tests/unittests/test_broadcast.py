@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import ClassVar, List
+
+import zmq
+
+from pyqgisserver.config import confservice
+from pyqgisserver.zeromq.supervisor import _Result
+from pyqgisserver.zeromq.worker import RequestHandler, run_worker
+
+
+class _Handler(RequestHandler):
+    invalidated: ClassVar[List[bytes]] = []
+
+    @classmethod
+    def invalidate(cls, data: bytes):
+        cls.invalidated.append(data)
+
+    @classmethod
+    def run_command(cls, command: bytes, data: bytes) -> dict:
+        if command == b'EVICT':
+            raise RuntimeError("Failed")
+        return dict(key=data.decode(), status='ok')
+
+
+def test_broadcast_notifications(tmp_path: Path):
+    """ Test that workers handle all pending notifications
+    """
+    confservice.set('zmq', 'ipcpath', str(tmp_path))
+
+    address = f"ipc://{tmp_path}/router"
+    broadcastaddr = f"ipc://{tmp_path}/broadcast"
+
+    ctx = zmq.Context.instance()
+    router = ctx.socket(zmq.ROUTER)
+    router.bind(address)
+    pub = ctx.socket(zmq.PUB)
+    pub.bind(broadcastaddr)
+
+    # Block the worker until notifications are sent
+    postprocess = threading.Event()
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(address, _Handler),
+        kwargs={'broadcastaddr': broadcastaddr, 'postprocess': lambda idle: postprocess.wait()},
+    )
+    worker.start()
+    try:
+        # Let the subscriber connect
+        time.sleep(0.5)
+        for n in range(10):
+            pub.send_multipart([b'INVALIDATE', str(n).encode()])
+        pub.send(b'RESTART')
+        postprocess.set()
+
+        worker.join(5)
+        assert not worker.is_alive()
+    finally:
+        postprocess.set()
+        pub.close()
+        router.close()
+
+    assert _Handler.invalidated == [str(n).encode() for n in range(10)]
+
+
+def test_broadcast_commands(tmp_path: Path):
+    """ Test that workers run commands and return results
+    """
+    confservice.set('zmq', 'ipcpath', str(tmp_path))
+
+    address = f"ipc://{tmp_path}/router"
+    broadcastaddr = f"ipc://{tmp_path}/broadcast"
+
+    ctx = zmq.Context.instance()
+    router = ctx.socket(zmq.ROUTER)
+    router.bind(address)
+    pub = ctx.socket(zmq.PUB)
+    pub.bind(broadcastaddr)
+    supervisor = ctx.socket(zmq.PULL)
+    supervisor.setsockopt(zmq.RCVTIMEO, 5000)
+    supervisor.bind(f"ipc://{tmp_path}/supervisor")
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(address, _Handler),
+        kwargs={'broadcastaddr': broadcastaddr},
+    )
+    worker.start()
+    try:
+        # Let the subscriber connect
+        time.sleep(0.5)
+        pub.send_multipart([b'PRELOAD', b'1', b'myproject'])
+        pub.send_multipart([b'EVICT', b'2', b'myproject'])
+
+        results = {}
+        while len(results) < 2:
+            _, msg = supervisor.recv_pyobj()
+            if isinstance(msg, _Result):
+                results[msg.command_id] = msg.data
+
+        pub.send(b'RESTART')
+        worker.join(5)
+        assert not worker.is_alive()
+    finally:
+        pub.close()
+        router.close()
+        supervisor.close()
+
+    assert results[b'1'] == {'key': 'myproject', 'status': 'ok'}
+    assert results[b'2'] == {'status': 'error', 'error': 'Failed'}
+
+
+def test_broadcast_targeted_restart(tmp_path: Path):
+    """ Test that workers restart only when targeted
+        and notify their readiness
+    """
+    confservice.set('zmq', 'ipcpath', str(tmp_path))
+
+    address = f"ipc://{tmp_path}/router"
+    broadcastaddr = f"ipc://{tmp_path}/broadcast"
+
+    ctx = zmq.Context.instance()
+    router = ctx.socket(zmq.ROUTER)
+    router.bind(address)
+    pub = ctx.socket(zmq.PUB)
+    pub.bind(broadcastaddr)
+    supervisor = ctx.socket(zmq.PULL)
+    supervisor.setsockopt(zmq.RCVTIMEO, 5000)
+    supervisor.bind(f"ipc://{tmp_path}/supervisor")
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(address, _Handler),
+        kwargs={'broadcastaddr': broadcastaddr},
+    )
+    worker.start()
+    try:
+        notifications = [supervisor.recv_pyobj()[1] for _ in range(2)]
+        assert notifications == [b'READY', b'WARMED']
+
+        # Let the subscriber connect
+        time.sleep(0.5)
+        pid = os.getpid()
+        pub.send_multipart([b'RESTART', f"{pid + 1},{pid + 2}".encode()])
+        worker.join(2)
+        assert worker.is_alive()
+
+        pub.send_multipart([b'RESTART', f"{pid + 1},{pid}".encode()])
+        worker.join(5)
+        assert not worker.is_alive()
+        assert supervisor.recv_pyobj()[1] == b'EXIT'
+    finally:
+        pub.send(b'RESTART')
+        pub.close()
+        router.close()
+        supervisor.close()
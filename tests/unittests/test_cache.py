@@ -1,4 +1,11 @@
 
+import asyncio
+import os
+import shutil
+import time
+import zipfile
+
+from datetime import timedelta
 from pathlib import Path
 
 import pytest
@@ -6,12 +13,18 @@ import pytest
 from qgis.core import QgsProject
 
 from pyqgisserver.config import confservice
+from pyqgisserver.qgscache import lazylayers
 from pyqgisserver.qgscache.cachemanager import (
     CacheType,
     PathNotAllowedError,
     QgsCacheManager,
+    preload_hotset,
     preload_projects_file,
+    read_preload_config,
+    schedule_projects_file,
 )
+from pyqgisserver.qgscache.handlers.file_handler import fingerprint
+from pyqgisserver.qgscache.types import UpdateState
 
 
 def test_aliases():
@@ -60,6 +73,48 @@ def test_absolute_path_with_alias():
         url = cacheservice.resolve_alias('foo:/france_parts')
 
 
+def test_memoized_resolution():
+    """ Test memoized key resolution
+    """
+    cacheservice = QgsCacheManager()
+
+    url, store = cacheservice.resolve('france_parts')
+    assert cacheservice.resolve('france_parts') == (url, store)
+
+    # Not allowed paths are memoized
+    for _ in range(2):
+        with pytest.raises(PathNotAllowedError):
+            cacheservice.resolve('foo:/france_parts')
+
+    # Fallback handler is shared
+    _, store1 = cacheservice.resolve('badscheme:///foo')
+    _, store2 = cacheservice.resolve('badscheme:///bar')
+    assert store1 is store2
+
+
+def test_memoized_resolution_benchmark():
+    """ Compare resolution cost with memoization
+    """
+    cacheservice = QgsCacheManager()
+    keys = [f'tiles/project_{n}' for n in range(10)]
+    iterations = 10000
+
+    def run(resolve):
+        start = time.perf_counter()
+        for n in range(iterations):
+            resolve(keys[n % len(keys)])
+        return (time.perf_counter() - start) / iterations
+
+    def resolve_uncached(key):
+        url = cacheservice.resolve_alias(key)
+        return url, cacheservice.get_protocol_handler(key, url.scheme)
+
+    uncached = run(resolve_uncached)
+    memoized = run(cacheservice.resolve)
+    print(f"Key resolution: {uncached * 1e6:.1f}us, memoized: {memoized * 1e6:.1f}us")
+    assert memoized < uncached
+
+
 def test_file_cache():
     """ Tetst file protocol handler
     """
@@ -79,6 +134,63 @@ def test_file_cache():
     assert details.project is project
 
 
+def test_canonical_keys():
+    """ Test that keys referencing the same project share the same entry
+    """
+    rootpath = Path(confservice.get('projects.cache', 'rootdir'))
+
+    cacheservice = QgsCacheManager()
+
+    canonical = cacheservice.canonical_key('france_parts')
+    assert canonical == f"file://{rootpath / 'france_parts.qgs'}"
+
+    project, updated = cacheservice.lookup('france_parts')
+    assert updated == UpdateState.INSERTED
+
+    for key in ('france_parts.qgs', f'{rootpath}/france_parts', 'file:france_parts', 'test:france_parts'):
+        assert cacheservice.canonical_key(key) == canonical
+        other, updated = cacheservice.lookup(key)
+        assert other is project
+        assert updated == UpdateState.UNCHANGED
+
+    assert len(list(cacheservice.items())) == 1
+    assert cacheservice.peek('test:france_parts').project is project
+    assert set(cacheservice.key_aliases(canonical)) == {
+        'france_parts',
+        'france_parts.qgs',
+        f'{rootpath}/france_parts',
+        'file:france_parts',
+        'test:france_parts',
+    }
+
+    # Missing projects are not memoized
+    assert cacheservice.canonical_key('does_not_exists') == 'does_not_exists'
+
+
+def test_observer_key(monkeypatch):
+    """ Test that the ban observer receives the key
+        set in the X-Map-Id header
+    """
+    from pyqgisserver.qgscache.observers import ban
+
+    banned = []
+
+    async def _ban(key: str):
+        banned.append(key)
+
+    monkeypatch.setattr(ban, 'ban', _ban)
+
+    cacheservice = QgsCacheManager()
+    cacheservice.add_observer(ban.observe)
+
+    async def _lookup():
+        cacheservice.lookup('france_parts')
+        await asyncio.sleep(0)
+
+    asyncio.run(_lookup())
+    assert banned == [cacheservice.canonical_key('france_parts')]
+
+
 def test_projects_scheme():
     """ Tetst file protocol handler
     """
@@ -98,6 +210,113 @@ def test_projects_scheme():
     assert details.project is project
 
 
+def test_idle_ttl_expiration():
+    """ Test expiration of idle entries
+    """
+    confservice.set('projects.cache', 'idle_ttl', '60')
+    try:
+        cacheservice = QgsCacheManager()
+    finally:
+        confservice.set('projects.cache', 'idle_ttl', '0')
+
+    cacheservice.lookup('france_parts')
+    key = cacheservice.canonical_key('france_parts')
+    assert cacheservice.expire_entries() == []
+
+    # Simulate idle entry
+    cacheservice._last_access[key] -= 120
+
+    expired = cacheservice.expire_entries()
+    assert [k for k, _ in expired] == [key]
+    assert cacheservice.peek('france_parts') is None
+
+
+def test_hotset_warmup(tmp_path):
+    """ Test warm-up from the hot set
+    """
+    hotset_file = tmp_path / 'hotset.json'
+    confservice.set('projects.cache', 'hotset_file', str(hotset_file))
+    try:
+        cacheservice = QgsCacheManager()
+    finally:
+        confservice.set('projects.cache', 'hotset_file', '')
+
+    cacheservice.lookup('france_parts')
+    cacheservice.lookup('france_parts')
+    key = cacheservice.canonical_key('france_parts')
+    assert cacheservice.pop_access_counts() == {key: 2}
+    assert cacheservice.pop_access_counts() == {}
+
+    hotset_file.write_text(f'{{"projects": {{"{key}": 2, "I_do_not_exists": 1}}}}')
+
+    cacheservice = QgsCacheManager()
+    assert preload_hotset(hotset_file, cacheservice, 10) == 2
+
+    loaded = cacheservice.warmup(0)
+    assert loaded == [(key, UpdateState.INSERTED)]
+    assert cacheservice.peek(key, CacheType.LRU) is not None
+
+    # Missing projects are ignored
+    assert cacheservice.warmup(0) == []
+    assert 'I_do_not_exists' in cacheservice._negative_cache
+
+
+def test_incremental_refresh():
+    """ Test validation and reloading of changed entries
+    """
+    confservice.set('projects.cache', 'watch_mode', 'poll')
+    try:
+        cacheservice = QgsCacheManager()
+    finally:
+        confservice.set('projects.cache', 'watch_mode', 'auto')
+
+    project, _ = cacheservice.lookup('france_parts')
+    key = cacheservice.canonical_key('france_parts')
+    cacheservice.start_validation()
+    assert cacheservice.validate(1.) == 1
+    assert not cacheservice.is_pending(key)
+
+    # Simulate a change of the project
+    details = cacheservice.peek(key)
+    cacheservice._lru_cache[key] = details._replace(
+        timestamp=details.timestamp - timedelta(seconds=10),
+    )
+    assert len(cacheservice._lru_cache) == 1
+    cacheservice.start_validation()
+    cacheservice.validate(1.)
+    assert cacheservice.is_pending(key)
+
+    # Stale project is served until reloaded
+    stale, _ = cacheservice.lookup('france_parts', refresh=False)
+    assert stale is project
+
+    # No reload without budget
+    assert cacheservice.reload_pending(0) == []
+
+    updated = cacheservice.reload_pending(1.)
+    assert [(k, state) for k, state, _ in updated] == [(key, UpdateState.UPDATED)]
+    assert updated[0][2].project is project
+    assert not cacheservice.is_pending(key)
+    assert cacheservice.peek(key).project is not project
+
+
+def test_invalidate_key():
+    """ Test invalidation from updates detected by other workers
+    """
+    cacheservice = QgsCacheManager()
+
+    cacheservice.lookup('france_parts')
+    key = cacheservice.canonical_key('france_parts')
+    details = cacheservice.peek(key)
+
+    # Not updated
+    assert not cacheservice.invalidate_key('france_parts', details.timestamp.replace(microsecond=0))
+    assert not cacheservice.is_pending(key)
+
+    assert cacheservice.invalidate_key('france_parts', details.timestamp + timedelta(seconds=1))
+    assert cacheservice.is_pending(key)
+
+
 def test_file_not_found():
     """ Test non existant file return error
     """
@@ -106,6 +325,26 @@ def test_file_not_found():
         cacheservice.lookup('I_do_not_exists')
 
 
+def test_negative_cache():
+    """ Test that missing projects are cached
+    """
+    cacheservice = QgsCacheManager()
+    with pytest.raises(FileNotFoundError):
+        cacheservice.lookup('I_do_not_exists')
+
+    assert 'I_do_not_exists' in cacheservice._negative_cache
+    with pytest.raises(FileNotFoundError):
+        cacheservice.lookup('I_do_not_exists')
+
+    with pytest.raises(PathNotAllowedError):
+        cacheservice.lookup('foo:/france_parts')
+    with pytest.raises(PathNotAllowedError):
+        cacheservice.lookup('foo:/france_parts')
+
+    cacheservice.invalidate_negative()
+    assert len(cacheservice._negative_cache) == 0
+
+
 def test_invalid_scheme():
     """ Test non existant file return error
     """
@@ -139,6 +378,95 @@ def test_postgres_cache():
     assert details.project is project
 
 
+@pytest.mark.with_postgres
+def test_postgres_connection_pool():
+    """ Test that connections are reused
+    """
+    cacheservice = QgsCacheManager()
+
+    url, store = cacheservice.resolve('postgres:///?project=france_parts')
+
+    modified_time = store.get_modified_time(url)
+    assert store._pool.num_idle() == 1
+    assert store.get_modified_time(url) == modified_time
+    assert store._pool.num_idle() == 1
+
+
+@pytest.mark.with_postgres
+def test_postgres_batched_modified_times():
+    """ Test fetching modified times in batch
+    """
+    cacheservice = QgsCacheManager()
+
+    url, store = cacheservice.resolve('postgres:///?project=france_parts')
+    missing, _ = cacheservice.resolve('postgres:///?project=does_not_exists')
+
+    modified_times = store.get_modified_times([url, missing])
+    assert modified_times == {url: store.get_modified_time(url)}
+
+    # Modified times are prefetched at validation
+    cacheservice.lookup('postgres:///?project=france_parts')
+    cacheservice.start_validation()
+    assert cacheservice.validate(0) == 1
+    assert not cacheservice.is_pending('postgres:///?project=france_parts')
+
+
+@pytest.mark.with_postgres
+def test_postgres_change_notification():
+    """ Test that notified projects are not checked until changed
+    """
+    confservice.set('projects.cache', 'postgres_notify_dsn', 'service=local')
+    try:
+        cacheservice = QgsCacheManager()
+        cacheservice.enable_notifications()
+        key = 'postgres:///?project=france_parts'
+
+        project, _ = cacheservice.lookup(key)
+        key = cacheservice.canonical_key(key)
+        assert cacheservice.is_clean(key)
+
+        # Notifications for other projects are ignored
+        cacheservice.invalidate_notified({'scheme': 'postgres', 'schema': 'public', 'name': 'other'})
+        assert cacheservice.is_clean(key)
+
+        cacheservice.invalidate_notified({'scheme': 'postgres', 'schema': 'public', 'name': 'france_parts'})
+        assert not cacheservice.is_clean(key)
+        assert cacheservice.is_pending(key)
+
+        # Project did not change
+        other, updated = cacheservice.lookup(key)
+        assert other is project
+        assert updated == UpdateState.UNCHANGED
+        assert cacheservice.is_clean(key)
+        assert not cacheservice.is_pending(key)
+    finally:
+        confservice.set('projects.cache', 'postgres_notify_dsn', '')
+
+
+@pytest.mark.with_postgres
+def test_postgres_standalone_worker():
+    """ Test that projects are checked when notifications
+        are not forwarded to the worker
+    """
+    confservice.set('projects.cache', 'postgres_notify_dsn', 'service=local')
+    try:
+        cacheservice = QgsCacheManager()
+        key = 'postgres:///?project=france_parts'
+
+        project, _ = cacheservice.lookup(key)
+        key = cacheservice.canonical_key(key)
+        assert not cacheservice.is_clean(key)
+
+        # Modified time is checked
+        cacheservice.start_validation()
+        assert cacheservice.validate(0) == 1
+        other, updated = cacheservice.lookup(key)
+        assert other is project
+        assert updated == UpdateState.UNCHANGED
+    finally:
+        confservice.set('projects.cache', 'postgres_notify_dsn', '')
+
+
 @pytest.mark.with_postgres
 def test_postgres_with_pgservice():
 
@@ -184,8 +512,8 @@ def test_preload_projects(data: Path):
 
     # Ensure  that items are in static cache
     items = list(k for k, _ in cacheservice.items(CacheType.STATIC))
-    assert "file:france_parts.qgs" in items
-    assert "project_simple.qgs" in items
+    assert cacheservice.canonical_key("file:france_parts.qgs") in items
+    assert cacheservice.canonical_key("project_simple.qgs") in items
 
     details = cacheservice.peek('file:france_parts.qgs')
     assert details is not None
@@ -197,6 +525,99 @@ def test_preload_projects(data: Path):
     assert details is None
 
 
+def test_preload_priority(tmp_path: Path):
+    """ Test that priority projects are loaded first
+    """
+    path = tmp_path / 'preloads.list'
+    path.write_text("project_simple.qgs\n! france_parts.qgs  # Load first\n")
+
+    assert read_preload_config(path) == ['france_parts.qgs', 'project_simple.qgs']
+
+
+def test_scheduled_preload(data: Path):
+    """ Test preloading projects in idle cycles
+    """
+    cacheservice = QgsCacheManager()
+
+    assert schedule_projects_file(data / 'preloads.list', cacheservice) == 2
+    assert cacheservice.num_scheduled() == 2
+
+    france_parts = cacheservice.canonical_key('file:france_parts.qgs')
+    assert cacheservice.peek(france_parts) is None
+
+    # Requested before being loaded
+    cacheservice.lookup('france_parts.qgs')
+    assert cacheservice.peek(france_parts, CacheType.STATIC) is not None
+
+    # Already loaded project is skipped
+    loaded = cacheservice.warmup(0)
+    assert [k for k, _ in loaded] == [cacheservice.canonical_key('project_simple.qgs')]
+    assert cacheservice.num_scheduled() == 0
+
+
+def test_content_fingerprint(data: Path, tmp_path: Path):
+    """ Test that fingerprints do not depend on modification time
+    """
+    path = tmp_path / 'france_parts.qgs'
+    shutil.copy(data / 'france_parts.qgs', path)
+    value = fingerprint(path)
+    os.utime(path, (0, 0))
+    assert fingerprint(path) == value
+    with path.open('a') as fp:
+        fp.write('\n')
+    assert fingerprint(path) != value
+
+    path = tmp_path / 'france_parts_qgz.qgz'
+    shutil.copy(data / 'france_parts_qgz.qgz', path)
+    value = fingerprint(path)
+    os.utime(path, (0, 0))
+    assert fingerprint(path) == value
+    with zipfile.ZipFile(path, 'a') as archive:
+        archive.writestr('other.txt', 'foo')
+    assert fingerprint(path) != value
+
+
+@pytest.mark.skipif(not lazylayers.is_supported(), reason="Requires DontResolveLayers read flag")
+def test_lazy_layers():
+    """ Test resolving layers on demand
+    """
+    confservice.set('projects.cache', 'lazy_layers', 'yes')
+    try:
+        cacheservice = QgsCacheManager()
+    finally:
+        confservice.set('projects.cache', 'lazy_layers', 'no')
+
+    project, _ = cacheservice.lookup('project_simple.qgs')
+    layers = {layer.name(): layer for layer in project.mapLayers().values()}
+    assert not any(layer.isValid() for layer in layers.values())
+
+    # Unknown layers are ignored
+    params = {'REQUEST': 'GetMap', 'LAYERS': 'points,unknown'}
+    cacheservice.resolve_layers(project, params.get)
+    assert layers['points'].isValid()
+    assert not layers['lines'].isValid()
+
+    # All layers are resolved for other requests
+    cacheservice.resolve_layers(project, {'REQUEST': 'GetCapabilities'}.get)
+    assert layers['lines'].isValid()
+
+
+def test_update_weight():
+    """ Test updating the weight of the entries of a project
+    """
+    cacheservice = QgsCacheManager()
+    project, _ = cacheservice.lookup('project_simple.qgs')
+    weight = cacheservice.weight()
+    assert weight > 0
+
+    cacheservice.update_weight(project, 1024)
+    assert cacheservice.weight() == weight + 1024
+
+    # No change if memory did not grow
+    cacheservice.update_weight(project, -1024)
+    assert cacheservice.weight() == weight + 1024
+
+
 def test_get_modified_time(data: Path):
     """ Test modified time
     """
@@ -213,3 +634,144 @@ def test_get_modified_time(data: Path):
     modified_time2 = cacheservice.get_modified_time('file:france_parts.qgs')
 
     assert modified_time2 > modified_time1
+
+
+def _cacheservice_with_copy(data: Path, tmp_path: Path, **options: str) -> QgsCacheManager:
+    """ Create a cache manager with a copy of the
+        'france_parts' project as root directory
+    """
+    shutil.copy(data / 'france_parts.qgs', tmp_path / 'france_parts.qgs')
+    (tmp_path / 'france_parts').symlink_to(data / 'france_parts')
+
+    options.update(rootdir=str(tmp_path))
+    saved = {name: confservice.get('projects.cache', name) for name in options}
+    for name, value in options.items():
+        confservice.set('projects.cache', name, value)
+    try:
+        return QgsCacheManager()
+    finally:
+        for name, value in saved.items():
+            confservice.set('projects.cache', name, value)
+
+
+def _touch_project(path: Path, content: str = ''):
+    """ Change the project file with a later modification time
+    """
+    with path.open('a') as fp:
+        fp.write(content)
+    mtime = path.stat().st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+def test_static_and_lru_entries(data: Path, tmp_path: Path):
+    """ Test that updating the static entry of a project
+        updates the LRU entry of the same project
+    """
+    cacheservice = _cacheservice_with_copy(data, tmp_path)
+    key = cacheservice.canonical_key('france_parts')
+
+    # LRU entry loaded before the static entry
+    project, _ = cacheservice.lookup('france_parts')
+    assert cacheservice.update_static_entry(key) == UpdateState.INSERTED
+    static = cacheservice.peek(key, CacheType.STATIC)
+    assert static.project is not project
+
+    _touch_project(tmp_path / 'france_parts.qgs', '\n')
+
+    assert cacheservice.update_static_entry(key) == UpdateState.UPDATED
+    assert cacheservice.peek(key, CacheType.STATIC).project is not static.project
+    assert cacheservice.peek(key, CacheType.LRU).project is not project
+
+    # Both entries are up to date
+    assert cacheservice.update_entry(key) == UpdateState.UNCHANGED
+
+
+def test_reload_pending_entries(data: Path, tmp_path: Path):
+    """ Test that pending static and LRU entries are both reloaded
+    """
+    cacheservice = _cacheservice_with_copy(data, tmp_path)
+    key = cacheservice.canonical_key('france_parts')
+
+    project, _ = cacheservice.lookup('france_parts')
+    cacheservice.update_static_entry(key)
+    static = cacheservice.peek(key, CacheType.STATIC)
+
+    _touch_project(tmp_path / 'france_parts.qgs', '\n')
+
+    cacheservice.start_validation()
+    cacheservice.validate(1.)
+    assert cacheservice.is_pending(key)
+
+    assert [(k, state) for k, state, _ in cacheservice.reload_pending(1.)] == [(key, UpdateState.UPDATED)]
+    assert cacheservice.peek(key, CacheType.STATIC).project is not static.project
+    assert cacheservice.peek(key, CacheType.LRU).project is not project
+
+
+def test_content_check_entries(data: Path, tmp_path: Path):
+    """ Test that fingerprints are checked against each loaded project
+    """
+    cacheservice = _cacheservice_with_copy(data, tmp_path, content_check='yes')
+    key = cacheservice.canonical_key('france_parts')
+    path = tmp_path / 'france_parts.qgs'
+
+    project, _ = cacheservice.lookup('france_parts')
+    cacheservice.update_static_entry(key)
+    static = cacheservice.peek(key, CacheType.STATIC)
+
+    # Modification time changed, not the content
+    _touch_project(path)
+    assert cacheservice.update_static_entry(key) == UpdateState.UNCHANGED
+    assert cacheservice.peek(key, CacheType.STATIC).project is static.project
+    assert cacheservice.peek(key, CacheType.LRU).project is project
+
+    # Content changed: both copies are reloaded
+    _touch_project(path, '\n')
+    assert cacheservice.update_static_entry(key) == UpdateState.UPDATED
+    assert cacheservice.peek(key, CacheType.STATIC).project is not static.project
+    assert cacheservice.peek(key, CacheType.LRU).project is not project
+
+
+def test_reload_pending_static_entry(data: Path, tmp_path: Path):
+    """ Test that static only entries and failed reloads
+        are reported
+    """
+    cacheservice = _cacheservice_with_copy(data, tmp_path)
+    key = cacheservice.canonical_key('france_parts')
+    path = tmp_path / 'france_parts.qgs'
+
+    cacheservice.update_static_entry(key)
+    static = cacheservice.peek(key, CacheType.STATIC)
+
+    _touch_project(path, '\n')
+    cacheservice.start_validation()
+    cacheservice.validate(1.)
+    assert cacheservice.reload_pending(1.) == [(key, UpdateState.UPDATED, static)]
+
+    # Failed reload removes the entry
+    static = cacheservice.peek(key, CacheType.STATIC)
+    path.unlink()
+    cacheservice.start_validation()
+    cacheservice.validate(1.)
+    assert cacheservice.reload_pending(1.) == [(key, None, static)]
+    assert cacheservice.peek(key) is None
+
+
+def test_evict_forget_links(data: Path, tmp_path: Path):
+    """ Test that keys are resolved again after eviction
+    """
+    cacheservice = _cacheservice_with_copy(data, tmp_path)
+    shutil.copy(tmp_path / 'france_parts.qgs', tmp_path / 'other.qgs')
+    link = tmp_path / 'link.qgs'
+    link.symlink_to(tmp_path / 'france_parts.qgs')
+
+    key = cacheservice.canonical_key('france_parts')
+    cacheservice.lookup('france_parts')
+    assert cacheservice.canonical_key('link') == key
+
+    # Memoized until eviction
+    link.unlink()
+    link.symlink_to(tmp_path / 'other.qgs')
+    assert cacheservice.canonical_key('link') == key
+
+    cacheservice.evict(key)
+    assert cacheservice.canonical_key('link') != key
@@ -0,0 +1,46 @@
+""" Test project catalog index
+"""
+import shutil
+
+from pathlib import Path
+
+from pyqgisserver.catalog import CatalogIndex, read_project_metadata
+
+
+def test_project_metadata(data: Path):
+    """ Test reading project metadata without Qgis
+    """
+    metadata = read_project_metadata(data / 'project_simple.qgs')
+    assert metadata['crs'] == 'EPSG:2154'
+    assert len(metadata['extent']) == 4
+    assert [layer['name'] for layer in metadata['layers']] == ['points', 'lines']
+
+    metadata = read_project_metadata(data / 'france_parts_qgz.qgz')
+    assert [layer['name'] for layer in metadata['layers']] == ['france_parts']
+
+
+def test_catalog_index(data: Path, tmp_path: Path):
+    """ Test incremental update of the index
+    """
+    rootdir = tmp_path / 'projects'
+    rootdir.mkdir()
+    shutil.copy(data / 'project_simple.qgs', rootdir)
+    shutil.copy(data / 'france_parts.qgs', rootdir)
+
+    index = CatalogIndex(tmp_path / 'catalog.sqlite', rootdir)
+    assert index.update() == 2
+    assert index.update() == 0
+    assert [p['name'] for p in index.projects()] == ['france_parts', 'project_simple']
+    assert index.project('project_simple')['crs'] == 'EPSG:2154'
+
+    # Project added in sub directory
+    (rootdir / 'sub').mkdir()
+    shutil.copy(data / 'france_parts.qgs', rootdir / 'sub')
+    assert index.update([rootdir / 'sub' / 'france_parts.qgs']) == 1
+    assert index.project('sub/france_parts') is not None
+
+    # Project removed
+    (rootdir / 'project_simple.qgs').unlink()
+    assert index.update([rootdir / 'project_simple.qgs']) == 1
+    assert index.project('project_simple') is None
+    assert index.count() == 2
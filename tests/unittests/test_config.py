@@ -1,6 +1,12 @@
 from pathlib import Path
 
-from pyqgisserver.config import confservice
+from pyqgisserver.config import (
+    config_to_dict,
+    confservice,
+    load_configuration,
+    read_config_dict,
+    request_deadline,
+)
 from pyqgisserver.server import read_configuration
 
 
@@ -31,3 +37,33 @@ def test_argument_precedence(rootdir: Path):
 
     # rootdir must be '/tmp/' defined in config file
     assert confservice.get('projects.cache', 'rootdir') == '/tmp/'
+
+
+def test_request_deadline():
+    """ Test that the request deadline expires before the timeout
+    """
+    timeout = confservice.get('server', 'timeout')
+    try:
+        confservice.set('server', 'timeout', '20')
+        confservice.set('server', 'request_deadline', '')
+        assert request_deadline() == 16
+        confservice.set('server', 'request_deadline', '10')
+        assert request_deadline() == 10
+    finally:
+        confservice.set('server', 'timeout', timeout)
+        confservice.set('server', 'request_deadline', '')
+
+
+def test_config_dict():
+    """ Test restoring the configuration from dictionary
+    """
+    rootdir = confservice.get('projects.cache', 'rootdir')
+    confservice.set('projects.cache', 'rootdir', '/foo/${server:port}')
+    try:
+        config = config_to_dict(raw=True)
+        load_configuration()
+        read_config_dict(config)
+        assert confservice.get('projects.cache', 'rootdir') == f"/foo/{confservice.get('server', 'port')}"
+        assert config_to_dict(raw=True) == config
+    finally:
+        confservice.set('projects.cache', 'rootdir', rootdir)
@@ -0,0 +1,75 @@
+""" Test GDSF cache
+"""
+import io
+
+from pyqgisserver.utils.cachesim import TraceEntry, compare, read_trace
+from pyqgisserver.utils.gdsf import gdsfcache
+
+
+def test_gdsf_eviction():
+    """ Test that costly items are kept
+    """
+    c = gdsfcache(2, coster=lambda v: v)
+
+    c['slow'] = 40.
+    c['fast1'] = 0.2
+    # Evict the cheapest item
+    c['fast2'] = 0.2
+    assert set(c.keys()) == {'slow', 'fast2'}
+
+    # Aging: priority of new items is raised by the
+    # priority of the evicted ones
+    assert c.priority('fast2') > 0.2
+
+
+def test_gdsf_frequency():
+    """ Test that frequently accessed items are kept
+    """
+    c = gdsfcache(2)
+
+    c['k1'] = 'foo'
+    c['k2'] = 'bar'
+    for _ in range(3):
+        _v = c['k1']
+    c['k3'] = 'baz'
+    assert set(c.keys()) == {'k1', 'k3'}
+
+
+def test_gdsf_weight():
+    """ Test weight limit
+    """
+    c = gdsfcache(10, max_weight=100, weigher=lambda v: v)
+
+    c['k1'] = 40
+    c['k2'] = 40
+    c['k3'] = 50
+    assert len(c) == 2
+    assert c.weight() <= 100
+
+    c.clear()
+    assert c.weight() == 0
+
+
+def test_cache_simulation():
+    """ Test policy comparison on trace
+    """
+    data = io.StringIO(
+        "0\tslow\t40.0\t1000\n"
+        "invalid line\n"
+        "1\tfast\t0.1\t1000\n",
+    )
+    assert list(read_trace(data)) == [
+        TraceEntry('slow', 40., 1000),
+        TraceEntry('fast', 0.1, 1000),
+    ]
+
+    # Access pattern with a costly project
+    # accessed less often than cheap ones
+    trace = []
+    for i in range(20):
+        trace.append(TraceEntry('slow', 40., 1000))
+        trace.extend(TraceEntry(f'fast{n}', 0.1, 1000) for n in range(i % 3, 3))
+
+    results = compare(trace, size=2)
+    assert results['gdsf'].requests == len(trace)
+    assert results['gdsf'].load_time < results['lru'].load_time
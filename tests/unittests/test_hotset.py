@@ -0,0 +1,36 @@
+""" Test hot set snapshot
+"""
+from pyqgisserver.qgscache.hotset import DECAY, HotSet, read_hotset, top_keys
+
+
+def test_hotset_snapshot(tmp_path):
+    """ Test saving and reading access frequencies
+    """
+    path = tmp_path / 'hotset.json'
+
+    hotset = HotSet(path, max_entries=2)
+    hotset.update({'a': 1, 'b': 5})
+    hotset.update({'a': 2, 'c': 4})
+    hotset.save()
+
+    # Only the most accessed entries are saved
+    assert read_hotset(path) == {'b': 5., 'c': 4.}
+    assert top_keys(path, 1) == ['b']
+
+    # Frequencies decay at each save
+    assert hotset.frequency('b') == 5 * DECAY
+
+    # Start from the previous snapshot
+    hotset = HotSet(path)
+    assert hotset.frequency('c') == 4.
+
+
+def test_hotset_invalid_file(tmp_path):
+    """ Test that invalid files are ignored
+    """
+    path = tmp_path / 'hotset.json'
+    assert read_hotset(path) == {}
+
+    path.write_text("not json")
+    assert read_hotset(path) == {}
+    assert top_keys(path, 10) == []
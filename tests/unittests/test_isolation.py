@@ -0,0 +1,101 @@
+""" Test isolated requests
+"""
+import os
+import pickle
+import struct
+import time
+
+from pyqgisserver import isolation
+from pyqgisserver.isolation import (
+    IsolationRule,
+    match_rules,
+    parse_rules,
+    run_isolated,
+)
+from pyqgisserver.zeromq.worker import RequestHandler
+
+
+def _params(**kwargs):
+    return lambda name: kwargs.get(name, '')
+
+
+def test_isolation_rules():
+    """ Test parsing and matching rules
+    """
+    rules = parse_rules("WMS:GetPrint, wfs:getfeature>1000")
+    assert rules == [
+        IsolationRule('WMS', 'GETPRINT', 0),
+        IsolationRule('WFS', 'GETFEATURE', 1000),
+    ]
+
+    assert match_rules(rules, _params(SERVICE='WMS', REQUEST='GetPrint'))
+    assert not match_rules(rules, _params(SERVICE='WMS', REQUEST='GetMap'))
+    # Size cannot be estimated
+    assert match_rules(rules, _params(SERVICE='WFS', REQUEST='GetFeature'))
+    assert match_rules(rules, _params(SERVICE='WFS', REQUEST='GetFeature', COUNT='5000'))
+    assert not match_rules(rules, _params(SERVICE='WFS', REQUEST='GetFeature', MAXFEATURES='10'))
+
+
+class _Handler(RequestHandler):
+
+    def __init__(self):
+        super().__init__(None, b'client', b'msgid', None)
+        self.frames = []
+
+    def _write(self, data: bytes):
+        self.frames.append(data)
+
+
+def test_isolated_request():
+    """ Test that response is relayed from the child
+    """
+    handler = _Handler()
+    parent = os.getpid()
+
+    def target():
+        assert os.getpid() != parent
+        handler.send(b"chunk1", True)
+        handler.send(b"chunk2", True)
+        handler.send(b"", False)
+
+    assert run_isolated(handler, target, cancelled=lambda: False)
+    assert len(handler.frames) == 3
+    assert pickle.loads(handler.frames[0]).data == b"chunk1"
+    assert pickle.loads(handler.frames[1])[0] == b"chunk2"
+    assert handler.header_written
+
+
+def test_isolated_request_crash():
+    """ Test that the parent reply on child crash
+    """
+    handler = _Handler()
+
+    def target():
+        os._exit(3)
+
+    assert not run_isolated(handler, target, cancelled=lambda: False)
+    assert handler.status_code == 500
+    assert len(handler.frames) == 1
+
+
+def test_isolated_request_stalled():
+    """ Test that a child stalled in the middle of a frame
+        is killed on cancellation
+    """
+    handler = _Handler()
+
+    class _Frame(struct.Struct):
+        # Announce more data than written
+        def pack(self, size, status_code):
+            return super().pack(size + 10, status_code)
+
+    def target():
+        isolation._FRAME = _Frame('!IH')
+        handler.send(b"chunk1", True)
+        time.sleep(60)
+
+    deadline = time.monotonic() + 1
+    start = time.monotonic()
+    assert not run_isolated(handler, target, cancelled=lambda: time.monotonic() > deadline)
+    assert time.monotonic() - start < 10
+    assert not handler.frames
@@ -0,0 +1,54 @@
+""" Test local mirror of project files
+"""
+import os
+
+from pyqgisserver.qgscache.mirror import LocalMirror
+
+
+def test_mirror_stage(tmp_path):
+    """ Test that project files are copied once per version
+    """
+    source = tmp_path / 'source'
+    source.mkdir()
+    project = source / 'project.qgs'
+    project.write_text("foo")
+    (source / 'project.qgd').write_text("aux")
+
+    mirror = LocalMirror(tmp_path / 'mirror', 0)
+
+    local = mirror.stage(project)
+    assert local.name == 'project.qgs'
+    assert local.read_text() == "foo"
+    assert (local.parent / 'project.qgd').exists()
+    assert mirror.stage(project) == local
+
+    # New version replaces the previous copy
+    project.write_text("foobar")
+    os.utime(project, ns=(0, 0))
+    updated = mirror.stage(project)
+    assert updated != local
+    assert updated.read_text() == "foobar"
+    assert not local.exists()
+    assert len(mirror.entries()) == 1
+
+
+def test_mirror_eviction(tmp_path):
+    """ Test that least recently used copies are removed
+    """
+    mirror = LocalMirror(tmp_path / 'mirror', 10)
+
+    projects = []
+    for name in ('a', 'b', 'c'):
+        project = tmp_path / f'{name}.qgs'
+        project.write_text("12345")
+        projects.append(project)
+
+    first = mirror.stage(projects[0])
+    os.utime(first.parent, (0, 0))
+    second = mirror.stage(projects[1])
+    assert first.exists() and second.exists()
+
+    third = mirror.stage(projects[2])
+    assert third.exists()
+    assert not first.exists()
+    assert second.exists()
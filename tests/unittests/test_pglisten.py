@@ -0,0 +1,44 @@
+import asyncio
+
+import psycopg2
+import pytest
+
+from pyqgisserver.qgscache.pglisten import (
+    Listener,
+    install_trigger,
+    uninstall_trigger,
+)
+
+DSN = 'service=local'
+CHANNEL = 'qgsrv_test_changes'
+
+
+@pytest.mark.with_postgres
+def test_project_change_notification():
+    """ Test notification of project changes
+    """
+    install_trigger(DSN, 'public', CHANNEL)
+
+    async def run():
+        received = asyncio.Queue()
+        listener = Listener(DSN, CHANNEL, received.put_nowait)
+        listener.start()
+        try:
+            # Let the listener connect
+            await asyncio.sleep(1)
+
+            conn = psycopg2.connect(DSN)
+            with conn, conn.cursor() as cursor:
+                cursor.execute("UPDATE public.qgis_projects SET metadata = metadata WHERE name = 'france_parts'")
+            conn.close()
+
+            return await asyncio.wait_for(received.get(), 5)
+        finally:
+            listener.stop()
+
+    try:
+        payload = asyncio.run(run())
+    finally:
+        uninstall_trigger(DSN, 'public')
+
+    assert payload == {'schema': 'public', 'name': 'france_parts', 'op': 'UPDATE'}
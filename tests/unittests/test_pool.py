@@ -0,0 +1,122 @@
+""" Test worker pool
+"""
+import os
+import time
+
+from pyqgisserver.zeromq.pool import Pool, respawn_time
+
+
+def _target(path):
+    with open(path, 'a') as f:
+        f.write(f"{os.getpid()} {respawn_time()}\n")
+    time.sleep(0.5)
+
+
+def test_pool_spares(tmp_path):
+    """ Test that spare workers replace exited workers
+    """
+    output = tmp_path / 'output.txt'
+    output.touch()
+
+    pool = Pool(1, _target, args=(str(output),), spares=1, start_method='fork')
+    try:
+        for _ in range(12):
+            pool.maintain_pool()
+            time.sleep(0.1)
+        pool.drain()
+        while len(pool):
+            pool.maintain_pool()
+            time.sleep(0.1)
+    finally:
+        pool.terminate()
+
+    lines = [line.split() for line in output.read_text().splitlines()]
+    assert len(lines) >= 2
+    # First worker is not a replacement
+    assert lines[0][1] == 'None'
+    # Replacements know when the previous worker exited
+    assert all(float(t) <= time.time() for _, t in lines[1:])
+
+
+def _loop(path):
+    """ Exit on pool shrinking, like the worker loop
+    """
+    from pyqgisserver.zeromq.pool import retired
+    with open(path, 'a') as f:
+        f.write(f"{os.getpid()}\n")
+    while not retired():
+        time.sleep(0.1)
+
+
+def test_pool_resize(tmp_path):
+    """ Test growing and shrinking the pool
+    """
+    output = tmp_path / 'output.txt'
+    output.touch()
+
+    def wait_for(num_workers):
+        for _ in range(50):
+            pool.maintain_pool()
+            if len(pool) == num_workers:
+                break
+            time.sleep(0.1)
+        return len(pool)
+
+    pool = Pool(1, _loop, args=(str(output),), start_method='fork')
+    try:
+        pool.resize(3)
+        assert pool.num_workers == 3
+        assert wait_for(3) == 3
+
+        # Busy workers are retired last
+        busy = [w.pid for w in pool._pool[1:]]
+        pool.resize(2, busy=busy)
+        assert pool.num_active == 2
+        assert wait_for(2) == 2
+        assert sorted(w.pid for w in pool._pool) == sorted(busy)
+
+        # Retired workers are not replaced
+        for _ in range(5):
+            pool.maintain_pool()
+            time.sleep(0.1)
+        assert len(pool) == 2
+    finally:
+        pool.terminate()
+
+    assert len(output.read_text().splitlines()) == 3
+
+
+_warmup_steps = 0
+
+
+def _warmup():
+    global _warmup_steps
+    _warmup_steps += 1
+    return _warmup_steps >= 3
+
+
+def _warmed_target(path):
+    with open(path, 'a') as f:
+        f.write(f"{_warmup_steps}\n")
+    time.sleep(0.5)
+
+
+def test_pool_spares_warmup(tmp_path):
+    """ Test that spare workers warm up before activation
+    """
+    output = tmp_path / 'output.txt'
+    output.touch()
+
+    pool = Pool(1, _warmed_target, args=(str(output),), spares=1, start_method='fork', warmup=_warmup)
+    try:
+        for _ in range(12):
+            pool.maintain_pool()
+            time.sleep(0.1)
+    finally:
+        pool.terminate()
+
+    steps = output.read_text().split()
+    assert len(steps) >= 2
+    # Only spares run the warm-up, until completed
+    assert steps[0] == '0'
+    assert all(s == '3' for s in steps[1:])
@@ -0,0 +1,35 @@
+from pyqgisserver.zeromq.worker import RecyclePolicy
+
+
+def test_recycle_disabled():
+    """ Test that default policy never recycle
+    """
+    policy = RecyclePolicy()
+    assert not policy.enabled
+    for _ in range(100):
+        assert policy.check(handled=True) is None
+
+
+def test_recycle_max_requests():
+    """ Test recycling on request count
+    """
+    policy = RecyclePolicy(max_requests=3)
+    assert policy.enabled
+
+    assert policy.check(handled=True) is None
+    # Idle cycles do not count
+    assert policy.check(handled=False) is None
+    assert policy.check(handled=True) is None
+    assert policy.check(handled=True) is not None
+    assert policy.num_requests == 3
+
+
+def test_recycle_max_age():
+    """ Test recycling on worker age
+    """
+    policy = RecyclePolicy(max_age=1)
+    policy.warmed_up()
+    assert policy.check(handled=False) is None
+
+    policy._start_time -= 2
+    assert policy.check(handled=False) is not None
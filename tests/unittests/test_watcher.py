@@ -0,0 +1,52 @@
+""" Test project files watcher
+"""
+import os
+
+from pyqgisserver.qgscache.watcher import InotifyWatcher
+
+
+def test_watcher_changes(tmp_path):
+    """ Test that changed files are notified
+    """
+    project = tmp_path / 'project.qgs'
+    project.write_text("foo")
+
+    watcher = InotifyWatcher()
+    try:
+        assert watcher.watch('project', project)
+        assert watcher.read_events() == set()
+
+        # Other files are ignored
+        (tmp_path / 'other.qgs').write_text("bar")
+        assert watcher.read_events() == set()
+        assert watcher.is_watched('project')
+
+        project.write_text("baz")
+        assert watcher.read_events() == {'project'}
+        assert not watcher.is_watched('project')
+
+        # Watch again after update
+        assert watcher.watch('project', project)
+        os.rename(project, tmp_path / 'renamed.qgs')
+        assert watcher.read_events() == {'project'}
+    finally:
+        watcher.close()
+
+
+def test_watcher_directory_removed(tmp_path):
+    """ Test that removing the directory notify files
+    """
+    directory = tmp_path / 'projects'
+    directory.mkdir()
+    project = directory / 'project.qgz'
+    project.write_text("foo")
+
+    watcher = InotifyWatcher()
+    try:
+        assert watcher.watch('project', project)
+        project.unlink()
+        directory.rmdir()
+        assert watcher.read_events() == {'project'}
+        assert not watcher.is_watched('project')
+    finally:
+        watcher.close()